@@ -0,0 +1,47 @@
+"""
+Compares two result files written by benchmarks.run.
+
+    python -m benchmarks.compare old.json new.json
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any
+
+
+def _load(path: Path) -> tuple[dict[str, Any], dict[str, dict[str, Any]]]:
+    report: dict[str, Any] = json.loads(path.read_text())
+    return report, {result["scenario"]: result for result in report["results"]}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark runs")
+    parser.add_argument("OLD", type=Path)
+    parser.add_argument("NEW", type=Path)
+    args = parser.parse_args()
+
+    old_report, old = _load(args.OLD)
+    new_report, new = _load(args.NEW)
+    print(
+        f"{'scenario':>16}  {old_report['audiotag_version']:>12}  "
+        + f"{new_report['audiotag_version']:>12}  {'speedup':>8}  {'RSS':>8}"
+    )
+    for scenario in [s for s in old if s in new]:
+        old_rate = old[scenario]["files_per_sec"]
+        new_rate = new[scenario]["files_per_sec"]
+        rss = new[scenario]["peak_rss_kb"] / old[scenario]["peak_rss_kb"]
+        print(
+            f"{scenario:>16}  {old_rate:>10.1f}/s  {new_rate:>10.1f}/s  "
+            + f"{new_rate / old_rate:>7.2f}x  {rss:>7.2f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
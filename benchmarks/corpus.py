@@ -0,0 +1,159 @@
+"""
+Generates synthetic corpora of tagged audio files for the benchmarks.
+
+Opus files are cloned from the test fixture. As there are no FLAC and MP3
+fixtures, minimal files that taglib accepts are synthesized for them.
+
+    python -m benchmarks.corpus --count 10000 --layout nested DIR
+"""
+
+from __future__ import annotations
+import argparse
+import random
+import shutil
+import struct
+import sys
+from pathlib import Path
+import taglib
+
+FORMATS = ("opus", "flac", "mp3")
+LAYOUTS = ("flat", "nested")
+
+# Shape of the nested layout: Artist/Album/Track
+TRACKS_PER_ALBUM = 12
+ALBUMS_PER_ARTIST = 5
+
+_FIXTURE_DIR = Path(__file__).resolve().parent.parent / "tests" / "testdata"
+
+
+def _flac_template() -> bytes:
+    """Returns a FLAC file that consists of nothing but a STREAMINFO block"""
+    # 20 bits sample rate, 3 bits channels - 1, 5 bits bits per sample - 1 and
+    # 36 bits total samples
+    stream = (44100 << 44) | (1 << 41) | (15 << 36)
+    streaminfo = struct.pack(">HH", 4096, 4096) + bytes(6)
+    streaminfo += stream.to_bytes(8, "big") + bytes(16)
+    header = bytes([0x80]) + len(streaminfo).to_bytes(3, "big")
+    return b"fLaC" + header + streaminfo
+
+
+def _mp3_template() -> bytes:
+    """Returns ten silent MPEG-1 Layer III frames at 128 kbit/s and 44.1 kHz"""
+    frame = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+    return frame * 10
+
+
+def make_templates(directory: Path) -> dict[str, Path]:
+    """Creates one untagged template file per format in directory"""
+    directory.mkdir(parents=True, exist_ok=True)
+    templates = {fmt: directory / f"template.{fmt}" for fmt in FORMATS}
+    shutil.copyfile(_FIXTURE_DIR / "noise.opus", templates["opus"])
+    templates["flac"].write_bytes(_flac_template())
+    templates["mp3"].write_bytes(_mp3_template())
+    for template in templates.values():
+        file = taglib.File(str(template))
+        file.tags = {}
+        file.save()
+        file.close()
+    return templates
+
+
+def _relative_path(index: int, fmt: str, layout: str) -> Path:
+    if layout == "flat":
+        return Path(f"{index:07}.{fmt}")
+    tracknumber = index % TRACKS_PER_ALBUM + 1
+    album = index // TRACKS_PER_ALBUM
+    artist = album // ALBUMS_PER_ARTIST
+    return (
+        Path(f"Artist {artist:05}")
+        / f"Album {album:06}"
+        / f"{tracknumber:02}-{index:07}.{fmt}"
+    )
+
+
+def generate(
+    root: Path,
+    count: int,
+    layout: str = "flat",
+    formats: tuple[str, ...] = ("opus",),
+    max_extra_tags: int = 10,
+    seed: int = 0,
+) -> list[Path]:
+    """
+    Creates count tagged files below root and returns their paths. Every file
+    has the common tags and a random number of additional COMMENT tags of up
+    to max_extra_tags. Titles are unique, so the files can be renamed.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout '{layout}'")
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format '{fmt}'")
+
+    rng = random.Random(seed)
+    templates = make_templates(root / ".templates")
+    paths: list[Path] = []
+    for index in range(count):
+        fmt = formats[index % len(formats)]
+        path = root / _relative_path(index, fmt, layout)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(templates[fmt], path)
+
+        tags = {
+            "ALBUM": [f"Album {index // TRACKS_PER_ALBUM}"],
+            "ALBUMARTIST": [
+                f"Artist {index // (TRACKS_PER_ALBUM * ALBUMS_PER_ARTIST)}"
+            ],
+            "ARTIST": [f"Artist {rng.randrange(1000)}", f"Guest {rng.randrange(100)}"],
+            "DATE": [str(rng.randrange(1950, 2025))],
+            "DISCNUMBER": ["1"],
+            "DISCTOTAL": ["1"],
+            "ENCODER": ["audiotag benchmark"],
+            "GENRE": ["Electronic", "Ambient"],
+            "TITLE": [f"Track {index}"],
+            "TRACKNUMBER": [str(index % TRACKS_PER_ALBUM + 1)],
+            "TRACKTOTAL": [str(TRACKS_PER_ALBUM)],
+        }
+        for extra in range(rng.randint(0, max_extra_tags)):
+            tags[f"COMMENT{extra}"] = [f"Comment {extra} of file {index}"]
+        file = taglib.File(str(path))
+        file.tags = tags
+        file.save()
+        file.close()
+        paths.append(path)
+    shutil.rmtree(root / ".templates")
+    return paths
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Generate a benchmark corpus")
+    parser.add_argument("DIR", type=Path, help="directory to create the files in")
+    parser.add_argument("-n", "--count", type=int, default=1000)
+    parser.add_argument("-l", "--layout", choices=LAYOUTS, default="flat")
+    parser.add_argument(
+        "-f",
+        "--formats",
+        default="opus",
+        help=f"comma separated list of formats out of {', '.join(FORMATS)}",
+    )
+    parser.add_argument("-t", "--max-extra-tags", type=int, default=10)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    return parser
+
+
+def main() -> int:
+    args = make_parser().parse_args()
+    paths = generate(
+        root=args.DIR,
+        count=args.count,
+        layout=args.layout,
+        formats=tuple(args.formats.split(",")),
+        max_extra_tags=args.max_extra_tags,
+        seed=args.seed,
+    )
+    print(f"Created {len(paths)} files in '{args.DIR}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+Measures the throughput and peak memory usage of audiotag on a synthetic
+corpus and writes the results to a JSON file.
+
+    python -m benchmarks.run --count 10000 --layout nested --output new.json
+
+Every scenario runs in its own process, so the peak RSS is measured per
+scenario. Scenarios that modify files run on a fresh copy of the corpus.
+The modes are started through audiotag.audiotag.main, so the same benchmark
+can be run against different versions of audiotag.
+"""
+
+from __future__ import annotations
+import argparse
+import contextlib
+import datetime
+import importlib.metadata
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+from benchmarks import corpus
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Optional
+
+# Number of passes over the properties of every opened track
+PROPERTY_PASSES = 10
+
+PROPERTIES = (
+    "album",
+    "album_artist",
+    "artist",
+    "date",
+    "discnumber",
+    "disctotal",
+    "encoder",
+    "genre",
+    "title",
+    "tracknumber",
+    "tracktotal",
+)
+
+
+def _run_cli(argv: list[str], jobs: Optional[int]) -> None:
+    from audiotag.audiotag import main
+
+    prefix = [] if jobs is None else ["--jobs", str(jobs)]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        main(prefix + argv)
+
+
+def _print(files: list[Path], jobs: Optional[int]) -> None:
+    _run_cli(["print", *map(str, files)], jobs)
+
+
+def _find(files: list[Path], jobs: Optional[int]) -> None:
+    # Without the index every file is opened, which is the worst case
+    _run_cli(
+        ["--no-cache", "find", "GENRE ~ a and DATE < 2000", *map(str, files)], jobs
+    )
+
+
+def _set(files: list[Path], jobs: Optional[int]) -> None:
+    _run_cli(["set", "--genre", "Benchmark", "--nodate", *map(str, files)], jobs)
+
+
+def _clean(files: list[Path], jobs: Optional[int]) -> None:
+    _run_cli(["clean", *map(str, files)], jobs)
+
+
+def _rename(files: list[Path], jobs: Optional[int]) -> None:
+    _run_cli(["rename", "--force", *map(str, files)], jobs)
+
+
+def _copy(files: list[Path], jobs: Optional[int]) -> None:
+    # copy works on pairs of directories, so copy every directory of the
+    # corpus onto itself
+    for directory in sorted({file.parent for file in files}):
+        _run_cli(["copy", str(directory), str(directory)], jobs)
+
+
+def _properties(files: list[Path], jobs: Optional[int]) -> None:
+    from audiotag.track import Track
+
+    for file in files:
+        track = Track(file)
+        for _ in range(PROPERTY_PASSES):
+            for name in PROPERTIES:
+                getattr(track, name)
+        track.close()
+
+
+def _format_filename(files: list[Path], jobs: Optional[int]) -> None:
+    from audiotag.track import Track
+
+    for file in files:
+        track = Track(file)
+        track.format_filename("{N} - {T}")
+        track.close()
+
+
+# Scenarios and whether they modify the files
+SCENARIOS: dict[str, tuple[Callable[[list[Path], Optional[int]], None], bool]] = {
+    "print": (_print, False),
+    "find": (_find, False),
+    "properties": (_properties, False),
+    "format_filename": (_format_filename, False),
+    "set": (_set, True),
+    "copy": (_copy, True),
+    "rename": (_rename, True),
+    "clean": (_clean, True),
+}
+
+
+def _max_rss_kb(who: int) -> int:
+    rss = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def run_child(scenario: str, file_list: Path, jobs: Optional[int]) -> dict[str, Any]:
+    """Runs a single scenario in this process and returns its measurements"""
+    files = [Path(line) for line in file_list.read_text().splitlines()]
+    func, _ = SCENARIOS[scenario]
+    start = time.perf_counter()
+    func(files, jobs)
+    seconds = time.perf_counter() - start
+    return {
+        "scenario": scenario,
+        "files": len(files),
+        "seconds": seconds,
+        "files_per_sec": len(files) / seconds if seconds else None,
+        "peak_rss_kb": _max_rss_kb(resource.RUSAGE_SELF),
+        "peak_rss_children_kb": _max_rss_kb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def run_scenario(
+    scenario: str,
+    corpus_dir: Path,
+    files: list[Path],
+    workdir: Path,
+    jobs: Optional[int],
+) -> dict[str, Any]:
+    """Runs a scenario in a new process, on a copy of the corpus if needed"""
+    _, modifies = SCENARIOS[scenario]
+    target = corpus_dir
+    if modifies:
+        target = workdir / scenario
+        shutil.rmtree(target, ignore_errors=True)
+        shutil.copytree(corpus_dir, target)
+    file_list = workdir / f"{scenario}.txt"
+    file_list.write_text(
+        "\n".join(str(target / file.relative_to(corpus_dir)) for file in files)
+    )
+    result_file = workdir / f"{scenario}.json"
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.run",
+        "--child",
+        scenario,
+        "--file-list",
+        str(file_list),
+        "--output",
+        str(result_file),
+    ]
+    if jobs is not None:
+        command += ["--jobs", str(jobs)]
+    subprocess.run(command, check=True, cwd=Path(__file__).resolve().parent.parent)
+    result: dict[str, Any] = json.loads(result_file.read_text())
+    if modifies:
+        shutil.rmtree(target)
+    return result
+
+
+def _version() -> str:
+    try:
+        return importlib.metadata.version("audiotag")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark audiotag")
+    parser.add_argument("-n", "--count", type=int, default=1000)
+    parser.add_argument("-l", "--layout", choices=corpus.LAYOUTS, default="flat")
+    parser.add_argument("-f", "--formats", default="opus,flac,mp3")
+    parser.add_argument("-t", "--max-extra-tags", type=int, default=10)
+    parser.add_argument(
+        "-s",
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"comma separated list out of {', '.join(SCENARIOS)}",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="passed on to audiotag --jobs if given"
+    )
+    parser.add_argument(
+        "-c", "--corpus", type=Path, help="use an existing corpus instead"
+    )
+    parser.add_argument("-w", "--workdir", type=Path, help="keep the corpus here")
+    parser.add_argument("-o", "--output", type=Path, default=Path("benchmark.json"))
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--file-list", type=Path, help=argparse.SUPPRESS)
+    return parser
+
+
+def main() -> int:
+    args = make_parser().parse_args()
+    if args.child:
+        result = run_child(args.child, args.file_list, args.jobs)
+        args.output.write_text(json.dumps(result))
+        return 0
+
+    scenarios = args.scenarios.split(",")
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            print(f"Unknown scenario '{scenario}'")
+            return 1
+
+    with tempfile.TemporaryDirectory(prefix="audiotag-bench-") as tmp:
+        workdir = args.workdir or Path(tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        if args.corpus:
+            corpus_dir = args.corpus
+            files = sorted(
+                path
+                for path in corpus_dir.rglob("*")
+                if path.suffix.lstrip(".") in corpus.FORMATS
+            )
+        else:
+            corpus_dir = workdir / "corpus"
+            print(f"Generating {args.count} files in '{corpus_dir}'")
+            files = corpus.generate(
+                root=corpus_dir,
+                count=args.count,
+                layout=args.layout,
+                formats=tuple(args.formats.split(",")),
+                max_extra_tags=args.max_extra_tags,
+            )
+
+        results = []
+        for scenario in scenarios:
+            result = run_scenario(scenario, corpus_dir, files, workdir, args.jobs)
+            print(
+                f"{scenario:>16}: {result['files_per_sec']:>10.1f} files/s, "
+                + f"peak RSS {result['peak_rss_kb'] / 1024:.1f} MiB"
+            )
+            results.append(result)
+
+    report = {
+        "audiotag_version": _version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "corpus": {
+            "path": str(args.corpus) if args.corpus else None,
+            "count": len(files),
+            "layout": None if args.corpus else args.layout,
+            "formats": None if args.corpus else args.formats,
+            "max_extra_tags": None if args.corpus else args.max_extra_tags,
+        },
+        "jobs": args.jobs,
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to '{args.output}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
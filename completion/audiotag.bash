@@ -5,11 +5,12 @@ _audiotag_completions()
 	COMP_WORDBREAKS=${COMP_WORDBREAKS//=}
 	local cur=${COMP_WORDS[COMP_CWORD]}
 	local lastcommand=$(_audiotag_lastcommand)
-	local commands=(print interactive set clean copy rename -v -h --version --help)
-	local rename_commands=(--pattern= --force -f)
-	local clean_commands=(--keep= -k)
-	local interactive_commands=(--compilation -c)
-	local set_commands=(--noartist --noalbumartist --notitle --noalbum --nodate\
+	local commands=(print find import interactive set clean copy rename merge serve watch --client -v -h --version --help)
+	local print_commands=(--format= --fields= --recursive -r --files-from= --null -0)
+	local rename_commands=(--pattern= --force -f --recursive -r --resume --rollback --incremental --files-from= --null -0)
+	local clean_commands=(--keep= -k --recursive -r --incremental --checkpoint= --resume --files-from= --null -0)
+	local interactive_commands=(--compilation -c --recursive -r --files-from= --null -0)
+	local set_commands=(--recursive -r --incremental --checkpoint= --resume --files-from= --null -0 --noartist --noalbumartist --notitle --noalbum --nodate\
 		--nogenre --notracknumber --notracktotal --nodiscnumber --nodisctotal\
 		--artist= --albumartist= --title= --album= --date= --genre= --tracknumber=\
 		--tracktotal= --discnumber= --disctotal=)
@@ -19,12 +20,66 @@ _audiotag_completions()
 	else
 		case ${lastcommand} in
 			print)
-				compopt -o default
-				COMPREPLY=()
+				if [[ ${cur} == -* ]]; then
+					if [[ ${cur} == --f* ]]; then
+						compopt -o nospace
+					fi
+					COMPREPLY=($(compgen -W "${print_commands[*]}" -- ${cur}))
+				else
+					compopt -o default
+					COMPREPLY=()
+				fi
+				;;
+			find)
+				if [[ ${cur} == -* ]]; then
+					if [[ ${cur} == --f* ]]; then
+						compopt -o nospace
+					fi
+					COMPREPLY=($(compgen -W "--print0 --recursive -r --files-from= --null -0" -- ${cur}))
+				else
+					compopt -o default
+					COMPREPLY=()
+				fi
+				;;
+			import)
+				if [[ ${cur} == -* ]]; then
+					COMPREPLY=($(compgen -W "--format" -- ${cur}))
+				else
+					compopt -o default
+					COMPREPLY=()
+				fi
+				;;
+			serve)
+				if [[ ${cur} == -* ]]; then
+					COMPREPLY=($(compgen -W "--socket --cache-size" -- ${cur}))
+				else
+					compopt -o default
+					COMPREPLY=()
+				fi
+				;;
+			watch)
+				if [[ ${cur} == -* ]]; then
+					COMPREPLY=($(compgen -W "--rules --settle --poll --interval" -- ${cur}))
+				else
+					compopt -o dirnames
+					COMPREPLY=()
+				fi
+				;;
+			merge)
+				if [[ ${cur} == -* ]]; then
+					COMPREPLY=($(compgen -W "--output -o" -- ${cur}))
+				else
+					compopt -o default
+					COMPREPLY=()
+				fi
 				;;
 			copy)
-				compopt -o dirnames
-				COMPREPLY=()
+				if [[ ${cur} == -* ]]; then
+					COMPREPLY=($(compgen -W "--recursive -r" -- ${cur}))
+				else
+					compopt -o dirnames
+					COMPREPLY=()
+				fi
 				;;
       clean)
 				if [[ ${cur} == -* ]]; then
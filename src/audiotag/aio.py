@@ -0,0 +1,372 @@
+"""
+asyncio interface for programs that use audiotag from a running event loop.
+
+    from audiotag import aio
+
+    async def main():
+        tags = await aio.read_tags("a.flac")
+        async with aio.opened("b.flac") as track:
+            track.title = "New"
+            await aio.save(track)
+        await aio.apply_all(["a.flac", "b.flac"], aio.TagPlan(...))
+
+taglib blocks, so all work on the files runs on an executor, which defaults to
+a pool of threads, and at most limit jobs of a runner run at the same time.
+Cancelling a coroutine cancels its job if it has not started yet. A job that
+is already running can not be interrupted, so it finishes in the background
+and a file it opened is closed again. Changes reach the disk when a file is
+closed, as taglib only flushes them on close.
+"""
+
+from __future__ import annotations
+import asyncio
+import atexit
+import concurrent.futures
+import contextlib
+import functools
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, TypeVar
+import weakref
+from audiotag.track import Tag, TagListInvalidException, TagPlan, Track
+
+if TYPE_CHECKING:
+    from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional
+
+    StrPath = str | os.PathLike[str]
+
+__all__ = [
+    "LIMIT",
+    "Runner",
+    "Tag",
+    "TagListInvalidException",
+    "TagPlan",
+    "Track",
+    "apply",
+    "apply_all",
+    "clean",
+    "clean_all",
+    "close",
+    "configure",
+    "default_runner",
+    "open_track",
+    "opened",
+    "read_all",
+    "read_tags",
+    "save",
+]
+
+T = TypeVar("T")
+
+# Default maximum number of jobs of a runner that run at the same time
+LIMIT = 8
+
+
+class Runner:
+    """
+    Runs blocking jobs on an executor, at most limit of them at the same
+    time. Without an executor the runner starts its own pool of limit threads,
+    which is shut down by close. Tracks can not be sent to other processes,
+    so open_track, save and close need an executor that runs jobs in threads.
+    """
+
+    limit: int
+    _executor: Optional[concurrent.futures.Executor]
+    _owns_executor: bool
+    _semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]
+
+    def __init__(
+        self,
+        executor: Optional[concurrent.futures.Executor] = None,
+        limit: int = LIMIT,
+    ):
+        if limit < 1:
+            raise ValueError(f"Limit must be positive, got {limit}")
+        self.limit = limit
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def __repr__(self) -> str:
+        return f"Runner(executor={self._executor!r}, limit={self.limit})"
+
+    @property
+    def executor(self) -> concurrent.futures.Executor:
+        """The executor the jobs run on. The own pool is started on first use."""
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.limit, thread_name_prefix="audiotag"
+            )
+        return self._executor
+
+    def _semaphore(self, loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+        # A semaphore belongs to one event loop, so every loop gets its own
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.limit)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def run(
+        self,
+        func: Callable[..., T],
+        *args: object,
+        cleanup: Optional[Callable[[T], object]] = None,
+        cancellable: bool = True,
+    ) -> T:
+        """
+        Runs func with args on the executor and returns its result. If the
+        caller is cancelled, the job is cancelled as well unless it has already
+        started or cancellable is not set. cleanup is applied to the result
+        of a job whose caller was cancelled, so that no resources are leaked.
+        The job counts against the limit until it is actually done.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore(loop)
+        await semaphore.acquire()
+        waiter: asyncio.Future[T] = loop.create_future()
+        try:
+            job = self.executor.submit(func, *args)
+        except BaseException:
+            semaphore.release()
+            raise
+        job.add_done_callback(
+            functools.partial(self._job_done, loop, semaphore, waiter, cleanup)
+        )
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if cancellable:
+                job.cancel()
+            # The task may be cancelled after the job finished but before the
+            # task got its result
+            if (
+                cleanup is not None
+                and waiter.done()
+                and not waiter.cancelled()
+                and waiter.exception() is None
+            ):
+                self._cleanup(cleanup, waiter.result())
+            raise
+
+    def _job_done(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        semaphore: asyncio.Semaphore,
+        waiter: asyncio.Future[T],
+        cleanup: Optional[Callable[[T], object]],
+        job: concurrent.futures.Future[T],
+    ) -> None:
+        """Hands the outcome of a job to the event loop. Runs in the worker."""
+        try:
+            loop.call_soon_threadsafe(self._finish, semaphore, waiter, cleanup, job)
+        except RuntimeError:
+            # The loop is closed, so nobody is waiting for the result
+            if cleanup is not None and _succeeded(job):
+                cleanup(job.result())
+
+    def _finish(
+        self,
+        semaphore: asyncio.Semaphore,
+        waiter: asyncio.Future[T],
+        cleanup: Optional[Callable[[T], object]],
+        job: concurrent.futures.Future[T],
+    ) -> None:
+        semaphore.release()
+        if waiter.cancelled():
+            if cleanup is not None and _succeeded(job):
+                self._cleanup(cleanup, job.result())
+        elif job.cancelled():
+            waiter.cancel()
+        elif job.exception() is not None:
+            waiter.set_exception(job.exception())  # type: ignore[arg-type]
+        else:
+            waiter.set_result(job.result())
+
+    def _cleanup(self, cleanup: Callable[[T], object], result: T) -> None:
+        """Runs cleanup on the executor without waiting for it"""
+        try:
+            self.executor.submit(cleanup, result)
+        except RuntimeError:
+            # The executor is shut down
+            cleanup(result)
+
+    def close(self) -> None:
+        """Shuts down the own pool after its jobs are done"""
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def _succeeded(job: concurrent.futures.Future[T]) -> bool:
+    return not job.cancelled() and job.exception() is None
+
+
+_default_runner: Optional[Runner] = None
+
+
+def configure(
+    executor: Optional[concurrent.futures.Executor] = None, limit: int = LIMIT
+) -> Runner:
+    """
+    Replaces the runner that is used if no runner is given and returns it.
+    The pool of the former runner is shut down.
+    """
+    global _default_runner
+    runner = Runner(executor, limit)
+    if _default_runner is not None:
+        _default_runner.close()
+    else:
+        atexit.register(_close_default)
+    _default_runner = runner
+    return runner
+
+
+def _close_default() -> None:
+    if _default_runner is not None:
+        _default_runner.close()
+
+
+def default_runner() -> Runner:
+    """Returns the runner that is used if no runner is given"""
+    if _default_runner is None:
+        return configure()
+    return _default_runner
+
+
+def _read_tags(path: StrPath) -> dict[str, list[str]]:
+    with Track(Path(path)) as track:
+        return {name: list(values) for name, values in track.tags.items()}
+
+
+def _change(func: Callable[[Track], object], path: StrPath) -> bool:
+    with Track(Path(path)) as track:
+        func(track)
+        return track.save()
+
+
+async def open_track(path: StrPath, runner: Optional[Runner] = None) -> Track:
+    """
+    Opens the file at path. The caller has to close the track, preferably
+    with close or by using opened instead. Raises OSError if the file can not
+    be opened.
+    """
+    runner = default_runner() if runner is None else runner
+    return await runner.run(Track, Path(path), cleanup=Track.close)
+
+
+async def save(track: Track, runner: Optional[Runner] = None) -> bool:
+    """
+    Writes the tags of track if they have been modified and returns whether
+    the file was written. The changes reach the disk when the track is closed.
+    """
+    runner = default_runner() if runner is None else runner
+    return await runner.run(track.save)
+
+
+async def close(track: Track, runner: Optional[Runner] = None) -> None:
+    """Closes track. The track is closed even if the caller is cancelled."""
+    runner = default_runner() if runner is None else runner
+    await runner.run(track.close, cancellable=False)
+
+
+@contextlib.asynccontextmanager
+async def opened(
+    path: StrPath, runner: Optional[Runner] = None
+) -> AsyncIterator[Track]:
+    """Opens the file at path and closes it at the end of the block"""
+    track = await open_track(path, runner)
+    try:
+        yield track
+    finally:
+        await close(track, runner)
+
+
+async def read_tags(
+    path: StrPath, runner: Optional[Runner] = None
+) -> dict[str, list[str]]:
+    """Returns a copy of all tags of the file at path"""
+    runner = default_runner() if runner is None else runner
+    return await runner.run(_read_tags, path)
+
+
+async def apply(path: StrPath, plan: TagPlan, runner: Optional[Runner] = None) -> bool:
+    """
+    Applies the changes of plan to the file at path and returns whether it
+    was written
+    """
+    runner = default_runner() if runner is None else runner
+    return await runner.run(_change, plan.apply, path)
+
+
+async def clean(
+    path: StrPath, keep: Optional[set[Tag]] = None, runner: Optional[Runner] = None
+) -> bool:
+    """
+    Removes all tags but the ones in keep, which defaults to ENCODER, from the
+    file at path and returns whether it was written
+    """
+    runner = default_runner() if runner is None else runner
+    clear_tags = functools.partial(Track.clear_tags, keep=keep)
+    return await runner.run(_change, clear_tags, path)
+
+
+async def _gather(
+    awaitables: Iterable[Awaitable[T]], return_exceptions: bool
+) -> list[T | BaseException]:
+    """
+    Like asyncio.gather, but if one of the awaitables fails or the caller is
+    cancelled, the others are cancelled and waited for before returning
+    """
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def read_all(
+    paths: Iterable[StrPath],
+    runner: Optional[Runner] = None,
+    return_exceptions: bool = False,
+) -> list[dict[str, list[str]] | BaseException]:
+    """
+    Returns a copy of all tags of every file in the order of paths. With
+    return_exceptions the error of a file is returned in its place, otherwise
+    the first error is raised and the other files are left alone.
+    """
+    return await _gather((read_tags(path, runner) for path in paths), return_exceptions)
+
+
+async def apply_all(
+    paths: Iterable[StrPath],
+    plan: TagPlan,
+    runner: Optional[Runner] = None,
+    return_exceptions: bool = False,
+) -> list[bool | BaseException]:
+    """
+    Applies the changes of plan to every file and returns whether each file
+    was written in the order of paths. Errors are handled like by read_all.
+    """
+    return await _gather(
+        (apply(path, plan, runner) for path in paths), return_exceptions
+    )
+
+
+async def clean_all(
+    paths: Iterable[StrPath],
+    keep: Optional[set[Tag]] = None,
+    runner: Optional[Runner] = None,
+    return_exceptions: bool = False,
+) -> list[bool | BaseException]:
+    """
+    Removes all tags but the ones in keep from every file and returns whether
+    each file was written in the order of paths. Errors are handled like by
+    read_all.
+    """
+    return await _gather(
+        (clean(path, keep, runner) for path in paths), return_exceptions
+    )
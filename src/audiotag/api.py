@@ -0,0 +1,184 @@
+"""
+Library interface for programs that use audiotag instead of its command line.
+
+    from audiotag import api
+
+    for path, tags in api.read_tags(["a.flac", "b.flac"]):
+        print(path, tags.get("TITLE"))
+    api.apply(["a.flac"], api.TagPlan(set_tags={api.Tag.GENRE: "Jazz"}))
+    api.clean(["b.flac"], keep={api.Tag.ENCODER})
+
+All functions share a pool of open files, so files that are used again are
+not opened again and the number of open files stays bounded in long running
+programs. The pool is closed when the interpreter exits. Files that can not
+be opened raise OSError and invalid values raise ValueError or
+TagListInvalidException like Track does.
+"""
+
+from __future__ import annotations
+import atexit
+from collections import OrderedDict
+import functools
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING
+from audiotag.track import Tag, TagListInvalidException, TagPlan, Track
+
+if TYPE_CHECKING:
+    from typing import Callable, Iterable, Iterator, Optional
+
+    StrPath = str | os.PathLike[str]
+
+__all__ = [
+    "POOL_SIZE",
+    "HandlePool",
+    "Tag",
+    "TagListInvalidException",
+    "TagPlan",
+    "Track",
+    "apply",
+    "clean",
+    "default_pool",
+    "read_tags",
+]
+
+# Default maximum number of files the pool keeps open
+POOL_SIZE = 64
+
+
+class HandlePool:
+    """
+    Least recently used open files, at most size of them. Files are closed
+    when they are evicted from the pool, when they are written, as taglib
+    only flushes them on close, and when the pool is closed. A file that was
+    changed on disk since it was opened is opened again.
+    A pool must not be used by several threads at the same time.
+    """
+
+    size: int
+    _tracks: OrderedDict[str, tuple[tuple[int, int, int], Track]]
+
+    def __init__(self, size: int = POOL_SIZE):
+        if size < 1:
+            raise ValueError(f"Size of the pool must be positive, got {size}")
+        self.size = size
+        self._tracks = OrderedDict()
+
+    def __repr__(self) -> str:
+        return f"HandlePool(size={self.size})"
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+    def __enter__(self) -> HandlePool:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def get(self, path: StrPath) -> Track:
+        """
+        Returns the open file at path and opens it if it is not in the pool.
+        The track belongs to the pool and must not be closed by the caller.
+        Raises OSError if the file can not be opened.
+        """
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        version = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        entry = self._tracks.get(key)
+        if entry is not None:
+            if entry[0] == version:
+                self._tracks.move_to_end(key)
+                return entry[1]
+            self.release(key)
+        track = Track(Path(path))
+        self._tracks[key] = (version, track)
+        while len(self._tracks) > self.size:
+            _, (_, evicted) = self._tracks.popitem(last=False)
+            evicted.close()
+        return track
+
+    def release(self, path: StrPath) -> None:
+        """Closes the file at path if it is in the pool"""
+        entry = self._tracks.pop(os.path.abspath(path), None)
+        if entry is not None:
+            entry[1].close()
+
+    def change(self, path: StrPath, func: Callable[[Track], object]) -> bool:
+        """
+        Applies func to the file at path, writes the tags if they have been
+        modified and returns whether the file was written. Written files are
+        closed, so that the changes reach the disk. If func raises, the file
+        is closed without writing it, so no partial change stays in the pool.
+        """
+        track = self.get(path)
+        try:
+            func(track)
+            written = track.save()
+        except BaseException:
+            self.release(path)
+            raise
+        if written:
+            self.release(path)
+        return written
+
+    def close(self) -> None:
+        """Closes all files of the pool"""
+        while self._tracks:
+            _, (_, track) = self._tracks.popitem()
+            track.close()
+
+
+_default_pool: Optional[HandlePool] = None
+
+
+def default_pool() -> HandlePool:
+    """Returns the pool that is used if no pool is given"""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = HandlePool()
+        atexit.register(_default_pool.close)
+    return _default_pool
+
+
+def _pool(pool: Optional[HandlePool]) -> HandlePool:
+    # An empty pool is false, so it is compared with None
+    return default_pool() if pool is None else pool
+
+
+def read_tags(
+    paths: Iterable[StrPath], pool: Optional[HandlePool] = None
+) -> Iterator[tuple[Path, dict[str, list[str]]]]:
+    """
+    Lazily yields the path and a copy of all tags of every file in the order
+    of paths
+    """
+    pool = _pool(pool)
+    for path in paths:
+        tags = pool.get(path).tags
+        yield Path(path), {name: list(values) for name, values in tags.items()}
+
+
+def apply(
+    paths: Iterable[StrPath], plan: TagPlan, pool: Optional[HandlePool] = None
+) -> list[bool]:
+    """
+    Applies the changes of plan to every file and returns whether each file
+    was written in the order of paths
+    """
+    pool = _pool(pool)
+    return [pool.change(path, plan.apply) for path in paths]
+
+
+def clean(
+    paths: Iterable[StrPath],
+    keep: Optional[set[Tag]] = None,
+    pool: Optional[HandlePool] = None,
+) -> list[bool]:
+    """
+    Removes all tags but the ones in keep, which defaults to ENCODER, from
+    every file and returns whether each file was written in the order of paths
+    """
+    pool = _pool(pool)
+    clear_tags = functools.partial(Track.clear_tags, keep=keep)
+    return [pool.change(path, clear_tags) for path in paths]
@@ -1,30 +1,52 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
 import argparse
-import importlib.metadata
+import itertools
+import os
+import sys
 from enum import Enum
+from pathlib import Path
+from audiotag import cache, config, records
 from audiotag.track import Tag
+from audiotag.batch import Batch, default_jobs
+from audiotag.shard import Shard
+from audiotag.util import POLL_INTERVAL, SETTLE_TIME, read_file_list
 from audiotag.modes import (
+    find_mode,
     print_mode,
     set_mode,
     clean_mode,
     rename_mode,
+    rename_journal_mode,
     copy_mode,
+    import_mode,
     interactive_mode,
+    merge_mode,
+    serve_mode,
+    watch_mode,
 )
 
 if TYPE_CHECKING:
-    from typing import Optional, Sequence, Any
+    from typing import Iterable, Optional, Sequence, Any
+
+# Exit status if files failed with --keep-going, which sets apart runs that
+# did most of the work from runs that did not start at all
+EXIT_FAILURES = 3
 
 
 class Mode(Enum):
     value: str
     CLEAN = "clean"
     COPY = "copy"
+    FIND = "find"
+    IMPORT = "import"
     INTERACTIVE = "interactive"
+    MERGE = "merge"
     PRINT = "print"
     RENAME = "rename"
+    SERVE = "serve"
     SET = "set"
+    WATCH = "watch"
 
 
 def positive_int(string: str) -> int:
@@ -39,6 +61,25 @@ def positive_int(string: str) -> int:
     return number
 
 
+def positive_float(string: str) -> float:
+    try:
+        number = float(string)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected number, got {string!r}")
+
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"expected positive number, got {number}")
+
+    return number
+
+
+def shard(string: str) -> tuple[int, int]:
+    try:
+        return Shard.parse(string)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
 class UpdateDict(argparse.Action):
     def __call__(
         self,
@@ -56,14 +97,101 @@ class UpdateDict(argparse.Action):
         thedict.update({Tag[self.dest.upper()]: values})
 
 
+class LazyVersion(argparse.Action):
+    """
+    Prints the version and exits like the "version" action, but only looks
+    the version up when the option is given, as importlib.metadata is slow
+    to import
+    """
+
+    def __init__(self, option_strings: Sequence[str], dest: str, **kwargs: Any):
+        super().__init__(
+            option_strings,
+            dest=argparse.SUPPRESS,
+            default=argparse.SUPPRESS,
+            nargs=0,
+            help="show program's version number and exit",
+        )
+
+    def __call__(
+        self,
+        parser: argparse.ArgumentParser,
+        namespace: argparse.Namespace,
+        values: str | Sequence[Any] | None,
+        option_string: Optional[str] = None,
+    ):
+        import importlib.metadata
+
+        parser.exit(message=f"{parser.prog} {importlib.metadata.version('audiotag')}\n")
+
+
 def make_parser() -> argparse.ArgumentParser:
     """Creates a parser for the audiotag command line interface"""
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "-v",
         "--version",
-        action="version",
-        version=f"%(prog)s {importlib.metadata.version('audiotag')}",
+        action=LazyVersion,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=positive_int,
+        default=default_jobs(),
+        help="number of files to process in parallel. Defaults to the number of CPUs",
+    )
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument(
+        "--cache",
+        nargs="?",
+        const=True,
+        type=Path,
+        metavar="FILE",
+        help="read tags from and write them to a cache of unchanged files. "
+        + "Defaults to the cache_file of the config file",
+    )
+    cache_group.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        default=None,
+        help="do not use the tag cache even if it is enabled in the config file",
+    )
+    parser.add_argument(
+        "--keep-going",
+        action="store_true",
+        help="skip files that can not be processed instead of stopping and exit "
+        + f"with status {EXIT_FAILURES} if any file failed",
+    )
+    parser.add_argument(
+        "--error-report",
+        type=Path,
+        metavar="FILE",
+        help="write the files that failed with --keep-going to FILE as JSON Lines. "
+        + "FILE can be read with --files-from to retry them",
+    )
+    parser.add_argument(
+        "--shard",
+        type=shard,
+        metavar="K/N",
+        help="only process the files of shard K of N. Files are assigned to "
+        + "shards by a hash of their path relative to --shard-root",
+    )
+    parser.add_argument(
+        "--shard-root",
+        type=Path,
+        metavar="DIR",
+        help="directory that paths are relative to for --shard. "
+        + "Defaults to the current directory",
+    )
+    parser.add_argument(
+        "--client",
+        nargs="?",
+        const="",
+        metavar="SOCKET",
+        help="run the command on the server started with 'serve' if it is running. "
+        + "Must be the first argument and is given as --client=SOCKET "
+        + "to use another socket than the server_socket of the config file",
     )
     sub_commands = parser.add_subparsers(dest="command")
     sub_commands.required = True
@@ -82,12 +210,127 @@ def make_parser() -> argparse.ArgumentParser:
         name=Mode.COPY.value,
         help="copy the tags from files in one folder to those in another folder",
     )
+    find_parser = sub_commands.add_parser(
+        name=Mode.FIND.value,
+        formatter_class=argparse.RawTextHelpFormatter,
+        help="print the files whose tags match a query",
+    )
+    find_parser.add_argument(
+        "QUERY",
+        help="""Query of tags like 'GENRE ~ jazz and DATE < 1970'
+A tag on its own matches files that have it.
+Tags are compared with
+    =, !=         equal or not equal to a value
+    <, <=, >, >=  ranges of integer tags like DATE
+    ~             contains the text, ignoring case
+    =~            matches the regular expression
+Comparisons are combined with and, or, not and ( ).
+Values with spaces or operators are quoted""",
+    )
+    find_parser.add_argument(
+        "--print0",
+        action="store_true",
+        help="separate the files by NUL characters instead of newlines",
+    )
+    import_parser = sub_commands.add_parser(
+        name=Mode.IMPORT.value,
+        help="set the tags of many files from a manifest in JSON Lines, CSV or TSV",
+    )
+    import_parser.add_argument(
+        "MANIFEST",
+        help="file with one record per file. Records have a 'path' field "
+        + "and fields named like tags",
+    )
+    import_parser.add_argument(
+        "--format",
+        choices=records.FORMATS,
+        help="format of MANIFEST. Defaults to the format of its extension",
+    )
+    merge_parser = sub_commands.add_parser(
+        name=Mode.MERGE.value,
+        help="merge the reports of the shards of a run into one sorted by path",
+    )
+    merge_parser.add_argument(
+        "REPORT", nargs="+", help="files of records in JSON Lines, CSV or TSV"
+    )
+    merge_parser.add_argument(
+        "-o",
+        "--output",
+        metavar="FILE",
+        help="write the merged records to FILE in the format of its extension "
+        + "instead of to stdout as JSON Lines",
+    )
+    serve_parser = sub_commands.add_parser(
+        name=Mode.SERVE.value,
+        help="run the commands of clients started with --client on a Unix socket",
+    )
+    serve_parser.add_argument(
+        "--socket",
+        type=Path,
+        help="listen on SOCKET. Defaults to the server_socket of the config file",
+    )
+    serve_parser.add_argument(
+        "--cache-size",
+        type=positive_int,
+        default=cache.CACHE_SIZE,
+        metavar="N",
+        help="keep the tags of the N most recently used files in memory. "
+        + f"Defaults to {cache.CACHE_SIZE}",
+    )
+    watch_parser = sub_commands.add_parser(
+        name=Mode.WATCH.value,
+        help="apply rules to audio files as they are written or moved into a directory",
+    )
+    watch_parser.add_argument(
+        "DIR", help="directory to watch with all its subdirectories"
+    )
+    watch_parser.add_argument(
+        "--rules",
+        required=True,
+        metavar="FILE",
+        help="INI file with [clean], [set] and [rename] sections, "
+        + "which are applied in this order",
+    )
+    watch_parser.add_argument(
+        "--settle",
+        type=positive_float,
+        default=SETTLE_TIME,
+        metavar="SECONDS",
+        help="only process files that have not changed for SECONDS, "
+        + f"so that files are not touched while they are copied. Defaults to {SETTLE_TIME:g}",
+    )
+    watch_parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="scan the directory instead of using inotify, e.g. for network file systems",
+    )
+    watch_parser.add_argument(
+        "--interval",
+        type=positive_float,
+        default=POLL_INTERVAL,
+        metavar="SECONDS",
+        help="seconds between two scans if inotify is not used. "
+        + f"Defaults to {POLL_INTERVAL:g}",
+    )
     interactive_parser = sub_commands.add_parser(
         name=Mode.INTERACTIVE.value,
         help="tag a single album interactively. "
         + "Treats files in subdirectories as different discs.",
     )
     print_parser = sub_commands.add_parser(name=Mode.PRINT.value, help="print all tags")
+    print_parser.add_argument(
+        "--format",
+        choices=["text", *records.FORMATS],
+        default="text",
+        help="print one record per file in JSON Lines, CSV or TSV "
+        + "instead of text. Defaults to 'text'",
+    )
+    print_parser.add_argument(
+        "--fields",
+        help="comma separated list of fields to print with --format, "
+        + f"e.g. '{records.PATH_FIELD},ARTIST,TITLE'. Without it JSON Lines "
+        + "records have all tags and CSV and TSV have the common tags",
+    )
     rename_parser = sub_commands.add_parser(
         name=Mode.RENAME.value,
         formatter_class=argparse.RawTextHelpFormatter,
@@ -131,6 +374,17 @@ def make_parser() -> argparse.ArgumentParser:
             const=tag,
         )
 
+    journal_group = rename_parser.add_mutually_exclusive_group()
+    journal_group.add_argument(
+        "--resume",
+        action="store_true",
+        help="finish an interrupted rename using its journal",
+    )
+    journal_group.add_argument(
+        "--rollback",
+        action="store_true",
+        help="revert an interrupted rename using its journal",
+    )
     rename_parser.add_argument(
         "-f",
         "--force",
@@ -152,6 +406,10 @@ May contain the following tags
     {D}   Discnumber
     {NT}  Tracktotal
     {DT}  Disctotal
+Placeholders may have a format spec like {N:03}
+and filters like {A|lower}. Available filters are
+    lower, upper, title, ascii, strip
+A '/' moves files into directories like {A}/{L}/{T}
 Defaults to '{N} - {T}' or '{D}-{N} - {T}' (if {D} > 1)""",
     )
 
@@ -163,6 +421,36 @@ Defaults to '{N} - {T}' or '{D}-{N} - {T}' (if {D} > 1)""",
     copy_parser.add_argument(
         "DEST", action="store", help="Save tags to this file or files in this directory"
     )
+    copy_parser.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="copy between the audio files of two directory trees that have "
+        + "the same relative path apart from the extension",
+    )
+
+    for subparser in {clean_parser, rename_parser, set_parser}:
+        subparser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="only open files that are new or changed since the last "
+            + "incremental run with the same options",
+        )
+
+    for subparser in {clean_parser, set_parser}:
+        subparser.add_argument(
+            "--checkpoint",
+            type=Path,
+            metavar="FILE",
+            help="log the files that are done to FILE, which is removed once "
+            + "all files are done",
+        )
+        subparser.add_argument(
+            "--resume",
+            action="store_true",
+            help="leave out the files logged to the --checkpoint FILE by an "
+            + "interrupted run",
+        )
 
     interactive_parser.add_argument(
         "-c",
@@ -173,42 +461,217 @@ Defaults to '{N} - {T}' or '{D}-{N} - {T}' (if {D} > 1)""",
 
     for subparser in {
         clean_parser,
+        find_parser,
         interactive_parser,
         print_parser,
         rename_parser,
         set_parser,
     }:
-        subparser.add_argument("FILE", nargs="+", help="List of files to tag")
+        # FILE is checked in main, as files can also be read with --files-from
+        subparser.add_argument("FILE", nargs="*", help="List of files to tag")
+        subparser.add_argument(
+            "--files-from",
+            metavar="PATH",
+            help="also read the list of files from PATH or from stdin if PATH is '-'",
+        )
+        subparser.add_argument(
+            "-0",
+            "--null",
+            action="store_true",
+            help="files read with --files-from are separated by NUL characters "
+            + "instead of newlines, like the output of 'find -print0'",
+        )
+        subparser.add_argument(
+            "-r",
+            "--recursive",
+            action="store_true",
+            help="replace directories in FILE by all audio files they contain",
+        )
 
     return parser
 
 
+def files_of(parser: argparse.ArgumentParser, args: dict[str, Any]) -> Iterable[str]:
+    """
+    Returns the files given as FILE followed by the files read lazily with
+    --files-from. Exits with a usage error if no files are given.
+    """
+    files: list[str] = args["FILE"]
+    files_from: Optional[str] = args["files_from"]
+    if files_from is None:
+        if args["null"]:
+            parser.error("argument -0/--null: requires --files-from")
+        if not files:
+            parser.error("the following arguments are required: FILE or --files-from")
+        return files
+    if files_from == "-" and args["command"] == Mode.INTERACTIVE.value:
+        parser.error("interactive reads the tags from stdin, so it can not read FILE")
+    if files_from == "-" and args["command"] == Mode.RENAME.value and not args["force"]:
+        parser.error("rename asks before overwriting files, so use --force with '-'")
+    if files_from != "-" and not os.path.exists(files_from):
+        parser.error(f"argument --files-from: '{files_from}' does not exist")
+    # Reports of failed files are records, which are read by their path field
+    if files_from != "-" and records.is_jsonl(Path(files_from)):
+        if args["null"]:
+            parser.error("argument -0/--null: not allowed with a JSON Lines file")
+        return itertools.chain(files, records.read_paths(Path(files_from)))
+    return itertools.chain(files, read_file_list(files_from, null=args["null"]))
+
+
+def checkpoint_of(
+    parser: argparse.ArgumentParser, args: dict[str, Any]
+) -> Optional[Path]:
+    """Returns the --checkpoint FILE and exits with a usage error if it is missing"""
+    checkpoint: Optional[Path] = args["checkpoint"]
+    if args["resume"] and checkpoint is None:
+        parser.error("argument --resume: requires --checkpoint")
+    return checkpoint
+
+
+def write_report(batch: Batch, report: Optional[Path]) -> None:
+    """Prints the number of failed files and writes them to report if given"""
+    print(
+        f"{len(batch.failures)} file{'s' if len(batch.failures) != 1 else ''} failed"
+        + (f", see '{str(report)}'" if report is not None else "")
+    )
+    if report is not None:
+        with open(report, "w") as stream:
+            records.write_records(
+                (failure.record() for failure in batch.failures), "jsonl", stream
+            )
+
+
 def main(argv: Optional[Sequence[str]] = None) -> int:
     """The main function. Starts whatever mode the user specified."""
 
-    args = vars(make_parser().parse_args(argv))
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0].partition("=")[0] == "--client":
+        from audiotag.server import client_main
+
+        return client_main(argv)
+    parser = make_parser()
+    args = vars(parser.parse_args(argv))
+    if args["client"] is not None:
+        parser.error("argument --client: must be the first argument")
+    return execute(parser, args)
+
+
+def execute(parser: argparse.ArgumentParser, args: dict[str, Any]) -> int:
+    """Runs a command given by the parsed arguments and reports failed files"""
+    if args["error_report"] is not None and not args["keep_going"]:
+        parser.error("argument --error-report: requires --keep-going")
+    if args["shard_root"] is not None and args["shard"] is None:
+        parser.error("argument --shard-root: requires --shard")
+    selected: Optional[Shard] = None
+    if args["shard"] is not None:
+        index, count = args["shard"]
+        selected = Shard(index, count, root=args["shard_root"])
+    batch = Batch(jobs=args["jobs"], keep_going=args["keep_going"], shard=selected)
+    report: Optional[Path] = args["error_report"]
+    if report is not None and batch.shard is not None:
+        report = batch.shard.report_path(report)
+    status = run(parser, args, batch)
+    if batch.keep_going and batch.failures:
+        write_report(batch, report)
+        return status or EXIT_FAILURES
+    if report is not None:
+        # An empty report tells a retry loop that nothing is left to do
+        report.write_text("")
+    return status
+
+
+def run(parser: argparse.ArgumentParser, args: dict[str, Any], batch: Batch) -> int:
+    """Runs the mode given by the parsed arguments"""
     command = args["command"]
+    if args["cache"] is None:
+        # find keeps its index in the tag cache, so repeated queries do not
+        # open unchanged files again
+        index = config.tag_cache or command == Mode.FIND.value
+        cache.enable(config.cache_file if index else None)
+    elif args["cache"] is True:
+        cache.enable(config.cache_file)
+    else:
+        cache.enable(args["cache"] or None)
     if command == Mode.PRINT.value:
-        return print_mode(args["FILE"])
+        return print_mode(
+            files_of(parser, args),
+            batch=batch,
+            recursive=args["recursive"],
+            output_format=args["format"],
+            fields=args["fields"],
+        )
+    elif command == Mode.FIND.value:
+        return find_mode(
+            files_of(parser, args),
+            query=args["QUERY"],
+            batch=batch,
+            recursive=args["recursive"],
+            print0=args["print0"],
+        )
     elif command == Mode.SET.value:
         return set_mode(
             remove_tags=set(args["remove_tags"]),
             set_tags=args["set_tags"],
-            files=args["FILE"],
+            files=files_of(parser, args),
+            batch=batch,
+            recursive=args["recursive"],
+            incremental=args["incremental"],
+            checkpoint=checkpoint_of(parser, args),
+            resume=args["resume"],
         )
     elif command == Mode.CLEAN.value:
         return clean_mode(
-            files=args["FILE"],
+            files=files_of(parser, args),
             keep=None if not args["keep"] else {Tag(tag) for tag in args["keep"]},
+            batch=batch,
+            recursive=args["recursive"],
+            incremental=args["incremental"],
+            checkpoint=checkpoint_of(parser, args),
+            resume=args["resume"],
         )
     elif command == Mode.INTERACTIVE.value:
-        return interactive_mode(files=args["FILE"], compilation=args["compilation"])
+        return interactive_mode(
+            files=files_of(parser, args),
+            compilation=args["compilation"],
+            recursive=args["recursive"],
+        )
     elif command == Mode.RENAME.value:
+        if args["resume"] or args["rollback"]:
+            if args["FILE"] or args["files_from"] is not None:
+                parser.error("FILE can not be given with --resume or --rollback")
+            return rename_journal_mode(rollback=args["rollback"])
         return rename_mode(
-            files=args["FILE"], pattern=args["pattern"], force=args["force"]
+            files=files_of(parser, args),
+            pattern=args["pattern"],
+            force=args["force"],
+            batch=batch,
+            recursive=args["recursive"],
+            incremental=args["incremental"],
         )
+    elif command == Mode.IMPORT.value:
+        return import_mode(
+            manifest=args["MANIFEST"], batch=batch, input_format=args["format"]
+        )
+    elif command == Mode.SERVE.value:
+        return serve_mode(socket_path=args["socket"], cache_size=args["cache_size"])
+    elif command == Mode.WATCH.value:
+        return watch_mode(
+            directory=args["DIR"],
+            rules=args["rules"],
+            jobs=batch.jobs,
+            poll=args["poll"],
+            interval=args["interval"],
+            settle=args["settle"],
+        )
+    elif command == Mode.MERGE.value:
+        return merge_mode(reports=args["REPORT"], output=args["output"])
     elif command == Mode.COPY.value:
-        return copy_mode(src=args["SOURCE"], dst=args["DEST"])
+        return copy_mode(
+            src=args["SOURCE"],
+            dst=args["DEST"],
+            batch=batch,
+            recursive=args["recursive"],
+        )
     return 1
 
 
@@ -0,0 +1,244 @@
+from __future__ import annotations
+from collections import deque
+import functools
+import itertools
+import os
+from typing import TYPE_CHECKING, TypeVar
+from audiotag import cache
+from audiotag.track import TagListInvalidException, Track
+from audiotag.util import NoAudioFilesFoundError
+
+if TYPE_CHECKING:
+    from pathlib import Path
+    from concurrent.futures import Future
+    from typing import Any, Callable, Iterable, Iterator, Optional, TextIO
+    from audiotag.shard import Shard
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Number of items handed to a worker process at once. Sending every file
+# on its own makes the inter-process communication the bottleneck.
+CHUNKSIZE = 16
+
+# Maximum number of chunks per worker that are submitted but not yet consumed.
+# This bounds memory usage and the number of open files regardless of the
+# size of the input.
+WINDOW = 2
+
+
+def default_jobs() -> int:
+    """Returns the default number of workers, which is the number of CPUs"""
+    return os.cpu_count() or 1
+
+
+def _init_worker(cache_file: Optional[Path]) -> None:
+    """Applies the settings of the main process to a worker process"""
+    cache.enable(cache_file)
+
+
+def _map_chunk(func: Callable[[T], R], chunk: list[T]) -> list[R]:
+    return [func(item) for item in chunk]
+
+
+class Failure:
+    """A file that could not be processed and the stage at which it failed"""
+
+    path: Path
+    stage: str
+    message: str
+
+    def __init__(self, path: Path, stage: str, message: str):
+        self.path = path
+        self.stage = stage
+        self.message = message
+
+    def __repr__(self) -> str:
+        return f"Failure({str(self.path)!r}, {self.stage!r}, {self.message!r})"
+
+    def record(self) -> dict[str, object]:
+        """Returns the failure as a record, which can be read as a list of files"""
+        return {"path": str(self.path), "stage": self.stage, "error": self.message}
+
+
+def stage_of(error: Exception) -> str:
+    """Returns the stage of processing a file at which error was raised"""
+    if isinstance(error, (TagListInvalidException, ValueError)):
+        return "validate"
+    if isinstance(error, OSError):
+        return "save"
+    return "process"
+
+
+def _apply_to_track(
+    func: Callable[[Track], Any], keep_going: bool, path: Path
+) -> tuple[Path, Optional[Failure], Any]:
+    """
+    Opens the file at path, applies func to it and closes it again. Returns
+    the path, the failure if any and the result of func. Errors of func are
+    only turned into failures if keep_going is set.
+    """
+    try:
+        track = Track(path)
+    except OSError as e:
+        return path, Failure(path, "open", str(e)), None
+    try:
+        return path, None, func(track)
+    except Exception as e:
+        if not keep_going:
+            raise
+        return path, Failure(path, stage_of(e), str(e) or type(e).__name__), None
+    finally:
+        track.close()
+
+
+def _apply_to_item(
+    func: Callable[[Track, T], Any], keep_going: bool, item: tuple[Path, T]
+) -> tuple[Path, Optional[Failure], Any]:
+    """Applies func to the file of an item and its argument like _apply_to_track"""
+    path, argument = item
+    return _apply_to_track(
+        functools.partial(_call_with, func, argument), keep_going, path
+    )
+
+
+def _call_with(func: Callable[[Track, T], R], argument: T, track: Track) -> R:
+    return func(track, argument)
+
+
+class Batch:
+    """
+    Runs a function on every file of a batch. The work is spread over a pool
+    of worker processes if more than one job is requested. Results are always
+    returned in the same order as the input. If keep_going is set, files that
+    fail are skipped and collected in failures instead of stopping the batch.
+    If a shard is given, select only passes on the files of that shard.
+    """
+
+    jobs: int
+    keep_going: bool
+    failures: list[Failure]
+    shard: Optional[Shard]
+
+    def __init__(
+        self, jobs: int = 1, keep_going: bool = False, shard: Optional[Shard] = None
+    ):
+        if jobs < 1:
+            raise ValueError(f"Number of jobs must be positive, got {jobs}")
+        self.jobs = jobs
+        self.keep_going = keep_going
+        self.failures = []
+        self.shard = shard
+
+    def __repr__(self) -> str:
+        return (
+            f"Batch(jobs={self.jobs}, keep_going={self.keep_going}, "
+            + f"shard={self.shard!r})"
+        )
+
+    def select(
+        self, items: Iterable[T], key: Optional[Callable[[T], Path]] = None
+    ) -> Iterable[T]:
+        """
+        Returns the items whose file belongs to the shard of the batch. key
+        returns the path of an item and defaults to the item itself.
+        """
+        if self.shard is None:
+            return items
+        return self.shard.select(items, key)
+
+    def fail(self, path: Path, stage: str, message: str) -> None:
+        """Records that a file could not be processed"""
+        self.failures.append(Failure(path, stage, message))
+
+    def map(self, func: Callable[[T], R], items: Iterable[T]) -> Iterator[R]:
+        """
+        Applies func to all items and yields the results in input order.
+        Items are consumed lazily, so processing starts with the first item
+        and only a bounded number of items is in flight at any time.
+        func and the items have to be picklable if jobs is greater than one.
+        """
+        item_iter = iter(items)
+        head = list(itertools.islice(item_iter, 2))
+        item_iter = itertools.chain(head, item_iter)
+        # Starting a pool for a single file costs more than it could save
+        if self.jobs == 1 or len(head) <= 1:
+            yield from map(func, item_iter)
+            return
+
+        # Single file runs never need the pool, so it is only imported here
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunks = iter(lambda: list(itertools.islice(item_iter, CHUNKSIZE)), [])
+        pending: deque[Future[list[R]]] = deque()
+        with ProcessPoolExecutor(
+            max_workers=self.jobs,
+            initializer=_init_worker,
+            initargs=(cache.cache_file(),),
+        ) as executor:
+            try:
+                for chunk in chunks:
+                    pending.append(executor.submit(_map_chunk, func, chunk))
+                    if len(pending) >= WINDOW * self.jobs:
+                        yield from pending.popleft().result()
+                while pending:
+                    yield from pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def map_tracks(
+        self,
+        func: Callable[[Track], R],
+        paths: Iterable[Path],
+        messages: Optional[TextIO] = None,
+    ) -> Iterator[R]:
+        """
+        Opens every file, applies func to it and closes it again. Yields the
+        results in input order. Files that can not be opened are reported on
+        messages, which defaults to stdout, and skipped.
+        Raises NoAudioFilesFoundError if no file could be opened, unless
+        keep_going is set and the files are recorded in failures.
+        """
+        apply = functools.partial(_apply_to_track, func, self.keep_going)
+        return self._collect(self.map(apply, paths), messages, require_open=True)
+
+    def map_items(
+        self,
+        func: Callable[[Track, T], R],
+        items: Iterable[tuple[Path, T]],
+        messages: Optional[TextIO] = None,
+    ) -> Iterator[R]:
+        """
+        Applies func to the track and the argument of every item of a path and
+        an argument like map_tracks, but does not raise if no file could be
+        opened. func has to be picklable if jobs is greater than one.
+        """
+        apply = functools.partial(_apply_to_item, func, self.keep_going)
+        return self._collect(self.map(apply, items), messages, require_open=False)
+
+    def _collect(
+        self,
+        results: Iterable[tuple[Path, Optional[Failure], R]],
+        messages: Optional[TextIO],
+        require_open: bool,
+    ) -> Iterator[R]:
+        """Records and reports the failures and yields the other results"""
+        opened_any = False
+        for path, failure, result in results:
+            if failure is not None:
+                self.failures.append(failure)
+                if failure.stage == "open":
+                    print(f"Unable to open file '{str(path)}'", file=messages)
+                    continue
+                print(
+                    f"Unable to process file '{str(path)}': {failure.message}",
+                    file=messages,
+                )
+            opened_any = True
+            if failure is None:
+                yield result
+        # With keep_going the files that could not be opened are reported
+        # like any other failures
+        if require_open and not opened_any and not (self.keep_going and self.failures):
+            raise NoAudioFilesFoundError("No files could be opened")
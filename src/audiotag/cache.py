@@ -0,0 +1,236 @@
+from __future__ import annotations
+from collections import OrderedDict
+import copy
+import json
+import os
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import sqlite3
+    from typing import Optional
+
+# Default number of files whose tags are kept in memory, e.g. by the server
+CACHE_SIZE = 4096
+
+
+class TagCache:
+    """
+    Persistent cache of the tags of audio files. An entry is only valid as
+    long as the path, modification time, size and inode of the file match.
+    """
+
+    path: Path
+    _connection: sqlite3.Connection
+
+    def __init__(self, path: Path):
+        # Only import sqlite3 if the cache is actually used
+        import sqlite3
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._connection = sqlite3.connect(path, isolation_level=None, timeout=30)
+        # WAL allows concurrent readers and writers from several processes and
+        # makes commits cheap enough to commit every single entry
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS tags ("
+            "path TEXT PRIMARY KEY, "
+            "mtime_ns INTEGER NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "inode INTEGER NOT NULL, "
+            "tags TEXT NOT NULL)"
+        )
+
+    def __repr__(self) -> str:
+        return f"TagCache('{str(self.path)}')"
+
+    @staticmethod
+    def _key(path: Path) -> str:
+        return os.path.abspath(path)
+
+    def get(self, path: Path, stat: os.stat_result) -> Optional[dict[str, list[str]]]:
+        """
+        Returns the cached tags of the file or None if there is no entry or
+        the file has changed since the entry was written
+        """
+        row = self._connection.execute(
+            "SELECT tags FROM tags WHERE path = ? AND mtime_ns = ? "
+            "AND size = ? AND inode = ?",
+            (self._key(path), stat.st_mtime_ns, stat.st_size, stat.st_ino),
+        ).fetchone()
+        if row is None:
+            return None
+        tags: dict[str, list[str]] = json.loads(row[0])
+        return tags
+
+    def put(self, path: Path, stat: os.stat_result, tags: dict[str, list[str]]) -> None:
+        """Stores the tags of the file with the given stat result"""
+        self._connection.execute(
+            "INSERT OR REPLACE INTO tags VALUES (?, ?, ?, ?, ?)",
+            (
+                self._key(path),
+                stat.st_mtime_ns,
+                stat.st_size,
+                stat.st_ino,
+                json.dumps(tags),
+            ),
+        )
+
+    def remove(self, path: Path) -> None:
+        """Removes the entry of the file if there is one"""
+        self._connection.execute("DELETE FROM tags WHERE path = ?", (self._key(path),))
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class MemoryCache:
+    """
+    Least recently used tags of files held in memory in front of an optional
+    persistent cache. Entries are validated like those of TagCache. The cache
+    can be used by several threads at the same time.
+    """
+
+    size: int
+    backing: Optional[TagCache]
+    _entries: OrderedDict[str, tuple[tuple[int, int, int], dict[str, list[str]]]]
+    _lock: threading.Lock
+
+    def __init__(self, size: int, backing: Optional[TagCache] = None):
+        if size < 1:
+            raise ValueError(f"Size of the cache must be positive, got {size}")
+        self.size = size
+        self.backing = backing
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"MemoryCache(size={self.size}, backing={self.backing!r})"
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def with_backing(self, backing: Optional[TagCache]) -> MemoryCache:
+        """
+        Returns a cache that shares the entries of this one and is in front of
+        backing, so that every thread can use its own connection
+        """
+        view = copy.copy(self)
+        view.backing = backing
+        return view
+
+    @staticmethod
+    def _version(stat: os.stat_result) -> tuple[int, int, int]:
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def get(self, path: Path, stat: os.stat_result) -> Optional[dict[str, list[str]]]:
+        """Returns a copy of the cached tags of the file like TagCache.get"""
+        key = os.path.abspath(path)
+        tags: Optional[dict[str, list[str]]]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == self._version(stat):
+                self._entries.move_to_end(key)
+            else:
+                entry = None
+        if entry is not None:
+            tags = entry[1]
+        else:
+            tags = None if self.backing is None else self.backing.get(path, stat)
+            if tags is None:
+                return None
+            self._store(key, stat, tags)
+        # Tracks change the dicts they are given
+        return {name: list(values) for name, values in tags.items()}
+
+    def put(self, path: Path, stat: os.stat_result, tags: dict[str, list[str]]) -> None:
+        """Stores a copy of the tags of the file with the given stat result"""
+        self._store(os.path.abspath(path), stat, tags)
+        if self.backing is not None:
+            self.backing.put(path, stat, tags)
+
+    def _store(
+        self, key: str, stat: os.stat_result, tags: dict[str, list[str]]
+    ) -> None:
+        entry = self._version(stat), {
+            name: list(values) for name, values in tags.items()
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def remove(self, path: Path) -> None:
+        """Removes the entry of the file if there is one"""
+        with self._lock:
+            self._entries.pop(os.path.abspath(path), None)
+        if self.backing is not None:
+            self.backing.remove(path)
+
+
+_cache_file: Optional[Path] = None
+# Changes whenever the cache is enabled or disabled, so that the connections
+# of other threads to an earlier cache file are not used any more
+_generation = 0
+# Connection of the current thread, as sqlite connections must not be shared
+# across threads or a fork
+_local = threading.local()
+_memory: Optional[MemoryCache] = None
+
+
+def enable(cache_file: Optional[Path]) -> None:
+    """
+    Enables the tag cache stored in the given file for this process.
+    Passing None disables the cache.
+    """
+    global _cache_file
+    disable()
+    _cache_file = cache_file
+
+
+def disable() -> None:
+    """Disables the tag cache for this process"""
+    global _cache_file, _generation
+    tag_cache = getattr(_local, "cache", None)
+    if tag_cache is not None and _local.owner == (os.getpid(), _generation):
+        tag_cache.close()
+    _local.cache = None
+    _cache_file = None
+    _generation += 1
+
+
+def cache_file() -> Optional[Path]:
+    """Returns the file of the enabled tag cache or None if it is disabled"""
+    return _cache_file
+
+
+def enable_memory(size: Optional[int]) -> None:
+    """
+    Keeps the tags of the size most recently used files of this process in
+    memory in front of the tag cache. Passing None disables it. Worker
+    processes only start out with a copy of the entries.
+    """
+    global _memory
+    _memory = None if size is None else MemoryCache(size)
+
+
+def current() -> Optional[TagCache | MemoryCache]:
+    """
+    Returns the enabled tag cache or None. Every thread of every process
+    opens its own connection.
+    """
+    persistent: Optional[TagCache] = None
+    if _cache_file is not None:
+        owner = os.getpid(), _generation
+        persistent = getattr(_local, "cache", None)
+        if persistent is None or _local.owner != owner:
+            persistent = TagCache(_cache_file)
+            _local.cache = persistent
+            _local.owner = owner
+    if _memory is None:
+        return persistent
+    return _memory.with_backing(persistent)
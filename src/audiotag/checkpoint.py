@@ -0,0 +1,95 @@
+"""
+Checkpoints of long running batches. A checkpoint is a log of the files that
+are done, so that an interrupted run can be resumed without starting over.
+"""
+
+from __future__ import annotations
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import BinaryIO, Iterable, Iterator
+
+# Number of files logged between two fsyncs. Every file is written to the log
+# right away, which survives the process being killed, while only the fsyncs
+# protect against a crash of the system and are too slow to do for each file.
+SYNC_INTERVAL = 256
+
+
+class Checkpoint:
+    """
+    Log of the files that are done. Every entry is the absolute path of a file
+    terminated by a NUL character, so any filename can be logged.
+    """
+
+    path: Path
+    # Files that were done by an earlier run
+    done: set[str]
+    # Number of files that were left out by pending
+    skipped: int
+    _stream: BinaryIO
+    _unsynced: int
+
+    def __init__(self, path: Path, resume: bool = False):
+        """
+        Opens the log at path. Raises FileExistsError if the log exists and
+        resume is not set, so that an earlier run is not resumed by accident.
+        """
+        self.path = path
+        self.done = set()
+        self.skipped = 0
+        self._unsynced = 0
+        if path.exists():
+            if not resume:
+                raise FileExistsError(
+                    f"Found the checkpoint of an interrupted run in '{str(path)}'. "
+                    + "Use --resume to skip the files it lists or remove it"
+                )
+            self._load()
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        self._stream = open(path, "ab", buffering=0)
+
+    def __repr__(self) -> str:
+        return f"Checkpoint('{str(self.path)}')"
+
+    def _load(self) -> None:
+        """
+        Reads the files that are done. An entry that was only partly written
+        when the run was interrupted is cut off, so that it does not run into
+        the next entry.
+        """
+        with open(self.path, "r+b") as stream:
+            *entries, rest = stream.read().split(b"\0")
+            if rest:
+                stream.truncate(stream.tell() - len(rest))
+        self.done.update(os.fsdecode(entry) for entry in entries)
+
+    def pending(self, paths: Iterable[Path]) -> Iterator[Path]:
+        """Lazily yields the paths of the files that are not done yet"""
+        for path in paths:
+            if os.path.abspath(path) in self.done:
+                self.skipped += 1
+            else:
+                yield path
+
+    def add(self, path: Path) -> None:
+        """Logs that the file is done"""
+        self._stream.write(os.fsencode(os.path.abspath(path)) + b"\0")
+        self._unsynced += 1
+        if self._unsynced >= SYNC_INTERVAL:
+            self.sync()
+
+    def sync(self) -> None:
+        """Makes sure that the logged files survive a crash of the system"""
+        if self._unsynced:
+            os.fsync(self._stream.fileno())
+            self._unsynced = 0
+
+    def close(self, finished: bool = False) -> None:
+        """Closes the log and removes it if the run is finished"""
+        self.sync()
+        self._stream.close()
+        if finished:
+            self.path.unlink()
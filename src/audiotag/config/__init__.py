@@ -1,8 +1,17 @@
+"""
+Settings from the config file. The config file is only read when the first
+setting is accessed, so commands that do not need it do not pay for it.
+"""
+
+from __future__ import annotations
 from pathlib import Path
 import configparser
-from appdirs import AppDirs
+import functools
+from typing import TYPE_CHECKING
 
-from prompt_toolkit.enums import EditingMode
+if TYPE_CHECKING:
+    from typing import Any
+    from prompt_toolkit.enums import EditingMode
 
 
 class InvalidConfigException(Exception):
@@ -11,31 +20,112 @@ class InvalidConfigException(Exception):
     pass
 
 
-_dirs = AppDirs(appname="audiotag")
-_config_file = Path(_dirs.user_config_dir) / "config.ini"
-
-_config = configparser.ConfigParser()
-_config.read(_config_file)
+# The settings are resolved by __getattr__ on first access
+editing_mode: EditingMode
+value_sep: str
+audio_extensions: frozenset[str]
+tag_cache: bool
+cache_file: Path
+rename_journal: Path
+state_dir: Path
+server_socket: Path
+pattern_single_disc: str
+pattern_multi_disc: str
 
 _allowed_editing_modes = ["emacs", "vi"]
 
-_config_editing_mode = _config.get("global", "editing_mode", fallback="emacs")
-if _config_editing_mode not in _allowed_editing_modes:
-    raise InvalidConfigException(
-        f"Invalid value for config.editing_mode '{_config_editing_mode}'. "
-        + f"Possible values [{', '.join(_allowed_editing_modes)}]"
+
+@functools.lru_cache(maxsize=None)
+def _load() -> dict[str, Any]:
+    """Reads and validates the config file"""
+    from appdirs import AppDirs
+
+    dirs = AppDirs(appname="audiotag")
+    config_file = Path(dirs.user_config_dir) / "config.ini"
+
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    settings: dict[str, Any] = {}
+
+    config_editing_mode = config.get("global", "editing_mode", fallback="emacs")
+    if config_editing_mode not in _allowed_editing_modes:
+        raise InvalidConfigException(
+            f"Invalid value for config.editing_mode '{config_editing_mode}'. "
+            + f"Possible values [{', '.join(_allowed_editing_modes)}]"
+        )
+    settings["_editing_mode"] = config_editing_mode
+
+    value_sep = config.get("global", "value_separator", fallback="/")
+    if len(value_sep) != 1:
+        raise InvalidConfigException(
+            f"Invalid value for config.value_sep '{value_sep}'. "
+            + "Separator must b a single character."
+        )
+    settings["value_sep"] = value_sep
+
+    audio_extensions = config.get(
+        "global",
+        "audio_extensions",
+        fallback="aac, aif, aiff, ape, dsf, flac, m4a, mp3, mp4, mpc, oga, ogg, "
+        + "opus, spx, tta, wav, wma, wv",
+    )
+    settings["audio_extensions"] = frozenset(
+        "." + ext.strip().lstrip(".").lower()
+        for ext in audio_extensions.split(",")
+        if ext.strip()
     )
-editing_mode = EditingMode(_config_editing_mode.upper())
 
-value_sep = _config.get("global", "value_separator", fallback="/")
-if len(value_sep) != 1:
-    raise InvalidConfigException(
-        f"Invalid value for config.value_sep '{value_sep}'. "
-        + "Separator must b a single character."
+    settings["pattern_single_disc"] = config.get(
+        "global", "pattern_single_disc", fallback="{N} - {T}"
     )
+    settings["pattern_multi_disc"] = config.get(
+        "global", "pattern_multi_disc", fallback="{D}-{N} - {T}"
+    )
+
+    try:
+        settings["tag_cache"] = config.getboolean("global", "tag_cache", fallback=False)
+    except ValueError:
+        raise InvalidConfigException(
+            f"Invalid value for config.tag_cache '{config.get('global', 'tag_cache')}'. "
+            + "Possible values [yes, no]"
+        )
+    settings["cache_file"] = Path(
+        config.get(
+            "global",
+            "cache_file",
+            fallback=str(Path(dirs.user_cache_dir) / "tags.sqlite"),
+        )
+    ).expanduser()
+    settings["rename_journal"] = Path(
+        config.get(
+            "global",
+            "rename_journal",
+            fallback=str(Path(dirs.user_cache_dir) / "rename.journal"),
+        )
+    ).expanduser()
+    settings["state_dir"] = Path(
+        config.get(
+            "global",
+            "state_dir",
+            fallback=str(Path(dirs.user_cache_dir) / "state"),
+        )
+    ).expanduser()
+    settings["server_socket"] = Path(
+        config.get(
+            "global",
+            "server_socket",
+            fallback=str(Path(dirs.user_cache_dir) / "server.sock"),
+        )
+    ).expanduser()
+    return settings
+
 
+def __getattr__(name: str) -> Any:
+    if name == "editing_mode":
+        # Only the interactive mode needs prompt_toolkit
+        from prompt_toolkit.enums import EditingMode
 
-pattern_single_disc = _config.get("global", "pattern_single_disc", fallback="{N} - {T}")
-pattern_multi_disc = _config.get(
-    "global", "pattern_multi_disc", fallback="{D}-{N} - {T}"
-)
+        return EditingMode(_load()["_editing_mode"].upper())
+    if name.startswith("_") or name not in _load():
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return _load()[name]
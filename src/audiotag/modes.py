@@ -1,48 +1,157 @@
 from __future__ import annotations
 from pathlib import Path
+import functools
+import itertools
+import operator
 import sys
 from typing import TYPE_CHECKING
 import os
-from prompt_toolkit.formatted_text import html
-from prompt_toolkit.shortcuts.prompt import PromptSession
-from audiotag import config, styles
-from audiotag.track import TagListInvalidException, Track, Tag, VALUE_SEP
+from audiotag import cache, config, records
+from audiotag.batch import Batch
+from audiotag.checkpoint import Checkpoint
+from audiotag.pattern import FilenamePattern, InvalidPatternError, compile_pattern
+from audiotag.query import InvalidQueryError, Query, compile_query
+from audiotag.renamer import (
+    Journal,
+    JournalLock,
+    RenameInterruptedError,
+    RenameLockedError,
+    RenamePlan,
+)
+from audiotag.state import StateFile
+from audiotag.track import (
+    TagListInvalidException,
+    TagPlan,
+    Track,
+    Tag,
+    value_separator,
+)
 from audiotag.util import (
-    ListValidator,
+    POLL_INTERVAL,
+    SETTLE_TIME,
+    NoAudioFilesFoundError,
     NoSuchDirectoryError,
-    NonEmptyValidator,
-    NumberValidator,
-    formatted_text_from_str,
-    get_toolbar_text,
-    yes_no,
     open_tracks,
     list_files,
-    strings_to_paths,
+    walk_files,
+    collect_paths,
     print_to_console,
+    print_summary,
 )
 
 if TYPE_CHECKING:
-    from typing import Optional
+    from typing import Callable, Iterable, Iterator, Optional
+    from prompt_toolkit.formatted_text import html
     from prompt_toolkit.formatted_text.base import FormattedText
+    from audiotag.watch import Rules
+
 
+def _format_tags(track: Track, as_html: bool) -> str | html.HTML:
+    return track.format_tags(as_html=as_html)
 
-def print_mode(files: list[str]) -> int:
-    """Prints all filenames and their tags and correspondig values."""
-    tracklist = open_tracks(strings_to_paths(files))
-    for track in tracklist:
-        text = track.format_tags(as_html=sys.stdout.isatty())
+
+def print_mode(
+    files: Iterable[str],
+    batch: Optional[Batch] = None,
+    recursive: bool = False,
+    output_format: str = "text",
+    fields: Optional[str] = None,
+) -> int:
+    """
+    Prints all filenames and their tags and correspondig values. Any other
+    output_format than "text" streams one record per file in that format,
+    optionally restricted to a comma separated list of fields.
+    """
+    batch = batch or Batch()
+    if output_format != "text":
+        try:
+            selected = None if fields is None else records.parse_fields(fields)
+        except ValueError as e:
+            print(e)
+            return 1
+        make_record = functools.partial(records.make_record, fields=selected)
+        records.write_records(
+            batch.map_tracks(
+                make_record,
+                batch.select(collect_paths(files, recursive=recursive)),
+                messages=sys.stderr,
+            ),
+            output_format=output_format,
+            stream=sys.stdout,
+            fields=selected,
+        )
+        return 0
+    if fields is not None:
+        print("A list of fields can only be given with a format")
+        return 1
+    format_tags = functools.partial(_format_tags, as_html=sys.stdout.isatty())
+    for text in batch.map_tracks(
+        format_tags, batch.select(collect_paths(files, recursive=recursive))
+    ):
         print_to_console(text)
     return 0
 
 
-def interactive_mode(files: list[str], compilation: bool) -> int:
-    tracklist: list[Track] = open_tracks(strings_to_paths(files))
+def _matches(query: Query, track: Track) -> tuple[Path, bool]:
+    return track.path, query.matches(track.tags)
+
+
+def find_mode(
+    files: Iterable[str],
+    query: str,
+    batch: Optional[Batch] = None,
+    recursive: bool = False,
+    print0: bool = False,
+) -> int:
+    """
+    Prints the paths of the files whose tags match the query, separated by
+    newlines or by NUL characters if print0 is set. Files that are cached in
+    the tag cache are not opened.
+    """
+    batch = batch or Batch()
+    try:
+        compiled = compile_query(query)
+    except InvalidQueryError as e:
+        print(e)
+        return 1
+    end = "\0" if print0 else "\n"
+    try:
+        for path, matched in batch.map_tracks(
+            functools.partial(_matches, compiled),
+            batch.select(collect_paths(files, recursive=recursive)),
+            messages=sys.stderr,
+        ):
+            if matched:
+                sys.stdout.write(str(path) + end)
+    except NoAudioFilesFoundError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+def interactive_mode(
+    files: Iterable[str], compilation: bool, recursive: bool = False
+) -> int:
+    # prompt_toolkit is only imported by the modes that prompt the user
+    from prompt_toolkit.formatted_text import html
+    from prompt_toolkit.shortcuts.prompt import PromptSession
+    from audiotag import styles
+    from audiotag.prompt import (
+        ListValidator,
+        NonEmptyValidator,
+        NumberValidator,
+        formatted_text_from_str,
+        get_toolbar_text,
+    )
+
+    tracklist: list[Track] = open_tracks(collect_paths(files, recursive=recursive))
 
+    value_sep = value_separator()
     tags: dict[Tag, list[str]] = {
-        Tag.ARTIST: list({VALUE_SEP.join(t.artist) for t in tracklist}),
-        Tag.ALBUMARTIST: list({VALUE_SEP.join(t.album_artist) for t in tracklist}),
+        Tag.ARTIST: list({value_sep.join(t.artist) for t in tracklist}),
+        Tag.ALBUMARTIST: list({value_sep.join(t.album_artist) for t in tracklist}),
         Tag.ALBUM: list({t.album for t in tracklist}),
-        Tag.GENRE: list({VALUE_SEP.join(t.genre) for t in tracklist}),
+        Tag.GENRE: list({value_sep.join(t.genre) for t in tracklist}),
         Tag.DATE: list({"" if t.date == 0 else str(t.date) for t in tracklist}),
     }
     defaults: dict[Tag, str] = {
@@ -130,7 +239,7 @@ def interactive_mode(files: list[str], compilation: bool) -> int:
                 )
                 artist_multiple = _ask_artist(
                     message=formatted_text_from_str(msg_artist),
-                    default=VALUE_SEP.join(track.artist),
+                    default=value_sep.join(track.artist),
                 )
                 artist = Track.split_tag(artist_multiple)
 
@@ -158,41 +267,307 @@ def interactive_mode(files: list[str], compilation: bool) -> int:
             track.tracktotal = tracktotal
             track.disctotal = disctotal
 
-    # Loop again so the program can be safely aborted still while getting input
-    for track in tracklist:
-        track.save()
+    def _save(track: Track) -> bool:
+        written = track.save()
         track.close()
+        return written
+
+    # Loop again so the program can be safely aborted still while getting input
+    print_summary(_save(track) for track in tracklist)
     return 0
 
 
+def _with_path(func: Callable[[Track], bool], track: Track) -> tuple[Path, bool]:
+    return track.path, func(track)
+
+
+def _run_tracked(
+    func: Callable[[Track], bool],
+    paths: Iterable[Path],
+    batch: Batch,
+    state: Optional[StateFile] = None,
+    checkpoint: Optional[Checkpoint] = None,
+) -> None:
+    """
+    Applies func to the files and prints a summary. If a state is given, only
+    files that changed since the last run are opened. If a checkpoint is
+    given, files it lists as done are left out. Every file is recorded in
+    both as soon as the batch returns it, which happens in input order.
+    """
+    if state is None and checkpoint is None:
+        print_summary(batch.map_tracks(func, paths))
+        return
+    if state is not None:
+        paths = state.changed(paths)
+    if checkpoint is not None:
+        paths = checkpoint.pending(paths)
+    opened = 0
+
+    def _counted(paths: Iterable[Path]) -> Iterator[Path]:
+        nonlocal opened
+        for path in paths:
+            opened += 1
+            yield path
+
+    def _recorded(results: Iterable[tuple[Path, bool]]) -> Iterator[bool]:
+        for path, written in results:
+            if state is not None:
+                state.put(path, os.stat(path))
+            if checkpoint is not None:
+                checkpoint.add(path)
+            yield written
+
+    finished = False
+    try:
+        try:
+            print_summary(
+                _recorded(
+                    batch.map_tracks(
+                        functools.partial(_with_path, func), _counted(paths)
+                    )
+                )
+            )
+        except NoAudioFilesFoundError:
+            if opened:
+                raise
+            print_summary([])
+        finished = True
+    finally:
+        if state is not None:
+            state.close()
+        if checkpoint is not None:
+            checkpoint.close(finished=finished)
+    if state is not None:
+        _print_unchanged(state)
+    if checkpoint is not None and checkpoint.skipped:
+        print(
+            f"{checkpoint.skipped} file{'s' if checkpoint.skipped != 1 else ''} "
+            + "done before the checkpoint left out"
+        )
+
+
+def _open_checkpoint(path: Optional[Path], resume: bool) -> Optional[Checkpoint]:
+    """Opens the checkpoint at path if given. Raises FileExistsError like Checkpoint"""
+    return None if path is None else Checkpoint(path, resume=resume)
+
+
+def _print_unchanged(state: StateFile) -> None:
+    if state.unchanged:
+        print(
+            f"{state.unchanged} unchanged "
+            + f"file{'s' if state.unchanged != 1 else ''} left out"
+        )
+
+
+def _state(mode: str, parameters: object) -> StateFile:
+    """Opens the state of incremental runs of a mode with the given parameters"""
+    return StateFile(config.state_dir / f"{mode}.sqlite", parameters)
+
+
+def _apply_plan(track: Track, plan: TagPlan) -> bool:
+    plan.apply(track)
+    return track.save()
+
+
 def set_mode(
-    files: list[str], remove_tags: set[Tag], set_tags: dict[Tag, str | int]
+    files: Iterable[str],
+    remove_tags: set[Tag],
+    set_tags: dict[Tag, str | int],
+    batch: Optional[Batch] = None,
+    recursive: bool = False,
+    incremental: bool = False,
+    checkpoint: Optional[Path] = None,
+    resume: bool = False,
 ) -> int:
-    tracklist = open_tracks(strings_to_paths(files))
-    for track in tracklist:
-        try:
-            set_modified = track.set_tags(set_tags)
-        except TagListInvalidException as e:
-            print(e)
-            return 1
-        del_modified = track.remove_tags(remove_tags)
-        if set_modified or del_modified:
-            track.save()
-        track.close()
+    """
+    Sets and removes tags of the files. If incremental is set, only files
+    that changed since the last incremental run with the same tags are set.
+    If checkpoint is given, the files that are done are logged to it and
+    resume leaves out the files logged by an interrupted run.
+    """
+    batch = batch or Batch()
+    # Parse and validate all values before any file is touched
+    try:
+        plan = TagPlan(set_tags=set_tags, remove_tags=remove_tags)
+        log = _open_checkpoint(checkpoint, resume)
+    except (TagListInvalidException, ValueError, OSError) as e:
+        print(e)
+        return 1
+    state = None
+    if incremental:
+        state = _state(
+            "set",
+            {
+                "set": {tag.value: values for tag, values in plan.set_values.items()},
+                "remove": {tag.value for tag in plan.remove},
+            },
+        )
+    _run_tracked(
+        functools.partial(_apply_plan, plan=plan),
+        batch.select(collect_paths(files, recursive=recursive)),
+        batch,
+        state=state,
+        checkpoint=log,
+    )
     return 0
 
 
-def clean_mode(files: list[str], keep: Optional[set[Tag]]) -> int:
-    """Removes all tags from the files"""
-    tracklist = open_tracks(strings_to_paths(files))
-    for track in tracklist:
-        track.clear_tags(keep=keep)
-        track.save()
-        track.close()
+def import_mode(
+    manifest: str, batch: Optional[Batch] = None, input_format: Optional[str] = None
+) -> int:
+    """
+    Sets the tags of every file in a manifest of records. The manifest is read
+    twice, so that every record is validated before any file is touched
+    without holding the whole manifest in memory.
+    """
+    batch = batch or Batch()
+    manifest_path = Path(manifest)
+    seen: set[str] = set()
+    try:
+        input_format = input_format or records.format_of(manifest_path)
+        with open(manifest_path, newline="") as stream:
+            for path, _ in records.read_plans(stream, input_format):
+                key = os.path.abspath(path)
+                if key in seen:
+                    print(f"File '{str(path)}' is given more than once")
+                    return 1
+                seen.add(key)
+    except (OSError, ValueError) as e:
+        print(e)
+        return 1
+    if not seen:
+        print(f"No records in '{manifest}'")
+        return 1
+    seen.clear()
+
+    with open(manifest_path, newline="") as stream:
+        print_summary(
+            batch.map_items(
+                _apply_plan,
+                batch.select(
+                    records.read_plans(stream, input_format),
+                    key=operator.itemgetter(0),
+                ),
+            )
+        )
+    return 0
+
+
+def _clear_tags(track: Track, keep: Optional[set[Tag]]) -> bool:
+    track.clear_tags(keep=keep)
+    return track.save()
+
+
+def clean_mode(
+    files: Iterable[str],
+    keep: Optional[set[Tag]],
+    batch: Optional[Batch] = None,
+    recursive: bool = False,
+    incremental: bool = False,
+    checkpoint: Optional[Path] = None,
+    resume: bool = False,
+) -> int:
+    """
+    Removes all tags from the files. If incremental is set, only files that
+    changed since the last incremental run keeping the same tags are cleaned.
+    checkpoint and resume work like in set_mode.
+    """
+    batch = batch or Batch()
+    try:
+        log = _open_checkpoint(checkpoint, resume)
+    except OSError as e:
+        print(e)
+        return 1
+    state = None
+    if incremental:
+        state = _state(
+            "clean", {"keep": None if keep is None else {tag.value for tag in keep}}
+        )
+    _run_tracked(
+        functools.partial(_clear_tags, keep=keep),
+        batch.select(collect_paths(files, recursive=recursive)),
+        batch,
+        state=state,
+        checkpoint=log,
+    )
     return 0
 
 
-def copy_mode(src: str, dst: str) -> int:
+def _track_path(track: Track) -> Path:
+    return track.path
+
+
+def _copy_tags(paths: tuple[Path, Path]) -> bool:
+    src_path, dst_path = paths
+    src_file = Track(src_path)
+    try:
+        dst_file = Track(dst_path)
+        try:
+            dst_file.copy_tags(source=src_file)
+            return dst_file.save()
+        finally:
+            dst_file.close()
+    finally:
+        src_file.close()
+
+
+def _copy_from(track: Track, src_path: Path) -> bool:
+    """Copies the tags of the file at src_path to the track and saves it"""
+    src_file = Track(src_path)
+    try:
+        track.copy_tags(source=src_file)
+        return track.save()
+    finally:
+        src_file.close()
+
+
+def _match_key(path: Path, root: Path) -> str:
+    """Returns the path of a file relative to root without its extension"""
+    return str(path.relative_to(root).with_suffix(""))
+
+
+def _matching_pairs(src_root: Path, dst_root: Path) -> Iterator[tuple[Path, Path]]:
+    """
+    Lazily yields pairs of audio files in both trees that have the same path
+    relative to their root apart from the extension. Files without exactly
+    one counterpart are reported and skipped. Only the destination tree is
+    held in memory, the source tree is walked while the pairs are consumed.
+    """
+    dst_files: dict[str, Path] = {}
+    ambiguous: set[str] = set()
+    for path in walk_files(dst_root):
+        key = _match_key(path, dst_root)
+        if key in dst_files:
+            ambiguous.add(key)
+        dst_files[key] = path
+
+    matched: set[str] = set()
+    for src in walk_files(src_root):
+        key = _match_key(src, src_root)
+        if key not in dst_files:
+            print(f"No file matches '{str(src)}' in '{str(dst_root)}'")
+        elif key in ambiguous:
+            print(f"Several files match '{str(src)}' in '{str(dst_root)}'")
+        elif key in matched:
+            print(f"Several files match '{str(dst_files[key])}' in '{str(src_root)}'")
+        else:
+            matched.add(key)
+            yield src, dst_files[key]
+
+    for key, dst in dst_files.items():
+        if key not in matched and key not in ambiguous:
+            print(f"No file matches '{str(dst)}' in '{str(src_root)}'")
+
+
+def copy_mode(
+    src: str, dst: str, batch: Optional[Batch] = None, recursive: bool = False
+) -> int:
+    """
+    Copies the tags of a file to another file or of the files in a directory
+    to the files in another directory. If recursive is set, files in both
+    trees are matched by their relative path without extension.
+    """
+    batch = batch or Batch()
     src_path = Path(src)
     dst_path = Path(dst)
 
@@ -204,14 +579,28 @@ def copy_mode(src: str, dst: str) -> int:
             print(e)
             return 1
         dst_file.copy_tags(source=src_file)
-        dst_file.save()
+        written = dst_file.save()
         dst_file.close()
         src_file.close()
+        print_summary([written])
+        return 0
+    elif src_path.is_dir() and dst_path.is_dir() and recursive:
+        # The destination is the file that is written, so failures and shards
+        # are by destination
+        sources = (
+            (dst_file, src_file)
+            for src_file, dst_file in _matching_pairs(src_path, dst_path)
+        )
+        print_summary(
+            batch.map_items(
+                _copy_from, batch.select(sources, key=operator.itemgetter(0))
+            )
+        )
         return 0
     elif src_path.is_dir() and dst_path.is_dir():
         try:
-            src_files = sorted(open_tracks(list_files(src_path)))
-            dst_files = sorted(open_tracks(list_files(dst_path)))
+            src_files = sorted(batch.map_tracks(_track_path, list_files(src_path)))
+            dst_files = sorted(batch.map_tracks(_track_path, list_files(dst_path)))
         except NoSuchDirectoryError as err:
             print(err)
             return 1
@@ -219,35 +608,375 @@ def copy_mode(src: str, dst: str) -> int:
         if len(src_files) != len(dst_files):
             print("Different number of files in SOURCEFOLDER and DESTFOLDER")
             return 1
-        for src_file, dst_file in zip(src_files, dst_files):
-            dst_file.copy_tags(source=src_file)
-            dst_file.save()
-            dst_file.close()
-            src_file.close()
+        # Files are paired by their position in the whole directory, so the
+        # pairs are sharded instead of the files
+        pairs = batch.select(zip(src_files, dst_files), key=operator.itemgetter(1))
+        print_summary(batch.map(_copy_tags, pairs))
         return 0
     else:
         print("Source and destination must either be both files or both directories")
         return 1
 
 
+def _new_path(track: Track, pattern: Optional[FilenamePattern]) -> tuple[Path, Path]:
+    new_path = track.path.parent / (track.format_filename(pattern) + track.path.suffix)
+    # Patterns may contain "..", which would otherwise hide that two new paths
+    # are the same
+    return track.path, Path(os.path.normpath(new_path))
+
+
+def _lock_journal(journal: Path, resume: str, rollback: str) -> Optional[JournalLock]:
+    """
+    Locks the journal of renames and returns the lock. Prints why and returns
+    None if another rename is running or an interrupted rename left its
+    journal behind, which can be finished with resume or reverted with rollback.
+    """
+    lock = JournalLock(journal)
+    try:
+        lock.acquire()
+    except RenameLockedError as e:
+        print(e)
+        return None
+    if journal.exists():
+        lock.release()
+        print(
+            f"Found the journal of an interrupted rename in '{str(journal)}'. "
+            + f"Use {resume} to finish it or {rollback} to revert it"
+        )
+        return None
+    return lock
+
+
 def rename_mode(
-    files: list[str], pattern: Optional[str] = None, force: bool = False
+    files: Iterable[str],
+    pattern: Optional[str] = None,
+    force: bool = False,
+    batch: Optional[Batch] = None,
+    recursive: bool = False,
+    journal: Optional[Path] = None,
+    incremental: bool = False,
 ) -> int:
-    tracklist = open_tracks(strings_to_paths(files))
-    for track in tracklist:
-        new_path = track.path.parent / (
-            track.format_filename(pattern) + track.path.suffix
-        )
-        if track.path == new_path:
-            continue
-        if new_path.is_file():
-            if not force:
-                question = (
-                    f"File '{str(new_path)}' already exists.\nOverwrite it? (y/n): "
-                )
-                if not yes_no(question):
-                    continue
-            os.remove(new_path)
-        track.close()
-        os.rename(src=track.path, dst=new_path)
+    """
+    Renames files based on their tags. All new names are planned before any
+    file is renamed and the renames are logged to a journal, so an interrupted
+    run can be finished or reverted with rename_journal_mode. If incremental
+    is set, only files that changed since the last incremental run with the
+    same pattern are renamed.
+    """
+    batch = batch or Batch()
+    journal = journal or config.rename_journal
+    lock = _lock_journal(journal, "--resume", "--rollback")
+    if lock is None:
+        return 1
+    try:
+        return _rename_files(
+            files, pattern, force, batch, recursive, journal, incremental
+        )
+    finally:
+        lock.release()
+
+
+def _rename_files(
+    files: Iterable[str],
+    pattern: Optional[str],
+    force: bool,
+    batch: Batch,
+    recursive: bool,
+    journal: Path,
+    incremental: bool,
+) -> int:
+    """Renames the files like rename_mode while the journal is locked"""
+    # Compile the pattern once and report invalid patterns before any file
+    # is opened
+    compiled: Optional[FilenamePattern] = None
+    try:
+        if pattern:
+            compiled = compile_pattern(pattern)
+        else:
+            compile_pattern(config.pattern_single_disc)
+            compile_pattern(config.pattern_multi_disc)
+    except InvalidPatternError as e:
+        print(e)
+        return 1
+    new_path_of = functools.partial(_new_path, pattern=compiled)
+    paths = batch.select(collect_paths(files, recursive=recursive))
+    state = None
+    if incremental:
+        state = _state(
+            "rename",
+            (
+                [pattern]
+                if pattern
+                else [config.pattern_single_disc, config.pattern_multi_disc]
+            ),
+        )
+        paths = state.changed(paths)
+    try:
+        # Collect all new names before renaming anything, so that no file is
+        # renamed while another one is still being read
+        try:
+            renames = list(batch.map_tracks(new_path_of, paths))
+        except NoAudioFilesFoundError:
+            if state is None or state.changed_files:
+                raise
+            renames = []
+        status = _rename(renames, force, batch, journal)
+        if state is not None and status == 0:
+            for old, new in renames:
+                # Files that were skipped are still at their old path
+                if old == new or not os.path.lexists(old):
+                    state.put(new, os.stat(new))
+            _print_unchanged(state)
+        return status
+    finally:
+        if state is not None:
+            state.close()
+
+
+def _rename(
+    renames: list[tuple[Path, Path]],
+    force: bool,
+    batch: Batch,
+    journal: Path,
+    ask: bool = True,
+) -> int:
+    """
+    Plans and does the renames and prints a summary. Existing files are
+    overwritten if force is set, otherwise the user is asked if ask is set
+    and they are skipped if not.
+    """
+
+    def _overwrite(path: Path) -> bool:
+        from audiotag.prompt import yes_no
+
+        if force or not ask:
+            return force
+        return yes_no(f"File '{str(path)}' already exists.\nOverwrite it? (y/n): ")
+
+    plan = RenamePlan(renames, overwrite=_overwrite)
+    try:
+        plan.execute(journal, jobs=batch.jobs)
+    except RenameInterruptedError as e:
+        print(e)
+        for path, error in e.failed:
+            batch.fail(path, "rename", error)
+        print(
+            f"The journal was kept in '{str(journal)}'. "
+            + "Use --resume to finish the rename or --rollback to revert it"
+        )
+        return 1
+    print_summary(
+        itertools.chain(
+            itertools.repeat(True, plan.renamed), itertools.repeat(False, plan.skipped)
+        ),
+        action="renamed",
+    )
+    return 0
+
+
+def _apply_rules(rules: Rules, track: Track) -> tuple[Path, bool, Optional[Path]]:
+    return (track.path, *rules.apply(track))
+
+
+def _watch_round(
+    paths: list[Path], rules: Rules, batch: Batch, journal: Path
+) -> tuple[int, list[Path]]:
+    """
+    Applies the rules to the files and prints a summary. Returns the status
+    and the paths of the files afterwards.
+    """
+    try:
+        results = list(batch.map_tracks(functools.partial(_apply_rules, rules), paths))
+    except NoAudioFilesFoundError:
+        results = []
+    # Files that failed were reported by the batch and are not kept around
+    batch.failures.clear()
+    print_summary(written for _, written, _ in results)
+    renames = [(path, new) for path, _, new in results if new is not None]
+    status = 0
+    if renames:
+        status = _rename(renames, rules.overwrite, batch, journal, ask=False)
+    final = [
+        new if new is not None and not os.path.lexists(path) else path
+        for path, _, new in results
+    ]
+    return status, final
+
+
+def watch_mode(
+    directory: str,
+    rules: str,
+    jobs: int = 1,
+    poll: bool = False,
+    interval: float = POLL_INTERVAL,
+    settle: float = SETTLE_TIME,
+    journal: Optional[Path] = None,
+) -> int:
+    """
+    Applies the rules to every audio file that is written or moved into the
+    directory until it is interrupted or terminated. Files are processed once
+    they have not changed for settle seconds, so files that are still being
+    copied are left alone. Files that fail are reported and skipped.
+    """
+    from audiotag.watch import Rules
+
+    journal = journal or config.rename_journal
+    try:
+        parsed = Rules(Path(rules))
+    except (OSError, ValueError, TagListInvalidException) as e:
+        print(e)
+        return 1
+    # The renames of the rules use the journal for as long as the watch runs
+    lock = _lock_journal(journal, "'rename --resume'", "'rename --rollback'")
+    if lock is None:
+        return 1
+    try:
+        return _watch(directory, parsed, jobs, poll, interval, settle, journal)
+    finally:
+        lock.release()
+
+
+def _watch(
+    directory: str,
+    rules: Rules,
+    jobs: int,
+    poll: bool,
+    interval: float,
+    settle: float,
+    journal: Path,
+) -> int:
+    """Watches the directory like watch_mode while the journal is locked"""
+    import signal
+    from audiotag.watch import Debouncer, PollingWatcher, open_watcher
+
+    try:
+        watcher = open_watcher(Path(directory), poll=poll, interval=interval)
+    except (OSError, NoSuchDirectoryError) as e:
+        print(e)
+        return 1
+
+    def _terminate(signum: int, frame: object) -> None:
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, _terminate)
+    batch = Batch(jobs=jobs, keep_going=True)
+    debouncer = Debouncer(settle)
+    if isinstance(watcher, PollingWatcher):
+        print(f"Watching '{directory}' by scanning it every {interval:g} seconds")
+    else:
+        print(f"Watching '{directory}' with inotify")
+    try:
+        while True:
+            paths = watcher.wait(debouncer.timeout())
+            if watcher.events_lost:
+                print("Events were lost, so all files are checked again")
+            debouncer.touch(paths)
+            ready = debouncer.ready()
+            if not ready:
+                continue
+            status, final = _watch_round(ready, rules, batch, journal)
+            # taglib opens files for writing, so even reading them causes
+            # events, and files that failed are only retried once they change
+            for path in itertools.chain(ready, final):
+                debouncer.done(path)
+            if status:
+                return status
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
+
+
+def merge_mode(reports: Iterable[str], output: Optional[str] = None) -> int:
+    """
+    Merges files of records, like the reports of the shards of a batch, into
+    a single file sorted by path. The format of every file is given by its
+    extension. Without output, JSON Lines are written to stdout.
+    """
+    merged: list[dict[str, object]] = []
+    # Fields in the order they first appear, as CSV and TSV need a header
+    fields: dict[str, None] = {records.PATH_FIELD: None}
+    try:
+        output_format = "jsonl" if output is None else records.format_of(Path(output))
+        for report in reports:
+            report_path = Path(report)
+            with open(report_path, newline="") as stream:
+                for _, record in records.read_records(
+                    stream, records.format_of(report_path)
+                ):
+                    merged.append(record)
+                    fields.update(dict.fromkeys(record))
+    except (OSError, ValueError) as e:
+        print(e)
+        return 1
+    merged.sort(key=lambda record: str(record.get(records.PATH_FIELD, "")))
+    if output is None:
+        records.write_records(merged, output_format, sys.stdout, fields=tuple(fields))
+        return 0
+    with open(output, "w", newline="") as stream:
+        count = records.write_records(
+            merged, output_format, stream, fields=tuple(fields)
+        )
+    print(f"{count} records merged into '{output}'")
+    return 0
+
+
+def serve_mode(
+    socket_path: Optional[Path] = None, cache_size: int = cache.CACHE_SIZE
+) -> int:
+    """Runs the commands of clients on a Unix socket until it is stopped"""
+    import signal
+    from audiotag.server import Server
+
+    socket_path = socket_path or config.server_socket
+    try:
+        server = Server(socket_path, cache_size=cache_size)
+    except OSError as e:
+        print(e)
+        return 1
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.close())
+    print(f"Listening on '{str(socket_path)}'")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def rename_journal_mode(rollback: bool, journal: Optional[Path] = None) -> int:
+    """Finishes or reverts an interrupted rename using its journal"""
+    journal = journal or config.rename_journal
+    lock = JournalLock(journal)
+    try:
+        lock.acquire()
+    except RenameLockedError as e:
+        print(e)
+        return 1
+    try:
+        return _finish_journal(journal, rollback)
+    finally:
+        lock.release()
+
+
+def _finish_journal(journal: Path, rollback: bool) -> int:
+    """Finishes or reverts the rename like rename_journal_mode while it is locked"""
+    try:
+        log = Journal.load(journal)
+    except FileNotFoundError:
+        print(f"There is no journal of an interrupted rename in '{str(journal)}'")
+        return 1
+    except (OSError, ValueError) as e:
+        print(e)
+        return 1
+    if rollback:
+        log.rollback()
+        print(f"{len(log.steps)} steps of the rename in '{str(journal)}' reverted")
+        return 0
+    try:
+        log.resume()
+    except RenameInterruptedError as e:
+        print(e)
+        return 1
+    print(f"{len(log.steps)} steps of the rename in '{str(journal)}' done")
     return 0
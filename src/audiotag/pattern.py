@@ -0,0 +1,226 @@
+from __future__ import annotations
+import functools
+import string
+import unicodedata
+from typing import TYPE_CHECKING
+from audiotag import config
+from audiotag.track import Tag
+
+if TYPE_CHECKING:
+    from typing import Callable, Optional, Union
+    from audiotag.track import TagView, Track
+
+    Value = Union[str, int]
+
+
+class InvalidPatternError(ValueError):
+    """Exception for filename patterns that can not be compiled"""
+
+    pass
+
+
+def _pad(number: int, total: int) -> str:
+    """Pads number with leading zeros to the number of digits of total"""
+    return str(number).zfill(len(str(total)) if total > 0 else 1)
+
+
+class _Field:
+    """
+    A placeholder of a filename pattern. Values are read from the parsed tags
+    of a track. Without a format spec the value is rendered by default, which
+    needs the tags in default_tags. With a format spec the raw value is
+    formatted, which only needs the tags in tags.
+    """
+
+    tags: tuple[Tag, ...]
+    default_tags: tuple[Tag, ...]
+    raw: Callable[[TagView], Value]
+    default: Callable[[TagView], str]
+
+    def __init__(
+        self,
+        tags: tuple[Tag, ...],
+        raw: Callable[[TagView], Value],
+        default: Optional[Callable[[TagView], str]] = None,
+        default_tags: Optional[tuple[Tag, ...]] = None,
+    ):
+        self.tags = tags
+        self.raw = raw
+        self.default = default or (lambda view: str(raw(view)))
+        self.default_tags = tags if default_tags is None else default_tags
+
+
+FIELDS: dict[str, _Field] = {
+    "A": _Field(tags=(Tag.ARTIST,), raw=lambda view: "-".join(view.artist)),
+    "T": _Field(tags=(Tag.TITLE,), raw=lambda view: view.title),
+    "L": _Field(tags=(Tag.ALBUM,), raw=lambda view: view.album),
+    "Y": _Field(tags=(Tag.DATE,), raw=lambda view: view.date),
+    "G": _Field(tags=(Tag.GENRE,), raw=lambda view: "-".join(view.genre)),
+    "N": _Field(
+        tags=(Tag.TRACKNUMBER,),
+        raw=lambda view: view.tracknumber,
+        default=lambda view: _pad(view.tracknumber, view.tracktotal),
+        default_tags=(Tag.TRACKNUMBER, Tag.TRACKTOTAL),
+    ),
+    "D": _Field(
+        tags=(Tag.DISCNUMBER,),
+        raw=lambda view: view.discnumber,
+        default=lambda view: _pad(view.discnumber, view.disctotal),
+        default_tags=(Tag.DISCNUMBER, Tag.DISCTOTAL),
+    ),
+    "NT": _Field(tags=(Tag.TRACKTOTAL,), raw=lambda view: view.tracktotal),
+    "DT": _Field(tags=(Tag.DISCTOTAL,), raw=lambda view: view.disctotal),
+}
+# Names used by earlier versions
+FIELDS["NO"] = FIELDS["NT"]
+FIELDS["DO"] = FIELDS["DT"]
+
+
+def _ascii(text: str) -> str:
+    """Transliterates text to ASCII by dropping accents and other marks"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return decomposed.encode("ascii", "ignore").decode("ascii")
+
+
+FILTERS: dict[str, Callable[[str], str]] = {
+    "lower": str.lower,
+    "upper": str.upper,
+    "title": str.title,
+    "ascii": _ascii,
+    "strip": str.strip,
+}
+
+
+def replace_forbidden(text: str) -> str:
+    """
+    Replaces characters that must not occur in a filename. Values that would
+    refer to the current or parent directory are replaced as well.
+    """
+    text = text.replace("/", "-")
+    return "_" * len(text) if text in {".", ".."} else text
+
+
+class FilenamePattern:
+    """
+    A filename pattern that is parsed and validated once and can then format
+    the filenames of any number of tracks. Placeholders may have a format spec
+    like {N:03} and filters like {A|lower} or {T|ascii|upper}. Separators in
+    the pattern like in {A}/{L}/{N} - {T} move files into directories.
+    Raises InvalidPatternError if the pattern is invalid.
+    """
+
+    pattern: str
+    tags: frozenset[Tag]
+    # Either a literal string or a tuple of field name, format spec and filters
+    _segments: list[str | tuple[str, str, tuple[str, ...]]]
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self._segments = []
+        tags: set[Tag] = set()
+        try:
+            parsed = list(string.Formatter().parse(pattern))
+        except ValueError as e:
+            raise InvalidPatternError(f"Check if pattern '{pattern}' is correct: {e}")
+
+        for literal, field, spec, conversion in parsed:
+            if literal:
+                self._segments.append(literal)
+            if field is None:
+                continue
+            name, *filters = [part.strip() for part in field.split("|")]
+            if name not in FIELDS:
+                raise InvalidPatternError(
+                    f"Unknown placeholder '{{{name}}}' in pattern '{pattern}'"
+                )
+            if conversion or (spec and "{" in spec):
+                raise InvalidPatternError(
+                    f"Check if placeholder '{{{field}}}' in pattern '{pattern}' "
+                    + "is correct"
+                )
+            for filter_name in filters:
+                if filter_name not in FILTERS:
+                    raise InvalidPatternError(
+                        f"Unknown filter '{filter_name}' in pattern '{pattern}'. "
+                        + f"Possible values [{', '.join(FILTERS)}]"
+                    )
+            if spec:
+                self._check_spec(name, spec)
+            spec = spec or ""
+            tags.update(FIELDS[name].tags if spec else FIELDS[name].default_tags)
+            self._segments.append((name, spec, tuple(filters)))
+
+        if not tags:
+            raise InvalidPatternError(f"Check if pattern '{pattern}' is correct")
+        self.tags = frozenset(tags)
+
+    def __repr__(self) -> str:
+        return f"FilenamePattern({self.pattern!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, FilenamePattern):
+            return NotImplemented
+        return self.pattern == other.pattern
+
+    def __hash__(self) -> int:
+        return hash(self.pattern)
+
+    def _check_spec(self, name: str, spec: str) -> None:
+        """Formats a dummy value to find invalid format specs up front"""
+        dummy: Value = 1 if name in {"Y", "N", "D", "NT", "DT", "NO", "DO"} else "x"
+        try:
+            format(dummy, spec)
+        except ValueError as e:
+            raise InvalidPatternError(
+                f"Invalid format spec '{spec}' for '{{{name}}}' in pattern "
+                + f"'{self.pattern}': {e}"
+            )
+
+    def format(self, track: Track) -> str:
+        """
+        Formats the filename of the track from its parsed tags. Raises
+        ValueError if any of the tags used by the pattern is missing.
+        """
+        missing_tags = [tag for tag in self.tags if not track.has_tag(tag)]
+        if missing_tags:
+            raise ValueError(
+                "The following tags are missing "
+                + f"{sorted(t.value for t in missing_tags)}"
+            )
+
+        view = track.tag_view
+        parts: list[str] = []
+        for segment in self._segments:
+            if isinstance(segment, str):
+                parts.append(segment)
+                continue
+            name, spec, filters = segment
+            field = FIELDS[name]
+            text = format(field.raw(view), spec) if spec else field.default(view)
+            for filter_name in filters:
+                text = FILTERS[filter_name](text)
+            parts.append(replace_forbidden(text))
+        filename = "".join(parts)
+        # Separators in the pattern create directories, which must have a name
+        names = filename.split("/")
+        if self.pattern.startswith("/"):
+            names = names[1:]
+        if len(names) > 1 and "" in names:
+            raise ValueError(f"Filename '{filename}' contains an empty directory name")
+        return filename
+
+
+@functools.lru_cache(maxsize=256)
+def compile_pattern(pattern: str) -> FilenamePattern:
+    """Compiles a pattern. Recently used patterns are only compiled once."""
+    return FilenamePattern(pattern)
+
+
+def default_pattern(track: Track) -> FilenamePattern:
+    """
+    Returns the configured pattern for single disc releases if the track has a
+    DISCTOTAL of at most 1 and the pattern for multi disc releases otherwise
+    """
+    if track.disctotal <= 1:
+        return compile_pattern(config.pattern_single_disc)
+    return compile_pattern(config.pattern_multi_disc)
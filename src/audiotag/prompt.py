@@ -0,0 +1,102 @@
+"""
+Helpers for the interactive prompts. This module imports prompt_toolkit, so
+it should only be imported by code that actually prompts the user.
+"""
+
+from __future__ import annotations
+from prompt_toolkit.formatted_text import html
+from prompt_toolkit.formatted_text.base import FormattedText, to_formatted_text
+from prompt_toolkit.application.current import get_app
+from prompt_toolkit.shortcuts.prompt import prompt
+from prompt_toolkit.validation import ValidationError, Validator
+import audiotag.config as config
+from audiotag.track import TagListInvalidException, Track, value_separator
+
+
+def formatted_text_from_str(text: str) -> FormattedText:
+    """
+    Creates FormattedText from a string containing HTML tags
+    """
+    return to_formatted_text(html.HTML(text))
+
+
+def get_toolbar_text():
+    text = get_app().current_buffer.text
+    value_sep = value_separator()
+    if value_sep not in text:
+        return html.HTML(
+            f"<b>Hint</b>: Use '<i>{value_sep}</i>' to input multiple values"
+        )
+    else:
+        values = text.split(value_sep)
+        values_escaped = [
+            html.html_escape(v.replace(f"\\{value_sep}", value_sep)) for v in values
+        ]
+        return formatted_text_from_str(
+            f"<b>Values</b>: <u>{'</u>, <u>'.join(values_escaped)}</u>"
+        )
+
+
+def _validate_non_empty(text: str):
+    if not text:
+        raise ValidationError(message="Input must not be empty", cursor_position=0)
+
+
+class NonEmptyValidator(Validator):
+    def validate(self, document):
+        text: str = document.text
+        _validate_non_empty(text)
+
+
+class ListValidator(Validator):
+    def validate(self, document):
+        text: str = document.text
+        _validate_non_empty(text)
+        if value_separator() in text:
+            try:
+                Track.split_tag(text)
+            except TagListInvalidException as e:
+                raise ValidationError(message=str(e), cursor_position=0)
+
+
+class YesNoValidator(Validator):
+    def validate(self, document):
+        text: str = document.text
+        _validate_non_empty(text)
+
+        if text.lower() not in ["y", "n"]:
+            raise ValidationError(
+                message="Answer must be 'y' or 'n'", cursor_position=1
+            )
+
+
+class NumberValidator(Validator):
+    def validate(self, document):
+        text: str = document.text
+        _validate_non_empty(text)
+
+        if text and not text.isdigit():
+            i = 0
+
+            # Get index of first non numeric character.
+            # We want to move the cursor here.
+            for i, c in enumerate(text):
+                if not c.isdigit():
+                    break
+
+            raise ValidationError(message="Input must be a number", cursor_position=i)
+
+
+def yes_no(question: str) -> bool:
+    """
+    Continuously asks a yes/no question until user input is in [yYnN].
+    Returns True or False respectively.
+    """
+
+    answer = prompt(
+        editing_mode=config.editing_mode,
+        message=question,
+        default="y",
+        validator=YesNoValidator(),
+    )
+    return answer.lower() == "y"
@@ -0,0 +1,293 @@
+"""
+Queries that select files by their tags, like
+
+    not TRACKTOTAL
+    GENRE ~ jazz and DATE < 1970
+    (ARTIST = Burial or ARTIST =~ '^Four') and not TITLE ~ remix
+
+A tag name on its own matches files that have the tag. Comparisons are
+
+    =, !=       a value of the tag is equal, no value of the tag is equal
+    <, <=, >, >=  the number of an integer tag like DATE is in the range
+    ~           a value of the tag contains the text, ignoring case
+    =~          a value of the tag matches the regular expression
+
+and can be combined with and, or, not and parentheses. Values that contain
+spaces or operators are quoted with ' or ".
+"""
+
+from __future__ import annotations
+import functools
+import re
+from typing import TYPE_CHECKING
+from audiotag.track import NUMBER_TAGS, Tag
+
+if TYPE_CHECKING:
+    from typing import NoReturn, Optional
+
+
+class InvalidQueryError(ValueError):
+    """Exception for queries that can not be compiled"""
+
+    pass
+
+
+_TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<paren>[()])
+        |(?P<operator>=~|!=|<=|>=|[=<>~])
+        |'(?P<single>[^']*)'
+        |"(?P<double>[^"]*)"
+        |(?P<word>[^\s()=!<>~'"]+)
+    )""",
+    re.VERBOSE,
+)
+_NUMBER = re.compile(r"\d+")
+_KEYWORDS = frozenset({"and", "or", "not"})
+_RANGES = frozenset({"<", "<=", ">", ">="})
+
+
+def _number(value: str) -> Optional[int]:
+    """
+    Returns the number a value starts with, so that a DATE like 1970-05-01
+    compares like 1970, or None if it does not start with one
+    """
+    match = _NUMBER.match(value.strip())
+    return int(match.group()) if match else None
+
+
+class _Node:
+    """Part of a query that decides whether the tags of a file match"""
+
+    __slots__ = ()
+
+    def matches(self, tags: dict[str, list[str]]) -> bool:
+        raise NotImplementedError()
+
+
+class _Exists(_Node):
+    __slots__ = ("tag",)
+
+    def __init__(self, tag: Tag):
+        self.tag = tag
+
+    def matches(self, tags: dict[str, list[str]]) -> bool:
+        return any(tags.get(self.tag.value, ()))
+
+
+class _Compare(_Node):
+    __slots__ = ("tag", "operator", "value", "number", "regex")
+
+    def __init__(self, tag: Tag, operator: str, value: str):
+        self.tag = tag
+        self.operator = operator
+        self.value = value
+        # Integer tags are compared by number if the value is a number
+        self.number = (
+            int(value) if tag in NUMBER_TAGS and _NUMBER.fullmatch(value) else None
+        )
+        self.regex = re.compile(value) if operator == "=~" else None
+        if operator == "~":
+            self.value = value.casefold()
+
+    def _equal(self, value: str) -> bool:
+        if self.number is not None:
+            return _number(value) == self.number
+        return value == self.value
+
+    def _in_range(self, value: str) -> bool:
+        number = _number(value)
+        if number is None or self.number is None:
+            return False
+        if self.operator == "<":
+            return number < self.number
+        if self.operator == "<=":
+            return number <= self.number
+        if self.operator == ">":
+            return number > self.number
+        return number >= self.number
+
+    def matches(self, tags: dict[str, list[str]]) -> bool:
+        values = tags.get(self.tag.value) or []
+        if self.operator == "=":
+            return any(self._equal(value) for value in values)
+        if self.operator == "!=":
+            return not any(self._equal(value) for value in values)
+        if self.operator == "~":
+            return any(self.value in value.casefold() for value in values)
+        if self.regex is not None:
+            return any(self.regex.search(value) for value in values)
+        # Only the first value of an integer tag is its number
+        return bool(values) and self._in_range(values[0])
+
+
+class _Not(_Node):
+    __slots__ = ("node",)
+
+    def __init__(self, node: _Node):
+        self.node = node
+
+    def matches(self, tags: dict[str, list[str]]) -> bool:
+        return not self.node.matches(tags)
+
+
+class _All(_Node):
+    __slots__ = ("nodes",)
+
+    def __init__(self, nodes: list[_Node]):
+        self.nodes = nodes
+
+    def matches(self, tags: dict[str, list[str]]) -> bool:
+        return all(node.matches(tags) for node in self.nodes)
+
+
+class _Any(_Node):
+    __slots__ = ("nodes",)
+
+    def __init__(self, nodes: list[_Node]):
+        self.nodes = nodes
+
+    def matches(self, tags: dict[str, list[str]]) -> bool:
+        return any(node.matches(tags) for node in self.nodes)
+
+
+class Query:
+    """
+    A query that is parsed and validated once and can then be matched against
+    the tags of any number of files. Raises InvalidQueryError if the query is
+    invalid.
+    """
+
+    query: str
+    # Tokens as kind, text and position in the query
+    _tokens: list[tuple[str, str, int]]
+    _index: int
+    _root: _Node
+
+    def __init__(self, query: str):
+        self.query = query
+        self._tokens = self._tokenize(query)
+        self._index = 0
+        if not self._tokens:
+            raise InvalidQueryError("The query is empty")
+        self._root = self._parse_or()
+        if self._index < len(self._tokens):
+            self._fail("Expected 'and' or 'or'")
+        del self._tokens
+
+    def __repr__(self) -> str:
+        return f"Query({self.query!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Query):
+            return NotImplemented
+        return self.query == other.query
+
+    def __hash__(self) -> int:
+        return hash(self.query)
+
+    def _tokenize(self, query: str) -> list[tuple[str, str, int]]:
+        tokens = []
+        position = 0
+        query = query.rstrip()
+        while position < len(query):
+            match = _TOKEN.match(query, position)
+            if match is None or match.lastgroup is None:
+                # Only a lone '!' or an unterminated quote do not match
+                start = len(query) - len(query[position:].lstrip())
+                raise InvalidQueryError(
+                    f"Unexpected '{query[start]}' at position {start + 1} "
+                    + f"in query '{query}'"
+                )
+            kind = match.lastgroup
+            if kind in {"single", "double"}:
+                kind = "value"
+            tokens.append(
+                (kind, match.group(match.lastgroup), match.start(match.lastgroup))
+            )
+            position = match.end()
+        return tokens
+
+    def _fail(self, message: str) -> NoReturn:
+        if self._index < len(self._tokens):
+            _, text, position = self._tokens[self._index]
+            found = f"'{text}' at position {position + 1}"
+        else:
+            found = "the end"
+        raise InvalidQueryError(f"{message}, found {found} in query '{self.query}'")
+
+    def _peek(self) -> Optional[tuple[str, str, int]]:
+        return self._tokens[self._index] if self._index < len(self._tokens) else None
+
+    def _keyword(self, keyword: str) -> bool:
+        """Consumes the next token if it is the keyword"""
+        token = self._peek()
+        if token is not None and token[0] == "word" and token[1].lower() == keyword:
+            self._index += 1
+            return True
+        return False
+
+    def _parse_or(self) -> _Node:
+        nodes = [self._parse_and()]
+        while self._keyword("or"):
+            nodes.append(self._parse_and())
+        return nodes[0] if len(nodes) == 1 else _Any(nodes)
+
+    def _parse_and(self) -> _Node:
+        nodes = [self._parse_not()]
+        while self._keyword("and"):
+            nodes.append(self._parse_not())
+        return nodes[0] if len(nodes) == 1 else _All(nodes)
+
+    def _parse_not(self) -> _Node:
+        if self._keyword("not"):
+            return _Not(self._parse_not())
+        return self._parse_atom()
+
+    def _parse_atom(self) -> _Node:
+        token = self._peek()
+        if token is not None and token[:2] == ("paren", "("):
+            self._index += 1
+            node = self._parse_or()
+            token = self._peek()
+            if token is None or token[:2] != ("paren", ")"):
+                self._fail("Expected ')'")
+            self._index += 1
+            return node
+        if token is None or token[0] != "word" or token[1].lower() in _KEYWORDS:
+            self._fail("Expected a tag or '('")
+        try:
+            tag = Tag(token[1].upper())
+        except ValueError:
+            self._fail(f"Expected one of the tags [{', '.join(t.value for t in Tag)}]")
+        self._index += 1
+        token = self._peek()
+        if token is None or token[0] != "operator":
+            return _Exists(tag)
+        operator = token[1]
+        self._index += 1
+        token = self._peek()
+        if token is None or token[0] not in {"word", "value"}:
+            self._fail(f"Expected a value after '{operator}'")
+        value = token[1]
+        if operator in _RANGES:
+            if tag not in NUMBER_TAGS:
+                self._fail(f"'{operator}' can only be used with integer tags")
+            if not _NUMBER.fullmatch(value):
+                self._fail(f"Expected an integer after '{operator}'")
+        try:
+            node = _Compare(tag, operator, value)
+        except re.error as e:
+            self._fail(f"Invalid regular expression: {e}")
+        self._index += 1
+        return node
+
+    def matches(self, tags: dict[str, list[str]]) -> bool:
+        """Returns whether the tags of a file match the query"""
+        return self._root.matches(tags)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_query(query: str) -> Query:
+    """Compiles a query. Recently used queries are only compiled once."""
+    return Query(query)
@@ -0,0 +1,245 @@
+"""
+Tags of files as records in JSON Lines, CSV or TSV. A record maps the field
+"path" to the path of the file and tag names to their values.
+"""
+
+from __future__ import annotations
+import csv
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING
+from audiotag.track import (
+    MULTI_VALUE_TAGS,
+    NUMBER_TAGS,
+    Tag,
+    TagListInvalidException,
+    TagPlan,
+    Track,
+)
+
+if TYPE_CHECKING:
+    from typing import Iterable, Iterator, Optional, TextIO
+
+    Record = dict[str, object]
+
+FORMATS = ("jsonl", "csv", "tsv")
+PATH_FIELD = "path"
+# Fields of CSV and TSV output if no fields are given
+DEFAULT_FIELDS = (PATH_FIELD, *(tag.value for tag in Tag))
+
+_DELIMITERS = {"csv": ",", "tsv": "\t"}
+# Other extensions of JSON Lines files
+_JSONL_SUFFIXES = {".json", ".ndjson"}
+
+
+class InvalidRecordError(ValueError):
+    """Exception for records that can not be read or applied"""
+
+    pass
+
+
+def parse_fields(text: str) -> tuple[str, ...]:
+    """
+    Parses a comma separated list of fields. Tag names are case insensitive.
+    Raises ValueError if the list is empty or contains a field twice.
+    """
+    fields = tuple(
+        PATH_FIELD if name.strip().lower() == PATH_FIELD else name.strip().upper()
+        for name in text.split(",")
+    )
+    if not all(fields):
+        raise ValueError(f"Check if the list of fields '{text}' is correct")
+    duplicates = sorted({field for field in fields if fields.count(field) > 1})
+    if duplicates:
+        raise ValueError(f"The following fields are given twice {duplicates}")
+    return fields
+
+
+def make_record(track: Track, fields: Optional[tuple[str, ...]]) -> Record:
+    """
+    Returns the record of a track. Without fields it contains all tags of the
+    track, otherwise exactly the given fields with None for missing tags.
+    """
+    tags = track.tags
+    record: Record = {PATH_FIELD: str(track.path)}
+    if fields is None:
+        record.update((name, tags[name]) for name in sorted(tags))
+    else:
+        record.update(
+            (field, tags.get(field)) for field in fields if field != PATH_FIELD
+        )
+    return record
+
+
+def write_records(
+    records: Iterable[Record],
+    output_format: str,
+    stream: TextIO,
+    fields: Optional[tuple[str, ...]] = None,
+) -> int:
+    """
+    Writes every record to stream as soon as it is produced and returns the
+    number of records. CSV and TSV have a header line with the fields and join
+    multiple values like Track.join_tag.
+    """
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown format '{output_format}'")
+    count = 0
+    if output_format == "jsonl":
+        for record in records:
+            stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+        return count
+
+    columns = fields or DEFAULT_FIELDS
+    writer = csv.writer(
+        stream, delimiter=_DELIMITERS[output_format], lineterminator="\n"
+    )
+    writer.writerow(columns)
+    for record in records:
+        row: list[str] = []
+        for column in columns:
+            value = record.get(column)
+            if value is None:
+                row.append("")
+            elif isinstance(value, list):
+                row.append(Track.join_tag(value))
+            else:
+                row.append(str(value))
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def is_jsonl(path: Path) -> bool:
+    """Returns whether path has an extension of JSON Lines files"""
+    suffix = path.suffix.lower()
+    return suffix == ".jsonl" or suffix in _JSONL_SUFFIXES
+
+
+def format_of(path: Path) -> str:
+    """
+    Returns the format of a file of records based on its extension.
+    Raises ValueError if the extension is unknown.
+    """
+    suffix = path.suffix.lower()
+    if is_jsonl(path):
+        return "jsonl"
+    if suffix.lstrip(".") in FORMATS:
+        return suffix.lstrip(".")
+    raise ValueError(
+        f"Unknown format of '{path}'. Possible extensions "
+        + f"[{', '.join(sorted({*(f'.{f}' for f in FORMATS), *_JSONL_SUFFIXES}))}]"
+    )
+
+
+def read_records(stream: TextIO, input_format: str) -> Iterator[tuple[int, Record]]:
+    """
+    Reads one record after the other from stream and yields it together with
+    its line number. Empty cells of CSV and TSV are read as empty strings.
+    Raises InvalidRecordError if a record can not be read.
+    """
+    if input_format not in FORMATS:
+        raise ValueError(f"Unknown format '{input_format}'")
+    if input_format == "jsonl":
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise InvalidRecordError(f"Line {number}: {e}")
+            if not isinstance(record, dict):
+                raise InvalidRecordError(f"Line {number}: Expected a JSON object")
+            yield number, record
+        return
+
+    reader = csv.DictReader(stream, delimiter=_DELIMITERS[input_format], restval="")
+    for row in reader:
+        if None in row:
+            raise InvalidRecordError(
+                f"Line {reader.line_num}: More cells than fields in the header"
+            )
+        yield reader.line_num, dict(row)
+
+
+def read_paths(path: Path) -> Iterator[str]:
+    """
+    Lazily reads the paths of the records in a file of records like the report
+    of failed files, so that it can be used as a list of files.
+    """
+    with open(path, newline="") as stream:
+        for number, record in read_records(stream, format_of(path)):
+            value = record.get(PATH_FIELD)
+            if not isinstance(value, str) or not value:
+                raise InvalidRecordError(f"Line {number}: Missing field '{PATH_FIELD}'")
+            yield value
+
+
+def _values(tag: Tag, value: object) -> list[str]:
+    """Validates a value of a record and converts it to the values of the tag"""
+    values: list[object]
+    if isinstance(value, str) and tag not in NUMBER_TAGS:
+        return Track.parse_value(tag, value)
+    values = value if isinstance(value, list) else [value]
+    if not values:
+        raise ValueError(f"Expected at least one value for {tag.value}")
+    if len(values) > 1 and tag not in MULTI_VALUE_TAGS:
+        raise ValueError(f"{tag.value} can only have a single value")
+    if tag in NUMBER_TAGS:
+        first = values[0]
+        try:
+            if isinstance(first, bool) or not isinstance(first, (int, str)):
+                raise ValueError()
+            number = int(first)
+        except ValueError:
+            raise ValueError(f"{tag.value} must be an integer, got {first!r}")
+        if number <= 0:
+            raise ValueError(f"{tag.value} must be positive, got {number}")
+        return [str(number)]
+    for v in values:
+        if not isinstance(v, str) or not v:
+            raise ValueError(f"Invalid value {v!r} for {tag.value}")
+    return [str(v) for v in values]
+
+
+def plan_of(record: Record) -> tuple[Path, TagPlan]:
+    """
+    Returns the path and the changes to the tags of a record. Tag names are
+    case insensitive. Tags with a value of None are removed and tags with an
+    empty string are left unchanged. Raises ValueError and
+    TagListInvalidException if the record is invalid.
+    """
+    path = record.get(PATH_FIELD)
+    if not isinstance(path, str) or not path:
+        raise ValueError(f"Missing field '{PATH_FIELD}'")
+    values: dict[Tag, list[str]] = {}
+    remove_tags: set[Tag] = set()
+    for name, value in record.items():
+        if name == PATH_FIELD:
+            continue
+        try:
+            tag = Tag(name.upper())
+        except ValueError:
+            raise ValueError(
+                f"Unknown tag '{name}'. Possible values [{', '.join(t.value for t in Tag)}]"
+            )
+        if tag in values or tag in remove_tags:
+            raise ValueError(f"{tag.value} is given twice")
+        if value is None:
+            remove_tags.add(tag)
+        elif value != "":
+            values[tag] = _values(tag, value)
+    return Path(path), TagPlan(remove_tags=remove_tags, set_values=values)
+
+
+def read_plans(stream: TextIO, input_format: str) -> Iterator[tuple[Path, TagPlan]]:
+    """
+    Reads the changes of every record of stream like plan_of.
+    Raises InvalidRecordError with the line number if a record is invalid.
+    """
+    for number, record in read_records(stream, input_format):
+        try:
+            yield plan_of(record)
+        except (TagListInvalidException, ValueError) as e:
+            raise InvalidRecordError(f"Line {number}: {e}")
@@ -0,0 +1,565 @@
+"""
+Renaming of many files at once. A plan orders the renames so that no file of
+the plan is overwritten before it has been renamed itself and breaks cycles
+like swaps through temporary names. Plans are executed with a journal, so an
+interrupted run can be resumed or rolled back.
+"""
+
+from __future__ import annotations
+import errno
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Callable, Iterable, Iterator, Optional, TextIO
+
+# Maximum number of steps that may run at the same time
+WAVE_SIZE = 256
+# Size of the blocks in which files are copied to another filesystem
+COPY_BUFFER = 1024 * 1024
+
+
+class RenameInterruptedError(Exception):
+    """
+    Exception for renames that stopped before all steps were done. failed
+    holds the files that could not be renamed together with their errors.
+    """
+
+    failed: list[tuple[Path, str]]
+
+    def __init__(self, message: str, failed: Optional[list[tuple[Path, str]]] = None):
+        super().__init__(message)
+        self.failed = failed or []
+
+
+class RenameLockedError(Exception):
+    """Exception for journals that are used by another rename"""
+
+    pass
+
+
+class _Listings:
+    """
+    Names of the files in directories. Every directory is only listed once,
+    afterwards the listing is updated instead of asking the filesystem.
+    """
+
+    _names: dict[Path, set[str]]
+
+    def __init__(self):
+        self._names = {}
+
+    def names(self, directory: Path) -> set[str]:
+        names = self._names.get(directory)
+        if names is None:
+            try:
+                names = set(os.listdir(directory))
+            except (FileNotFoundError, NotADirectoryError):
+                names = set()
+            self._names[directory] = names
+        return names
+
+    def exists(self, path: Path) -> bool:
+        return path.name in self.names(path.parent)
+
+    def temporary(self, path: Path) -> Path:
+        """Returns and reserves a free temporary name in the directory of path"""
+        names = self.names(path.parent)
+        number = 0
+        while True:
+            name = f".{path.name}.audiotag-{number}"
+            if name not in names:
+                names.add(name)
+                return path.with_name(name)
+            number += 1
+
+
+class RenamePlan:
+    """
+    Renames of files ordered such that they can be done one after the other.
+    Renames of several files to the same name and renames to a file of the
+    plan that is not renamed itself are reported and skipped. Other existing
+    files are only overwritten if overwrite returns True for them and are
+    moved to a temporary name until all renames are done.
+    """
+
+    steps: list[tuple[Path, Path]]
+    displaced: list[Path]
+    directories: list[Path]
+    renamed: int
+    skipped: int
+
+    def __init__(
+        self,
+        renames: Iterable[tuple[Path, Path]],
+        overwrite: Callable[[Path], bool],
+    ):
+        self.steps = []
+        self.displaced = []
+        self.renamed = 0
+        self.skipped = 0
+        listings = _Listings()
+
+        moves: dict[Path, Path] = {}
+        inputs: set[Path] = set()
+        targets: dict[Path, list[Path]] = {}
+        for old, new in renames:
+            if old in inputs:
+                continue
+            inputs.add(old)
+            if old == new:
+                self.skipped += 1
+                continue
+            moves[old] = new
+            targets.setdefault(new, []).append(old)
+
+        for new, olds in targets.items():
+            if len(olds) > 1:
+                print(
+                    f"Files '{', '.join(str(old) for old in olds)}' would all "
+                    + f"be renamed to '{str(new)}'"
+                )
+                for old in olds:
+                    del moves[old]
+                    self.skipped += 1
+
+        by_target = {new: old for old, new in moves.items()}
+        displace: list[Path] = []
+        for first in list(moves):
+            # Skipping a rename keeps its file in place, which in turn blocks
+            # the rename to that name
+            source: Optional[Path] = first
+            while source is not None and source in moves:
+                target = moves[source]
+                if target in moves or not listings.exists(target):
+                    break
+                if target not in inputs and overwrite(target):
+                    displace.append(target)
+                    break
+                if target in inputs:
+                    print(
+                        f"File '{str(source)}' can not be renamed to "
+                        + f"'{str(target)}', because that file is not renamed"
+                    )
+                del moves[source]
+                self.skipped += 1
+                source = by_target.get(source)
+
+        for path in displace:
+            temporary = listings.temporary(path)
+            self.steps.append((path, temporary))
+            self.displaced.append(temporary)
+        self.renamed = len(moves)
+        self._order(moves, by_target, listings)
+        self.directories = _missing_directories(dst.parent for _, dst in self.steps)
+
+    def _order(
+        self, moves: dict[Path, Path], by_target: dict[Path, Path], listings: _Listings
+    ) -> None:
+        """
+        Appends the moves to the steps. Every target can only be the target of
+        a single move, so the moves form chains and cycles. Chains are done
+        from their end and cycles are broken up with a temporary name.
+        """
+        pending = dict(moves)
+
+        def _chain(old: Optional[Path]) -> None:
+            while old is not None and old in pending:
+                self.steps.append((old, pending.pop(old)))
+                old = by_target.get(old)
+
+        for old, new in moves.items():
+            if old in pending and new not in pending:
+                _chain(old)
+        while pending:
+            old, new = next(iter(pending.items()))
+            temporary = listings.temporary(old)
+            self.steps.append((old, temporary))
+            del pending[old]
+            _chain(by_target.get(old))
+            self.steps.append((temporary, new))
+
+    def execute(self, journal_path: Path, jobs: int = 1) -> None:
+        """
+        Creates the missing directories and moves up to jobs files at the same
+        time while keeping a journal at journal_path, which is removed once
+        all files are renamed.
+        Raises RenameInterruptedError if a file can not be renamed.
+        """
+        if not self.steps:
+            return
+        journal = Journal(journal_path, self.steps, self.displaced, self.directories)
+        journal.begin()
+        journal.resume(jobs=jobs, interrupted=False)
+
+
+def _missing_directories(directories: Iterable[Path]) -> list[Path]:
+    """
+    Returns the directories and their parents that do not exist yet, parents
+    first. Every directory is only checked once.
+    """
+    checked: set[Path] = set()
+    missing: list[Path] = []
+    for directory in directories:
+        while directory not in checked:
+            checked.add(directory)
+            if directory.is_dir():
+                break
+            missing.append(directory)
+            directory = directory.parent
+    return sorted(missing, key=lambda d: len(d.parts))
+
+
+class Journal:
+    """
+    Write-ahead log of a rename plan. All steps and the directories to create
+    are written before the first file is renamed and every finished step is
+    appended, so an interrupted run can be resumed or rolled back.
+    """
+
+    path: Path
+    steps: list[tuple[Path, Path]]
+    displaced: list[Path]
+    directories: list[Path]
+    done: set[int]
+    _stream: Optional[TextIO]
+
+    def __init__(
+        self,
+        path: Path,
+        steps: list[tuple[Path, Path]],
+        displaced: list[Path],
+        directories: Optional[list[Path]] = None,
+        done: Optional[set[int]] = None,
+    ):
+        self.path = path
+        self.steps = steps
+        self.displaced = displaced
+        self.directories = [] if directories is None else directories
+        self.done = set() if done is None else done
+        self._stream = None
+
+    @classmethod
+    def load(cls, path: Path) -> Journal:
+        """
+        Reads the journal at path. Raises OSError if it can not be read and
+        ValueError if it is invalid.
+        """
+        steps: list[tuple[Path, Path]] = []
+        displaced: list[Path] = []
+        directories: list[Path] = []
+        done: set[int] = set()
+        begun = False
+        with open(path) as stream:
+            for line in stream:
+                # The last line may be incomplete if the run was interrupted
+                # while writing it
+                if not line.endswith("\n"):
+                    break
+                entry = json.loads(line)
+                if "move" in entry:
+                    src, dst = entry["move"]
+                    steps.append((Path(src), Path(dst)))
+                elif "delete" in entry:
+                    displaced.append(Path(entry["delete"]))
+                elif "mkdir" in entry:
+                    directories.append(Path(entry["mkdir"]))
+                elif "begin" in entry:
+                    begun = True
+                elif "done" in entry:
+                    done.add(int(entry["done"]))
+                else:
+                    raise ValueError(f"Invalid entry in journal '{path}': {entry}")
+        if not begun:
+            # Nothing is renamed before the whole plan is written
+            return cls(path, [], [])
+        return cls(path, steps, displaced, directories, done)
+
+    def _write(self, entry: dict[str, object]) -> None:
+        assert self._stream is not None
+        self._stream.write(json.dumps(entry) + "\n")
+        self._stream.flush()
+
+    def _sync(self) -> None:
+        """
+        Makes the entries written so far durable. Entries are synced in
+        batches before files are renamed, so no rename that is done can be
+        missing from the journal after a crash.
+        """
+        assert self._stream is not None
+        os.fsync(self._stream.fileno())
+
+    def begin(self) -> None:
+        """
+        Writes the plan to a new journal.
+        Raises FileExistsError if there already is a journal.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._stream = open(self.path, "x")
+        for src, dst in self.steps:
+            self._write({"move": [str(src), str(dst)]})
+        for path in self.displaced:
+            self._write({"delete": str(path)})
+        for directory in self.directories:
+            self._write({"mkdir": str(directory)})
+        self._write({"begin": len(self.steps)})
+        self._sync()
+        _fsync_directory(self.path.parent)
+
+    def _finish(self) -> None:
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        self.path.unlink()
+
+    def _is_done(self, step: tuple[Path, Path]) -> bool:
+        """
+        Returns whether a step was done without being logged, because the run
+        was interrupted in between
+        """
+        src, dst = step
+        return not os.path.lexists(src) and os.path.lexists(dst)
+
+    def _pending(self, interrupted: bool) -> list[int]:
+        """
+        Returns the steps that are not done. Only the steps of the first wave
+        can have been running when the run was interrupted, so only they are
+        checked for being done without being logged.
+        """
+        pending = [i for i in range(len(self.steps)) if i not in self.done]
+        if not interrupted:
+            return pending
+        running = next(_waves(self.steps, pending), [])
+        unlogged = {i for i in running if self._is_done(self.steps[i])}
+        return [i for i in pending if i not in unlogged]
+
+    def resume(self, jobs: int = 1, interrupted: bool = True) -> None:
+        """
+        Does all steps that are not done yet with up to jobs files at the same
+        time. Then the overwritten files and the directories that were emptied
+        are deleted and the journal is removed.
+        Raises RenameInterruptedError if a file can not be renamed.
+        """
+        if self._stream is None:
+            self._stream = open(self.path, "a")
+        for directory in self.directories:
+            directory.mkdir(exist_ok=True)
+
+        pending = self._pending(interrupted)
+        for index in sorted(set(range(len(self.steps))) - self.done - set(pending)):
+            self._write({"done": index})
+            self.done.add(index)
+        for wave in _waves(self.steps, pending):
+            self._sync()
+            errors = []
+            failed = []
+            for index, error in _run_wave(self.steps, wave, jobs):
+                if error is None:
+                    self._write({"done": index})
+                    self.done.add(index)
+                else:
+                    src, dst = self.steps[index]
+                    errors.append(
+                        f"Unable to rename '{str(src)}' to '{str(dst)}': {error}"
+                    )
+                    failed.append((src, str(error)))
+            if errors:
+                self._stream.close()
+                self._stream = None
+                raise RenameInterruptedError("\n".join(errors), failed)
+
+        # Deleting the overwritten files can not be reverted
+        self._sync()
+        for path in self.displaced:
+            if os.path.lexists(path):
+                os.remove(path)
+        _remove_empty(src.parent for src, _ in self.steps)
+        self._finish()
+
+    def rollback(self) -> None:
+        """
+        Reverts all steps that are done in reverse order, removes the created
+        directories and the journal. Steps that can not be reverted are
+        reported and skipped.
+        """
+        pending = set(self._pending(interrupted=True))
+        for index in reversed(range(len(self.steps))):
+            if index in pending:
+                continue
+            src, dst = self.steps[index]
+            if os.path.lexists(src) or not os.path.lexists(dst):
+                print(f"Unable to rename '{str(dst)}' back to '{str(src)}'")
+                continue
+            # The directory may have been removed after it was emptied
+            src.parent.mkdir(parents=True, exist_ok=True)
+            move(dst, src)
+        _remove_empty(self.directories)
+        self._finish()
+
+
+class JournalLock:
+    """
+    Lock that a rename holds while it uses a journal, so that two renames do
+    not use the same journal at the same time. The lock is released by the
+    operating system if the process dies, so it never has to be cleaned up.
+    """
+
+    journal: Path
+    path: Path
+    _fd: Optional[int]
+
+    def __init__(self, journal: Path):
+        self.journal = journal
+        self.path = journal.with_name(journal.name + ".lock")
+        self._fd = None
+
+    def __repr__(self) -> str:
+        return f"JournalLock('{str(self.journal)}')"
+
+    def __enter__(self) -> JournalLock:
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.release()
+
+    def acquire(self) -> None:
+        """Takes the lock. Raises RenameLockedError if another rename holds it."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if not _try_lock(fd):
+            os.close(fd)
+            raise RenameLockedError(
+                f"Another rename is running with the journal in '{str(self.journal)}'"
+            )
+        self._fd = fd
+
+    def release(self) -> None:
+        """Releases the lock if it is held"""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def _try_lock(fd: int) -> bool:
+    """Locks the open file without waiting and returns whether it worked"""
+    if sys.platform == "win32":
+        import msvcrt
+
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+    import fcntl
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _fsync_directory(directory: Path) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def move(src: Path, dst: Path) -> None:
+    """
+    Moves a file. If src and dst are on different filesystems, the file is
+    copied, the copy is synced to disk and only then src is removed.
+    """
+    try:
+        os.rename(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    temporary = dst.with_name(f".{dst.name}.audiotag-copy")
+    try:
+        with open(src, "rb") as source, open(temporary, "wb") as target:
+            shutil.copyfileobj(source, target, COPY_BUFFER)
+            target.flush()
+            os.fsync(target.fileno())
+        shutil.copystat(src, temporary)
+        os.replace(temporary, dst)
+    except BaseException:
+        if os.path.lexists(temporary):
+            os.remove(temporary)
+        raise
+    _fsync_directory(dst.parent)
+    os.remove(src)
+
+
+def _waves(
+    steps: list[tuple[Path, Path]], indices: Iterable[int]
+) -> Iterator[list[int]]:
+    """
+    Splits the steps into waves of at most WAVE_SIZE steps in their order. The
+    steps of a wave do not share any path, so they can run at the same time.
+    """
+    wave: list[int] = []
+    paths: set[Path] = set()
+    for index in indices:
+        src, dst = steps[index]
+        if src in paths or dst in paths or len(wave) >= WAVE_SIZE:
+            yield wave
+            wave = []
+            paths = set()
+        wave.append(index)
+        paths.update((src, dst))
+    if wave:
+        yield wave
+
+
+def _move_step(step: tuple[Path, Path]) -> Optional[OSError]:
+    try:
+        move(*step)
+    except OSError as e:
+        return e
+    return None
+
+
+def _run_wave(
+    steps: list[tuple[Path, Path]], wave: list[int], jobs: int
+) -> Iterator[tuple[int, Optional[OSError]]]:
+    """Does the steps of a wave and yields every step with its error if any"""
+    if jobs == 1 or len(wave) == 1:
+        for index in wave:
+            yield index, _move_step(steps[index])
+        return
+    # Moving files waits for the filesystem, so threads are enough
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        yield from zip(wave, executor.map(_move_step, (steps[i] for i in wave)))
+
+
+def _remove_empty(directories: Iterable[Path]) -> None:
+    """
+    Removes the directories that are empty and then their parents that were
+    emptied by that, the deepest ones first. Parents are only removed below
+    the deepest directory that contains all directories, so patterns that move
+    files further up do not remove anything above it.
+    """
+    absolute = {Path(os.path.abspath(directory)) for directory in directories}
+    if not absolute:
+        return
+    root = Path(os.path.commonpath(list(absolute)))
+    for directory in sorted(absolute, key=lambda d: len(d.parts), reverse=True):
+        while True:
+            try:
+                directory.rmdir()
+            except OSError:
+                break
+            directory = directory.parent
+            if root not in directory.parents:
+                break
@@ -0,0 +1,262 @@
+"""
+A server that runs commands for clients on a Unix socket, so that every
+command does not have to pay for starting the interpreter, importing the
+modules and reading the config file. The client hands its stdin, stdout and
+stderr to the server, so the output of a command goes straight to the
+client's terminal or pipe.
+
+The client only uses the standard library and is kept apart from the rest of
+audiotag, so that it starts as fast as possible.
+"""
+
+from __future__ import annotations
+import array
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Optional, Sequence, TextIO
+
+# Maximum size of a request, which holds the arguments of a command
+MAX_REQUEST = 1024 * 1024
+
+# Commands that can not be run by the server
+_REFUSED = {"interactive", "serve", "watch"}
+
+
+def _send(connection: socket.socket, message: dict[str, object]) -> None:
+    connection.sendall(json.dumps(message).encode() + b"\n")
+
+
+def _receive(connection: socket.socket) -> dict[str, object]:
+    """Reads a message terminated by a newline. Raises ValueError if it is invalid"""
+    data = b""
+    while not data.endswith(b"\n"):
+        block = connection.recv(4096)
+        if not block:
+            raise ValueError("Connection closed before the whole message was sent")
+        data += block
+    message = json.loads(data)
+    if not isinstance(message, dict):
+        raise ValueError("Expected a JSON object")
+    return message
+
+
+def _send_fds(connection: socket.socket, data: bytes, fds: list[int]) -> None:
+    """
+    Sends data together with the file descriptors fds. Works like
+    socket.send_fds, which is not available before Python 3.9.
+    """
+    connection.sendmsg(
+        [data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))]
+    )
+
+
+def _recv_fds(
+    connection: socket.socket, size: int, max_fds: int
+) -> tuple[bytes, list[int]]:
+    """
+    Receives up to size bytes and up to max_fds file descriptors. Works like
+    socket.recv_fds, which is not available before Python 3.9.
+    """
+    fds = array.array("i")
+    data, ancillary, _, _ = connection.recvmsg(
+        size, socket.CMSG_SPACE(max_fds * fds.itemsize)
+    )
+    for level, kind, fd_data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            # Leave out a truncated descriptor at the end
+            fds.frombytes(fd_data[: len(fd_data) - len(fd_data) % fds.itemsize])
+    return data, list(fds)
+
+
+def request(socket_path: Path, argv: Sequence[str]) -> Optional[int]:
+    """
+    Runs a command on the server listening on socket_path and returns its
+    exit status. Returns None if no server is listening.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            connection.connect(str(socket_path))
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        data = json.dumps({"argv": list(argv), "cwd": os.getcwd()}).encode() + b"\n"
+        _send_fds(connection, data, [0, 1, 2])
+        try:
+            status = _receive(connection).get("status")
+        except (OSError, ValueError) as e:
+            print(f"The server did not finish the command: {e}", file=sys.stderr)
+            return 1
+        return status if isinstance(status, int) else 1
+    finally:
+        connection.close()
+
+
+def client_main(argv: Sequence[str]) -> int:
+    """
+    Runs the command on the server if one is listening and falls back to
+    running it in this process otherwise. argv starts with --client, which
+    may give the socket as --client=SOCKET.
+    """
+    option, _, socket_arg = argv[0].partition("=")
+    if option != "--client":
+        raise ValueError(f"Expected --client, got '{argv[0]}'")
+    if socket_arg:
+        socket_path = Path(socket_arg)
+    else:
+        from audiotag import config
+
+        socket_path = config.server_socket
+    status = request(socket_path, argv[1:])
+    if status is not None:
+        return status
+    from audiotag.audiotag import main
+
+    return main(argv[1:])
+
+
+class Server:
+    """
+    Server that runs one command after the other. Commands change the working
+    directory and the standard streams of the process while they run, so they
+    can not run at the same time.
+    """
+
+    path: Path
+    _socket: socket.socket
+    _running: bool
+
+    def __init__(self, path: Path, cache_size: Optional[int]):
+        """
+        Listens on the socket at path and keeps the tags of the cache_size
+        most recently used files in memory, or none if it is None. Raises
+        FileExistsError if another server is listening on path.
+        """
+        from audiotag import cache
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(str(path))
+            except ConnectionRefusedError:
+                # Left behind by a server that did not shut down
+                path.unlink()
+            else:
+                raise FileExistsError(f"A server is already listening on '{path}'")
+            finally:
+                probe.close()
+        self.path = path
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(str(path))
+        os.chmod(path, 0o600)
+        self._socket.listen()
+        self._running = True
+        cache.enable_memory(cache_size)
+
+    def __repr__(self) -> str:
+        return f"Server('{str(self.path)}')"
+
+    def serve_forever(self) -> None:
+        """
+        Runs the commands of the clients until close is called. The socket is
+        removed when it returns.
+        """
+        try:
+            while self._running:
+                connection, _ = self._socket.accept()
+                with connection:
+                    if self._running:
+                        self.handle(connection)
+        finally:
+            self._socket.close()
+            self.path.unlink(missing_ok=True)
+
+    def handle(self, connection: socket.socket) -> None:
+        """Runs the command of a client and sends its exit status back"""
+        try:
+            data, fds = _recv_fds(connection, MAX_REQUEST, 3)
+        except OSError:
+            return
+        streams = []
+        try:
+            if len(fds) != 3 or not data.endswith(b"\n"):
+                _send(connection, {"status": 1})
+                return
+            streams = [
+                open(fds[0], "r", closefd=True),
+                open(fds[1], "w", closefd=True),
+                open(fds[2], "w", closefd=True),
+            ]
+            fds = []
+            message = json.loads(data)
+            status = self._run(message["argv"], message["cwd"], *streams)
+            _send(connection, {"status": status})
+        except (OSError, ValueError, KeyError):
+            pass
+        finally:
+            for fd in fds:
+                os.close(fd)
+            for stream in streams:
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+
+    def _run(
+        self, argv: list[str], cwd: str, stdin: TextIO, stdout: TextIO, stderr: TextIO
+    ) -> int:
+        """Runs a command with the given working directory and streams"""
+        import contextlib
+        import traceback
+        from prompt_toolkit.application.current import create_app_session
+        from audiotag.audiotag import make_parser, execute
+
+        old_cwd = os.getcwd()
+        old_stdin = sys.stdin
+        try:
+            os.chdir(cwd)
+            sys.stdin = stdin
+            # prompt_toolkit keeps the stdout it first writes to in a session
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(
+                stderr
+            ), create_app_session():
+                try:
+                    parser = make_parser()
+                    args = vars(parser.parse_args(argv))
+                    if args["command"] in _REFUSED:
+                        parser.error(f"{args['command']} can not be run with --client")
+                    return execute(parser, args)
+                except SystemExit as e:
+                    if e.code is None or isinstance(e.code, int):
+                        return e.code or 0
+                    print(e.code, file=sys.stderr)
+                    return 1
+                except Exception:
+                    traceback.print_exc()
+                    return 1
+                finally:
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+        finally:
+            sys.stdin = old_stdin
+            os.chdir(old_cwd)
+
+    def close(self) -> None:
+        """Stops serve_forever once the current command is done"""
+        if not self._running:
+            return
+        self._running = False
+        # Wake up serve_forever if it is waiting for a client
+        wake = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            wake.connect(str(self.path))
+        except OSError:
+            pass
+        finally:
+            wake.close()
@@ -0,0 +1,89 @@
+"""
+Sharding of batches across machines. Every file belongs to exactly one of the
+shards, so the same command can run once per shard without any overlap.
+"""
+
+from __future__ import annotations
+import hashlib
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, TypeVar, cast
+
+if TYPE_CHECKING:
+    from typing import Callable, Iterable, Iterator, Optional
+
+T = TypeVar("T")
+
+
+class Shard:
+    """
+    One of count shards, numbered from 1. Files are assigned to shards by a
+    stable hash of their path relative to root, which defaults to the current
+    directory, so machines that mount the files at different locations agree
+    as long as they run the command from the same place relative to them.
+    """
+
+    index: int
+    count: int
+    root: str
+
+    def __init__(self, index: int, count: int, root: Optional[Path] = None):
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f"Invalid shard {index}/{count}")
+        self.index = index
+        self.count = count
+        self.root = os.path.abspath(root or os.curdir)
+
+    def __repr__(self) -> str:
+        return f"Shard({self.index}, {self.count}, root='{self.root}')"
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    @staticmethod
+    def parse(text: str) -> tuple[int, int]:
+        """
+        Parses a shard given as K/N. Raises ValueError if it is not a pair of
+        integers with 1 <= K <= N.
+        """
+        index, _, count = text.partition("/")
+        try:
+            shard = int(index), int(count)
+        except ValueError:
+            raise ValueError(f"Expected a shard like 1/4, got '{text}'")
+        if shard[1] < 1 or not 1 <= shard[0] <= shard[1]:
+            raise ValueError(f"Shard must be between 1/N and N/N, got '{text}'")
+        return shard
+
+    def number_of(self, path: Path) -> int:
+        """Returns the number of the shard the file at path belongs to"""
+        relative = os.path.relpath(os.path.abspath(path), self.root)
+        # The hash of str is salted per process, so it can not be used
+        digest = hashlib.blake2b(
+            os.fsencode(relative.replace(os.sep, "/")), digest_size=8
+        ).digest()
+        return int.from_bytes(digest, "big") % self.count + 1
+
+    def contains(self, path: Path) -> bool:
+        """Returns whether the file at path belongs to this shard"""
+        return self.number_of(path) == self.index
+
+    def select(
+        self, items: Iterable[T], key: Optional[Callable[[T], Path]] = None
+    ) -> Iterator[T]:
+        """
+        Lazily yields the items whose file belongs to this shard. key returns
+        the path of an item and defaults to the item itself.
+        """
+        for item in items:
+            if self.contains(cast(Path, item) if key is None else key(item)):
+                yield item
+
+    def report_path(self, path: Path) -> Path:
+        """
+        Returns the path of the report of this shard, so that shards on shared
+        storage do not overwrite each other's report
+        """
+        return path.with_name(
+            f"{path.stem}.shard-{self.index}-of-{self.count}{path.suffix}"
+        )
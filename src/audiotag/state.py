@@ -0,0 +1,125 @@
+"""
+State of incremental runs. A state file records which files an operation was
+applied to, so that the next run with the same parameters only opens the files
+that are new or were modified since.
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import sqlite3
+    from typing import Iterable, Iterator
+
+
+class StateFile:
+    """
+    Persistent record of the files an operation was applied to. An entry is
+    only valid as long as the parameters of the operation and the modification
+    time, size and inode of the file match.
+    """
+
+    path: Path
+    operation: str
+    # Number of files that were left out by changed
+    unchanged: int
+    # Number of files that were passed on by changed
+    changed_files: int
+    _connection: sqlite3.Connection
+
+    def __init__(self, path: Path, parameters: object):
+        # Only import sqlite3 if incremental runs are actually used
+        import sqlite3
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.operation = self.operation_of(parameters)
+        self.unchanged = 0
+        self.changed_files = 0
+        self._connection = sqlite3.connect(path, isolation_level=None, timeout=30)
+        # Every file is committed on its own, which WAL keeps cheap
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT NOT NULL, "
+            "operation TEXT NOT NULL, "
+            "mtime_ns INTEGER NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "inode INTEGER NOT NULL, "
+            "PRIMARY KEY (path, operation))"
+        )
+
+    def __repr__(self) -> str:
+        return f"StateFile('{str(self.path)}', operation='{self.operation}')"
+
+    @staticmethod
+    def operation_of(parameters: object) -> str:
+        """
+        Returns a hash of the parameters of an operation. Parameters have to
+        be serializable as JSON, sets are sorted first.
+        """
+
+        def _default(value: object) -> object:
+            if isinstance(value, (set, frozenset)):
+                return sorted(value)
+            return str(value)
+
+        text = json.dumps(parameters, sort_keys=True, default=_default)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    @staticmethod
+    def _key(path: Path) -> str:
+        return os.path.abspath(path)
+
+    def is_unchanged(self, path: Path, stat: os.stat_result) -> bool:
+        """Returns whether the operation was applied to the file as it is now"""
+        row = self._connection.execute(
+            "SELECT 1 FROM files WHERE path = ? AND operation = ? AND mtime_ns = ? "
+            "AND size = ? AND inode = ?",
+            (
+                self._key(path),
+                self.operation,
+                stat.st_mtime_ns,
+                stat.st_size,
+                stat.st_ino,
+            ),
+        ).fetchone()
+        return row is not None
+
+    def put(self, path: Path, stat: os.stat_result) -> None:
+        """Records that the operation was applied to the file"""
+        self._connection.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+            (
+                self._key(path),
+                self.operation,
+                stat.st_mtime_ns,
+                stat.st_size,
+                stat.st_ino,
+            ),
+        )
+
+    def changed(self, paths: Iterable[Path]) -> Iterator[Path]:
+        """
+        Lazily yields the paths of the files that are new or were modified
+        since the operation was applied to them. Files that can not be
+        accessed are passed on, so that they are reported when opened.
+        """
+        for path in paths:
+            try:
+                unchanged = self.is_unchanged(path, os.stat(path))
+            except OSError:
+                unchanged = False
+            if unchanged:
+                self.unchanged += 1
+            else:
+                self.changed_files += 1
+                yield path
+
+    def close(self) -> None:
+        self._connection.close()
@@ -1,21 +1,36 @@
 from __future__ import annotations
 import functools
-import math
+import os
 from typing import TYPE_CHECKING
 from enum import Enum
 from pathlib import Path
 import taglib
-from prompt_toolkit.formatted_text import html
-from audiotag import config
+from audiotag import cache, config
 
 if TYPE_CHECKING:
-    from typing import Optional, Any
+    from typing import Optional, Any, Iterable
+    from prompt_toolkit.formatted_text import html
+    from audiotag.pattern import FilenamePattern
 
-VALUE_SEP = 2 * config.value_sep
+# Separator of multiple values in a single string. It is resolved by
+# __getattr__, so the config is only read when it is needed.
+VALUE_SEP: str
+
+
+def value_separator() -> str:
+    """Returns the separator of multiple values in a single string"""
+    return 2 * config.value_sep
+
+
+def __getattr__(name: str) -> str:
+    if name == "VALUE_SEP":
+        return value_separator()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class TagListInvalidException(Exception):
     def __init__(self, index: int, input: str):
+        super().__init__(index, input)
         self.index = index
         self.input = input
 
@@ -40,15 +55,109 @@ class Tag(Enum):
     TRACKTOTAL = "TRACKTOTAL"
 
 
+# Tags that may contain multiple values separated by VALUE_SEP
+MULTI_VALUE_TAGS = frozenset({Tag.ARTIST, Tag.ALBUMARTIST, Tag.GENRE})
+# Tags whose value is a positive integer
+NUMBER_TAGS = frozenset(
+    {Tag.DATE, Tag.DISCNUMBER, Tag.DISCTOTAL, Tag.TRACKNUMBER, Tag.TRACKTOTAL}
+)
+
+
+def _first(values: Optional[list[str]]) -> str:
+    return values[0] if values else ""
+
+
+def _to_int(values: Optional[list[str]]) -> int:
+    try:
+        return int(values[0]) if values else 0
+    except ValueError:
+        return 0
+
+
+class TagView:
+    """
+    Parsed values of the common tags of a track. Missing tags are represented
+    by empty strings, lists containing an empty string or 0. Values that are
+    not valid integers are also 0.
+    """
+
+    __slots__ = (
+        "album",
+        "album_artist",
+        "artist",
+        "date",
+        "discnumber",
+        "disctotal",
+        "encoder",
+        "genre",
+        "title",
+        "tracknumber",
+        "tracktotal",
+    )
+
+    album: str
+    album_artist: list[str]
+    artist: list[str]
+    date: int
+    discnumber: int
+    disctotal: int
+    encoder: str
+    genre: list[str]
+    title: str
+    tracknumber: int
+    tracktotal: int
+
+    def __init__(self, tags: dict[str, list[str]]):
+        self.album = _first(tags.get(Tag.ALBUM.value))
+        self.album_artist = tags.get(Tag.ALBUMARTIST.value) or [""]
+        self.artist = tags.get(Tag.ARTIST.value) or [""]
+        self.date = _to_int(tags.get(Tag.DATE.value))
+        self.discnumber = _to_int(tags.get(Tag.DISCNUMBER.value))
+        self.disctotal = _to_int(tags.get(Tag.DISCTOTAL.value))
+        self.encoder = _first(tags.get(Tag.ENCODER.value))
+        self.genre = tags.get(Tag.GENRE.value) or [""]
+        self.title = _first(tags.get(Tag.TITLE.value))
+        self.tracknumber = _to_int(tags.get(Tag.TRACKNUMBER.value))
+        self.tracktotal = _to_int(tags.get(Tag.TRACKTOTAL.value))
+
+
 @functools.total_ordering
 class Track:
 
-    _file: taglib.File
+    _handle: Optional[taglib.File]
+    _cached_tags: Optional[dict[str, list[str]]]
+    _saved: bool
+    _snapshot: dict[str, list[str]]
+    _view: Optional[TagView]
     path: Path
 
     def __init__(self, path: Path):
-        self._file = taglib.File(str(path))
+        """
+        Opens the file with taglib. If the tag cache is enabled and holds an
+        entry for the unchanged file, the file is only opened once it is
+        modified. A snapshot of the tags is taken to detect changes.
+        """
         self.path = path
+        self._handle = None
+        self._cached_tags = None
+        self._saved = False
+        self._view = None
+        tag_cache = cache.current()
+        if tag_cache is None:
+            self._handle = taglib.File(str(path))
+        else:
+            stat = os.stat(path)
+            self._cached_tags = tag_cache.get(path, stat)
+            if self._cached_tags is None:
+                self._handle = taglib.File(str(path))
+                tag_cache.put(path, stat, self._handle.tags)
+        self._take_snapshot()
+
+    def __enter__(self) -> Track:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
 
     def __lt__(self, other: Track) -> bool:
         return self.path < other.path
@@ -64,8 +173,9 @@ class Track:
     @staticmethod
     def split_tag(input_text: str) -> list[Any]:
         """Splits a string that contains a separator into a list"""
-        input_list = input_text.split(VALUE_SEP)
-        value_sep_half = list(VALUE_SEP)[0]
+        value_sep = value_separator()
+        input_list = input_text.split(value_sep)
+        value_sep_half = value_sep[0]
         input_split = [
             v.replace(f"\\{value_sep_half}", value_sep_half) for v in input_list
         ]
@@ -75,15 +185,20 @@ class Track:
                 raise TagListInvalidException(index=i, input=input_text)
         return input_split
 
+    @staticmethod
+    def join_tag(values: list[str]) -> str:
+        """Joins values into a string that Track.split_tag splits up again"""
+        value_sep = value_separator()
+        escaped_sep = "".join(f"\\{c}" for c in value_sep)
+        return value_sep.join(v.replace(value_sep, escaped_sep) for v in values)
+
     @property
     def encoder(self) -> str:
-        encoder = self._get_tag(Tag.ENCODER)
-        return encoder[0] if encoder else ""
+        return self.tag_view.encoder
 
     @property
     def artist(self) -> list[str]:
-        artist = self._get_tag(Tag.ARTIST)
-        return artist if artist else [""]
+        return self.tag_view.artist
 
     @artist.setter
     def artist(self, artist: list[str]) -> None:
@@ -91,8 +206,7 @@ class Track:
 
     @property
     def album_artist(self) -> list[str]:
-        albumartist = self._get_tag(Tag.ALBUMARTIST)
-        return albumartist if albumartist else [""]
+        return self.tag_view.album_artist
 
     @album_artist.setter
     def album_artist(self, album_artist: list[str]) -> None:
@@ -100,11 +214,7 @@ class Track:
 
     @property
     def date(self) -> int:
-        date = self._get_tag(Tag.DATE)
-        try:
-            return int(date[0]) if date else 0
-        except ValueError:
-            return 0
+        return self.tag_view.date
 
     @date.setter
     def date(self, date: int) -> None:
@@ -112,8 +222,7 @@ class Track:
 
     @property
     def genre(self) -> list[str]:
-        genre = self._get_tag(Tag.GENRE)
-        return genre if genre else [""]
+        return self.tag_view.genre
 
     @genre.setter
     def genre(self, genre: list[str]) -> None:
@@ -121,8 +230,7 @@ class Track:
 
     @property
     def album(self) -> str:
-        album = self._get_tag(Tag.ALBUM)
-        return album[0] if album else ""
+        return self.tag_view.album
 
     @album.setter
     def album(self, album: str) -> None:
@@ -130,8 +238,7 @@ class Track:
 
     @property
     def title(self) -> str:
-        title = self._get_tag(Tag.TITLE)
-        return title[0] if title else ""
+        return self.tag_view.title
 
     @title.setter
     def title(self, title: str) -> None:
@@ -139,11 +246,7 @@ class Track:
 
     @property
     def tracknumber(self) -> int:
-        tracknumber = self._get_tag(Tag.TRACKNUMBER)
-        try:
-            return int(tracknumber[0]) if tracknumber else 0
-        except ValueError:
-            return 0
+        return self.tag_view.tracknumber
 
     @tracknumber.setter
     def tracknumber(self, tracknumber: int) -> None:
@@ -157,11 +260,7 @@ class Track:
 
     @property
     def tracktotal(self) -> int:
-        tracktotal = self._get_tag(Tag.TRACKTOTAL)
-        try:
-            return int(tracktotal[0]) if tracktotal else 0
-        except ValueError:
-            return 0
+        return self.tag_view.tracktotal
 
     @tracktotal.setter
     def tracktotal(self, tracktotal: int) -> None:
@@ -175,8 +274,7 @@ class Track:
 
     @property
     def discnumber(self) -> int:
-        discnumber = self._get_tag(Tag.DISCNUMBER)
-        return int(discnumber[0]) if discnumber else 0
+        return self.tag_view.discnumber
 
     @discnumber.setter
     def discnumber(self, discnumber: int) -> None:
@@ -190,8 +288,7 @@ class Track:
 
     @property
     def disctotal(self) -> int:
-        disctotal = self._get_tag(Tag.DISCTOTAL)
-        return int(disctotal[0]) if disctotal else 0
+        return self.tag_view.disctotal
 
     @disctotal.setter
     def disctotal(self, disctotal: int) -> None:
@@ -203,33 +300,96 @@ class Track:
             )
         self._file.tags[Tag.DISCTOTAL.value] = [str(disctotal)]
 
+    @property
+    def _file(self) -> taglib.File:
+        """
+        The taglib file. It is opened on first access if the tags were cached.
+        All changes to the tags go through it, so accessing it invalidates the
+        parsed tags.
+        """
+        self._view = None
+        if self._handle is None:
+            self._handle = taglib.File(str(self.path))
+        return self._handle
+
+    @property
+    def tags(self) -> dict[str, list[str]]:
+        """
+        All tags of the file. They are served from the tag cache if the file
+        has not been opened.
+        """
+        tags: dict[str, list[str]]
+        if self._handle is not None:
+            tags = self._handle.tags
+        elif self._cached_tags is not None:
+            tags = self._cached_tags
+        else:
+            tags = self._file.tags
+        return tags
+
+    @property
+    def tag_view(self) -> TagView:
+        """The parsed common tags. They are parsed again after any change."""
+        if self._view is None:
+            self._view = TagView(self.tags)
+        return self._view
+
     def _get_tag(self, tag: Tag) -> Optional[list[str]]:
         """
         Returns the given tag as a list of strings or None if the tag is missing
         """
         if not self.has_tag(tag):
             return None
-        tag_val: list[str] = self._file.tags[tag.value]
+        tag_val: list[str] = self.tags[tag.value]
         return tag_val
 
-    def save(self) -> None:
+    def _take_snapshot(self) -> None:
+        self._snapshot = {tag: list(value) for tag, value in self.tags.items()}
+
+    def is_modified(self) -> bool:
+        """Returns whether the tags differ from the ones in the file"""
+        return self.tags != self._snapshot
+
+    def save(self) -> bool:
+        """
+        Writes the tags to the file if they have been modified.
+        Returns whether the file was written.
+        """
+        if not self.is_modified():
+            return False
         self._file.save()
+        self._saved = True
+        self._take_snapshot()
+        return True
 
     def close(self) -> None:
-        self._file.close()
+        if self._handle is None:
+            return
+        self._handle.close()
+        # taglib only flushes the file when it is closed, so the new stat
+        # result is not known before
+        tag_cache = cache.current()
+        if self._saved and tag_cache is not None:
+            tag_cache.put(self.path, os.stat(self.path), self._handle.tags)
+        self._saved = False
+        # The tags can still be read, and changing them opens the file again
+        self._cached_tags = self._handle.tags
+        self._handle = None
 
     def tags_string(self) -> str:
         """Format tags as a human readable string"""
         string = f"Filename: {str(self.path)}\n"
-        for tag, value in self._file.tags.items():
+        for tag, value in self.tags.items():
             string += f"{tag}: {', '.join([f'{v}' for v in value])}\n"
         return string
 
     def tags_html(self) -> html.HTML:
         """Format tags as a HTML string. The content is the same as Track.tags_string()"""
+        from prompt_toolkit.formatted_text import html
+
         path_escaped = html.html_escape(str(self.path))
         string = f"<tag>Filename</tag>: <path>{path_escaped}</path>\n"
-        for tag, value in self._file.tags.items():
+        for tag, value in self.tags.items():
             value_escaped = [html.html_escape(v) for v in value]
             value_format = (
                 ", ".join(
@@ -245,82 +405,64 @@ class Track:
         """Format tags as HTML or str"""
         return self.tags_html() if as_html else self.tags_string()
 
-    def format_filename(self, pattern: Optional[str] = None) -> str:
-        """Format a string according to the given format string"""
-        missing_tags: list[Tag] = [
-            tag
-            for tag in {
-                Tag.ARTIST,
-                Tag.TITLE,
-                Tag.ALBUM,
-                Tag.DATE,
-                Tag.GENRE,
-                Tag.TRACKNUMBER,
-                Tag.TRACKTOTAL,
-                Tag.DISCNUMBER,
-                Tag.DISCTOTAL,
-            }
-            if not self.has_tag(tag)
-        ]
-        if missing_tags:
-            raise ValueError(
-                f"The following tags are missing {[t.value for t in missing_tags]}"
-            )
+    def format_filename(self, pattern: Optional[str | FilenamePattern] = None) -> str:
+        """
+        Format the filename according to the given pattern. Defaults to the
+        configured pattern for single or multi disc releases.
+        """
+        # Imported here because the pattern module depends on Tag
+        from audiotag.pattern import compile_pattern, default_pattern
 
         if not pattern:
-            pattern = (
-                config.pattern_single_disc
-                if self.disctotal <= 1
-                else config.pattern_multi_disc
-            )
+            compiled = default_pattern(self)
+        elif isinstance(pattern, str):
+            compiled = compile_pattern(pattern)
+        else:
+            compiled = pattern
+        return compiled.format(self)
 
-        def replace_forbidden(text: str) -> str:
-            return text.replace("/", "-")
-
-        def pad(number: int, total: int) -> str:
-            num_leading_zeros = int(math.log10(total)) + 1
-            return str(number).zfill(num_leading_zeros)
-
-        formatted_str = pattern.format_map(
-            {
-                "A": replace_forbidden("-".join(self.artist)),
-                "T": replace_forbidden(self.title),
-                "L": replace_forbidden(self.album),
-                "Y": str(self.date),
-                "G": replace_forbidden("-".join(self.genre)),
-                "N": pad(number=self.tracknumber, total=self.tracktotal),
-                "D": pad(number=self.discnumber, total=self.disctotal),
-                "NO": str(self.tracktotal),
-                "DO": str(self.disctotal),
-            }
-        )
-        if formatted_str == pattern:
-            raise ValueError(f"Check if pattern '{pattern}' is correct")
-        return formatted_str
+    @staticmethod
+    def parse_value(tag: Tag, value: str | int) -> list[str]:
+        """
+        Converts a value given for a tag into the list of strings stored in the
+        file. Values of tags that may have multiple values are split.
+        """
+        if isinstance(value, int):
+            return [str(value)]
+        elif tag in MULTI_VALUE_TAGS:
+            return Track.split_tag(value)
+        return [value]
 
-    def set_tags(self, tags: dict[Tag, str | int]) -> bool | Any:
+    def set_tags(self, tags: dict[Tag, str | int]) -> bool:
         """Set the new tags from the given dictionary and return if the tags have changed"""
-        old_tags = self._file.tags.copy()
-        for tag, value in tags.items():
-            if isinstance(value, int):
-                self._file.tags[tag.value] = [str(value)]
-            elif tag in [Tag.ARTIST, Tag.ALBUMARTIST, Tag.GENRE]:
-                value_list: list[str] = Track.split_tag(value)
-                self._file.tags[tag.value] = value_list
-            else:
-                self._file.tags[tag.value] = [value]
-        return not self._file.tags == old_tags
-
-    def remove_tags(self, tags: set[Tag]) -> bool | Any:
+        return self.set_values(
+            {tag: Track.parse_value(tag, value) for tag, value in tags.items()}
+        )
+
+    def set_values(self, values: dict[Tag, list[str]]) -> bool:
+        """
+        Set the tags to the given, already parsed values and return if the tags
+        have changed
+        """
+        modified = False
+        for tag, value_list in values.items():
+            if self.tags.get(tag.value) != value_list:
+                self._file.tags[tag.value] = list(value_list)
+                modified = True
+        return modified
+
+    def remove_tags(self, tags: Iterable[Tag]) -> bool:
         """Remove the given Tags and return if the taglist was actually modified"""
-        old_tags = self._file.tags.copy()
+        modified = False
         for tag in tags:
-            self._file.tags.pop(tag.value)
-        return not self._file.tags == old_tags
+            if tag.value in self.tags:
+                self._file.tags.pop(tag.value)
+                modified = True
+        return modified
 
     def has_tag(self, tag: Tag) -> bool:
         """Returns whether a tag is set"""
-        return tag.value in self._file.tags
+        return tag.value in self.tags
 
     def clear_tags(self, keep: Optional[set[Tag]] = None) -> None:
         """
@@ -328,11 +470,10 @@ class Track:
         to ENCODER.
         """
         keep = {Tag.ENCODER} if keep is None else keep
-        self._file.tags = {
-            tag.value: self._file.tags[tag.value]
-            for tag in keep
-            if tag.value in self._file.tags
-        }
+        tags = self.tags
+        new_tags = {tag.value: tags[tag.value] for tag in keep if tag.value in tags}
+        if new_tags != tags:
+            self._file.tags = new_tags
 
     def copy_tags(self, source: Track, omit_tags: Optional[set[Tag]] = None) -> None:
         """
@@ -343,7 +484,7 @@ class Track:
         omit_tags_str = {tag.value for tag in omit_tags}
         new_tags = {
             key: value
-            for (key, value) in source._file.tags.items()
+            for (key, value) in source.tags.items()
             if key not in omit_tags_str
         }
 
@@ -351,4 +492,46 @@ class Track:
             value = self._get_tag(tag)
             if value:
                 new_tags[tag.value] = value
-        self._file.tags = new_tags
+        if new_tags != self.tags:
+            self._file.tags = new_tags
+
+
+class TagPlan:
+    """
+    Changes to the tags that are parsed and validated once and can then be
+    applied to any number of tracks. Values in set_values are used as they are.
+    Raises TagListInvalidException if a list value is invalid and ValueError
+    if a tag is both set and removed.
+    """
+
+    set_values: dict[Tag, list[str]]
+    remove: frozenset[Tag]
+
+    def __init__(
+        self,
+        set_tags: Optional[dict[Tag, str | int]] = None,
+        remove_tags: Optional[set[Tag]] = None,
+        set_values: Optional[dict[Tag, list[str]]] = None,
+    ):
+        set_tags = {} if set_tags is None else set_tags
+        self.set_values = {
+            tag: Track.parse_value(tag, value) for tag, value in set_tags.items()
+        }
+        if set_values is not None:
+            self.set_values.update(set_values)
+        self.remove = frozenset(() if remove_tags is None else remove_tags)
+        conflicts = self.remove & self.set_values.keys()
+        if conflicts:
+            raise ValueError(
+                "The following tags are both set and removed "
+                + f"{sorted(t.value for t in conflicts)}"
+            )
+
+    def __repr__(self) -> str:
+        return f"TagPlan(set_values={self.set_values!r}, remove={set(self.remove)!r})"
+
+    def apply(self, track: Track) -> bool:
+        """Apply the changes to the track and return if its tags have changed"""
+        set_modified = track.set_values(self.set_values)
+        del_modified = track.remove_tags(self.remove)
+        return set_modified or del_modified
@@ -1,18 +1,14 @@
 from __future__ import annotations
+import os
+import sys
 from pathlib import Path
 from typing import TYPE_CHECKING
-from prompt_toolkit.formatted_text import html
-from prompt_toolkit.formatted_text.base import FormattedText, to_formatted_text
-from prompt_toolkit.application.current import get_app
-from prompt_toolkit.shortcuts.prompt import prompt
-from prompt_toolkit.shortcuts.utils import print_formatted_text
-from prompt_toolkit.validation import ValidationError, Validator
-from audiotag import styles
 import audiotag.config as config
-from audiotag.track import TagListInvalidException, Track, VALUE_SEP
+from audiotag.track import Track
 
 if TYPE_CHECKING:
-    pass
+    from typing import Collection, Iterable, Iterator, Optional
+    from prompt_toolkit.formatted_text import html
 
 
 class NoSuchDirectoryError(Exception):
@@ -23,100 +19,46 @@ class NoAudioFilesFoundError(Exception):
     pass
 
 
-def formatted_text_from_str(text: str) -> FormattedText:
-    """
-    Creates FormattedText from a string containing HTML tags
-    """
-    return to_formatted_text(html.HTML(text))
-
-
-def get_toolbar_text():
-    text = get_app().current_buffer.text
-    if VALUE_SEP not in text:
-        return html.HTML(
-            f"<b>Hint</b>: Use '<i>{VALUE_SEP}</i>' to input multiple values"
-        )
-    else:
-        values = text.split(VALUE_SEP)
-        values_escaped = [
-            html.html_escape(v.replace(f"\\{VALUE_SEP}", VALUE_SEP)) for v in values
-        ]
-        return formatted_text_from_str(
-            f"<b>Values</b>: <u>{'</u>, <u>'.join(values_escaped)}</u>"
-        )
-
-
-def _validate_non_empty(text: str):
-    if not text:
-        raise ValidationError(message="Input must not be empty", cursor_position=0)
-
-
-class NonEmptyValidator(Validator):
-    def validate(self, document):
-        text: str = document.text
-        _validate_non_empty(text)
+# Size of the blocks in which lists of files are read
+READ_SIZE = 64 * 1024
 
+# Default number of seconds between two scans of a directory that is watched
+# without inotify
+POLL_INTERVAL = 2.0
 
-class ListValidator(Validator):
-    def validate(self, document):
-        text: str = document.text
-        _validate_non_empty(text)
-        if VALUE_SEP in text:
-            try:
-                Track.split_tag(text)
-            except TagListInvalidException as e:
-                raise ValidationError(message=str(e), cursor_position=0)
+# Default number of seconds a watched file must not change before it is
+# processed, so that files that are still being copied are left alone
+SETTLE_TIME = 2.0
 
 
-class YesNoValidator(Validator):
-    def validate(self, document):
-        text: str = document.text
-        _validate_non_empty(text)
-
-        if text.lower() not in ["y", "n"]:
-            raise ValidationError(
-                message="Answer must be 'y' or 'n'", cursor_position=1
-            )
-
-
-class NumberValidator(Validator):
-    def validate(self, document):
-        text: str = document.text
-        _validate_non_empty(text)
-
-        if text and not text.isdigit():
-            i = 0
-
-            # Get index of first non numeric character.
-            # We want to move the cursor here.
-            for i, c in enumerate(text):
-                if not c.isdigit():
-                    break
-
-            raise ValidationError(message="Input must be a number", cursor_position=i)
-
-
-def yes_no(question: str) -> bool:
+def read_file_list(source: str, null: bool = False) -> Iterator[str]:
     """
-    Continuously asks a yes/no question until user input is in [yYnN].
-    Returns True or False respectively.
+    Lazily reads filenames from the file source or from stdin if source is
+    "-". Filenames are separated by newlines or by NUL characters if null is
+    set. Names are decoded like os.fsdecode, so any name can be read.
     """
-
-    answer = prompt(
-        editing_mode=config.editing_mode,
-        message=question,
-        default="y",
-        validator=YesNoValidator(),
-    )
-    return answer.lower() == "y"
-
-
-def strings_to_paths(strings: list[str]) -> list[Path]:
-    """Converts a list of filenames in string form into a list of paths"""
-    return [Path(string) for string in strings]
-
-
-def open_tracks(paths: list[Path]) -> list[Track]:
+    separator = b"\0" if null else b"\n"
+    # Reading the file descriptor returns whatever is available, so names are
+    # passed on as soon as they arrive through a pipe
+    fd = sys.stdin.fileno() if source == "-" else os.open(source, os.O_RDONLY)
+    try:
+        rest = b""
+        while block := os.read(fd, READ_SIZE):
+            *names, rest = (rest + block).split(separator)
+            yield from (os.fsdecode(name) for name in names if name)
+        if rest:
+            yield os.fsdecode(rest)
+    finally:
+        if source != "-":
+            os.close(fd)
+
+
+def strings_to_paths(strings: Iterable[str]) -> Iterator[Path]:
+    """Lazily converts filenames in string form into paths"""
+    return (Path(string) for string in strings)
+
+
+def open_tracks(paths: Iterable[Path]) -> list[Track]:
     """
     Opens all files in the param filenames with taglib.
     Raises NoAudioFilesFoundError if no files can be opened.
@@ -139,20 +81,110 @@ def list_files(directory: Path) -> list[Path]:
     Returns a list of all the files in a given directory.
     Raises DirectoryEmptyError if directory does not exist.
     """
-    if not directory.exists() or directory.is_file():
+    if not directory.is_dir():
+        raise NoSuchDirectoryError(f"Directory '{directory}' does not exist.")
+
+    # DirEntry.is_file() uses the file type from the directory listing and
+    # only needs a stat call for symlinks
+    with os.scandir(directory) as entries:
+        return [Path(entry.path) for entry in entries if entry.is_file()]
+
+
+def walk_files(
+    directory: Path,
+    extensions: Optional[Collection[str]] = None,
+    seen: Optional[set[tuple[int, int]]] = None,
+) -> Iterator[Path]:
+    """
+    Lazily yields the audio files in directory and all its subdirectories in
+    sorted order. Only files whose suffix is in extensions are returned, which
+    defaults to config.audio_extensions. Hardlinks to a file that has already
+    been returned are skipped. The set of seen (device, inode) pairs can be
+    shared between several walks. Symlinks to directories are not followed.
+    Raises NoSuchDirectoryError if directory does not exist.
+    """
+    if not directory.is_dir():
         raise NoSuchDirectoryError(f"Directory '{directory}' does not exist.")
+    extensions = config.audio_extensions if extensions is None else extensions
+    seen = set() if seen is None else seen
+
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        # Inode numbers are only unique per device. Stat the directory once
+        # instead of every file in it.
+        device = os.stat(current).st_dev
+        with os.scandir(current) as entries:
+            children = sorted(entries, key=lambda entry: entry.name)
+
+        subdirectories: list[Path] = []
+        for entry in children:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(Path(entry.path))
+                continue
+            if os.path.splitext(entry.name)[1].lower() not in extensions:
+                continue
+            if not entry.is_file():
+                continue
+            if entry.is_symlink():
+                stat = entry.stat()
+                key = (stat.st_dev, stat.st_ino)
+            else:
+                key = (device, entry.inode())
+            if key in seen:
+                continue
+            seen.add(key)
+            yield Path(entry.path)
+        stack.extend(reversed(subdirectories))
+
+
+def collect_paths(files: Iterable[str], recursive: bool = False) -> Iterator[Path]:
+    """
+    Lazily converts filenames in string form into paths. If recursive is set,
+    directories are replaced by the audio files they contain.
+    """
+    seen: set[tuple[int, int]] = set()
+    for path in strings_to_paths(files):
+        if recursive and path.is_dir():
+            yield from walk_files(path, seen=seen)
+        else:
+            yield path
+
+
+def _files(count: int) -> str:
+    return f"{count} file" if count == 1 else f"{count} files"
 
-    children = [child for child in directory.iterdir() if child.is_file()]
-    return children
+
+def print_summary(results: Iterable[bool], action: str = "written") -> None:
+    """
+    Consumes the results of a batch, which state whether a file was changed,
+    and prints how many files were changed and how many were skipped
+    """
+    changed = 0
+    skipped = 0
+    for result in results:
+        if result:
+            changed += 1
+        else:
+            skipped += 1
+    print(f"{_files(changed)} {action}, {_files(skipped)} skipped")
 
 
 def print_to_console(text: str | html.HTML) -> None:
     """
     Prints the given text as styled if it is HTML or plain text if it is a str
     """
+    if isinstance(text, str):
+        print(text)
+        return
+
+    # prompt_toolkit takes long to import and is only needed for styled output
+    from prompt_toolkit.formatted_text import html
+    from prompt_toolkit.formatted_text.base import to_formatted_text
+    from prompt_toolkit.shortcuts.utils import print_formatted_text
+    from audiotag import styles
+
     if isinstance(text, html.HTML):
         print_formatted_text(to_formatted_text(text), style=styles.style_track)
-    elif isinstance(text, str):
-        print(text)
     else:
         raise ValueError(f"Expected str or HTML, got {type(text)}")
@@ -0,0 +1,448 @@
+"""
+Watching a directory for audio files that are written or moved into it, so
+that rules can be applied to new files as they arrive instead of scanning the
+whole directory again and again.
+"""
+
+from __future__ import annotations
+from collections import OrderedDict
+import os
+from pathlib import Path
+import select
+import struct
+import time
+from typing import TYPE_CHECKING
+from audiotag import config, records
+from audiotag.pattern import FilenamePattern, compile_pattern
+from audiotag.track import Tag, TagPlan, Track
+from audiotag.util import (
+    POLL_INTERVAL,
+    SETTLE_TIME,
+    NoSuchDirectoryError,
+    walk_files,
+)
+
+if TYPE_CHECKING:
+    import configparser
+    import ctypes
+    from typing import Iterable, Optional
+
+# Number of processed files the debouncer remembers, so that the events
+# caused by writing and renaming them do not make them processed again
+RECENT = 4096
+
+# Constants of inotify from <sys/inotify.h>
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_DONT_FOLLOW = 0x02000000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = (
+    _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_ONLYDIR | _IN_DONT_FOLLOW
+)
+# wd, mask, cookie and len of struct inotify_event, followed by len bytes of name
+_EVENT = struct.Struct("iIII")
+
+_RULES_SECTIONS = ("clean", "set", "rename")
+
+
+def _version(stat: os.stat_result) -> tuple[int, int, int]:
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def _is_audio(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in config.audio_extensions
+
+
+class Rules:
+    """
+    Changes applied to every new file, read from an INI file with up to three
+    sections, which are applied in this order:
+
+        [clean]
+        keep = ENCODER, ALBUM
+
+        [set]
+        GENRE = Jazz
+        DATE
+
+        [rename]
+        pattern = {A}/{L}/{N} - {T}
+        overwrite = no
+
+    clean removes all tags but the ones in keep, which defaults to ENCODER.
+    set sets tags like a record of a manifest, a tag without a value is
+    removed. rename renames files like the rename command, pattern defaults
+    to the patterns of the config file and existing files are only
+    overwritten if overwrite is set.
+    """
+
+    path: Path
+    clean: bool
+    keep: Optional[set[Tag]]
+    plan: Optional[TagPlan]
+    rename: bool
+    pattern: Optional[FilenamePattern]
+    overwrite: bool
+
+    def __init__(self, path: Path):
+        """
+        Reads the rules from the INI file at path. Raises OSError if it can
+        not be read and ValueError or TagListInvalidException if it is invalid.
+        """
+        import configparser
+
+        self.path = path
+        parser = configparser.ConfigParser(allow_no_value=True, interpolation=None)
+        try:
+            with open(path) as stream:
+                parser.read_file(stream)
+        except configparser.Error as e:
+            raise ValueError(f"Invalid rules in '{str(path)}': {e}")
+        unknown = [name for name in parser.sections() if name not in _RULES_SECTIONS]
+        if unknown:
+            raise ValueError(
+                f"Unknown section '{unknown[0]}' in '{str(path)}'. "
+                + f"Possible values [{', '.join(_RULES_SECTIONS)}]"
+            )
+        if not parser.sections():
+            raise ValueError(f"No rules in '{str(path)}'")
+
+        self.clean = parser.has_section("clean")
+        self.keep = None
+        if self.clean:
+            self._check_options(parser, "clean", {"keep"})
+            keep = parser.get("clean", "keep", fallback=None)
+            if keep is not None:
+                self.keep = {
+                    self._tag(name) for name in keep.split(",") if name.strip()
+                }
+
+        self.plan = None
+        if parser.has_section("set"):
+            record: dict[str, object] = dict(parser.items("set"))
+            record[records.PATH_FIELD] = str(path)
+            self.plan = records.plan_of(record)[1]
+
+        self.rename = parser.has_section("rename")
+        self.pattern = None
+        self.overwrite = False
+        if self.rename:
+            self._check_options(parser, "rename", {"pattern", "overwrite"})
+            pattern = parser.get("rename", "pattern", fallback=None)
+            if pattern:
+                self.pattern = compile_pattern(pattern)
+            else:
+                compile_pattern(config.pattern_single_disc)
+                compile_pattern(config.pattern_multi_disc)
+            self.overwrite = parser.getboolean("rename", "overwrite", fallback=False)
+
+    def __repr__(self) -> str:
+        return f"Rules('{str(self.path)}')"
+
+    @staticmethod
+    def _check_options(
+        parser: configparser.ConfigParser, section: str, allowed: set[str]
+    ) -> None:
+        for option in parser.options(section):
+            if option not in allowed:
+                raise ValueError(
+                    f"Unknown option '{option}' in section '{section}'. "
+                    + f"Possible values [{', '.join(sorted(allowed))}]"
+                )
+
+    @staticmethod
+    def _tag(name: str) -> Tag:
+        try:
+            return Tag(name.strip().upper())
+        except ValueError:
+            raise ValueError(
+                f"Unknown tag '{name.strip()}'. "
+                + f"Possible values [{', '.join(t.value for t in Tag)}]"
+            )
+
+    def apply(self, track: Track) -> tuple[bool, Optional[Path]]:
+        """
+        Applies the rules to the track and writes it. Returns whether it was
+        written and its new path if it is to be renamed. The new name is
+        formatted before the file is written, so a file whose tags are not
+        enough for the pattern is left alone.
+        """
+        if self.clean:
+            track.clear_tags(keep=self.keep)
+        if self.plan is not None:
+            self.plan.apply(track)
+        new_path: Optional[Path] = None
+        if self.rename:
+            new_path = Path(
+                os.path.normpath(
+                    track.path.parent
+                    / (track.format_filename(self.pattern) + track.path.suffix)
+                )
+            )
+        return track.save(), new_path
+
+
+class Debouncer:
+    """
+    Holds back files until they have not changed for settle seconds. A file
+    that is still being written keeps changing its modification time or size
+    and is only passed on once the writer is done.
+    """
+
+    settle: float
+    _pending: dict[Path, tuple[float, Optional[tuple[int, int, int]]]]
+    _done: OrderedDict[str, tuple[int, int, int]]
+
+    def __init__(self, settle: float = SETTLE_TIME):
+        self.settle = settle
+        self._pending = {}
+        self._done = OrderedDict()
+
+    def __repr__(self) -> str:
+        return f"Debouncer(settle={self.settle})"
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @staticmethod
+    def _stat(path: Path) -> Optional[tuple[int, int, int]]:
+        try:
+            return _version(os.stat(path))
+        except OSError:
+            return None
+
+    def touch(self, paths: Iterable[Path], now: Optional[float] = None) -> None:
+        """Records that the files were changed at now, which defaults to the time"""
+        now = time.monotonic() if now is None else now
+        for path in paths:
+            self._pending[path] = now, self._stat(path)
+
+    def timeout(self, now: Optional[float] = None) -> Optional[float]:
+        """Returns the time until the next file may settle or None if none is held"""
+        if not self._pending:
+            return None
+        now = time.monotonic() if now is None else now
+        earliest = min(touched for touched, _ in self._pending.values())
+        return max(0.0, earliest + self.settle - now)
+
+    def ready(self, now: Optional[float] = None) -> list[Path]:
+        """
+        Returns the files that have settled in sorted order and forgets them.
+        Files that are gone or were last changed by done are dropped.
+        """
+        now = time.monotonic() if now is None else now
+        settled = []
+        for path, (touched, version) in list(self._pending.items()):
+            if now - touched < self.settle:
+                continue
+            current = self._stat(path)
+            if current != version:
+                # Changed without an event, like files seen by polling
+                self._pending[path] = now, current
+                continue
+            del self._pending[path]
+            if current is None or self._done.get(os.path.abspath(path)) == current:
+                continue
+            settled.append(path)
+        return sorted(settled)
+
+    def done(self, path: Path) -> None:
+        """Records that the file was processed, so that it is not passed on again"""
+        version = self._stat(path)
+        if version is None:
+            return
+        key = os.path.abspath(path)
+        self._done[key] = version
+        self._done.move_to_end(key)
+        while len(self._done) > RECENT:
+            self._done.popitem(last=False)
+
+
+class PollingWatcher:
+    """
+    Finds audio files that are new or changed by scanning the directory tree
+    every interval seconds. Works on every platform and file system, but the
+    cost of a scan grows with the number of files.
+    """
+
+    directory: Path
+    interval: float
+    # Scans compare all files, so no changes are ever lost
+    events_lost = False
+    _files: dict[Path, tuple[int, int, int]]
+    _next_scan: float
+
+    def __init__(self, directory: Path, interval: float = POLL_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self._files = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def __repr__(self) -> str:
+        return f"PollingWatcher('{str(self.directory)}', interval={self.interval})"
+
+    def _scan(self) -> dict[Path, tuple[int, int, int]]:
+        files = {}
+        for path in walk_files(self.directory):
+            try:
+                files[path] = _version(os.stat(path))
+            except OSError:
+                continue
+        return files
+
+    def wait(self, timeout: Optional[float] = None) -> list[Path]:
+        """
+        Waits until the next scan or at most timeout seconds and returns the
+        files that are new or changed since the last scan
+        """
+        delay = max(0.0, self._next_scan - time.monotonic())
+        if timeout is not None and timeout < delay:
+            time.sleep(timeout)
+            return []
+        time.sleep(delay)
+        self._next_scan = time.monotonic() + self.interval
+        files = self._scan()
+        changed = [
+            path for path, version in files.items() if self._files.get(path) != version
+        ]
+        self._files = files
+        return changed
+
+    def close(self) -> None:
+        self._files = {}
+
+
+class InotifyWatcher:
+    """
+    Finds audio files that are closed after being written or moved into the
+    directory tree with inotify, which is only available on Linux. Files in
+    directories that are created or moved into the tree are found as well.
+    """
+
+    directory: Path
+    events_lost: bool
+    _libc: ctypes.CDLL
+    _fd: int
+    _watches: dict[int, str]
+
+    def __init__(self, directory: Path):
+        """
+        Watches the directory tree. Raises OSError if inotify is not available
+        or the directory can not be watched.
+        """
+        import ctypes
+        import ctypes.util
+
+        if not directory.is_dir():
+            raise NoSuchDirectoryError(f"Directory '{directory}' does not exist.")
+        self.directory = directory
+        self.events_lost = False
+        self._watches = {}
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            init = self._libc.inotify_init1
+        except (OSError, AttributeError):
+            raise OSError("inotify is not available")
+        self._fd = init(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"Unable to start inotify: {os.strerror(error)}")
+        try:
+            self._add_tree(str(directory))
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def __repr__(self) -> str:
+        return f"InotifyWatcher('{str(self.directory)}')"
+
+    def _add(self, directory: str) -> None:
+        import ctypes
+
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), directory)
+        self._watches[wd] = directory
+
+    def _add_tree(self, directory: str) -> list[Path]:
+        """
+        Watches directory and all directories below it. Returns the audio files
+        they already contain, which may have arrived before the watch.
+        """
+        found: list[Path] = []
+        for current, subdirectories, files in os.walk(directory):
+            self._add(current)
+            found.extend(Path(current, name) for name in files if _is_audio(name))
+        return found
+
+    def wait(self, timeout: Optional[float] = None) -> list[Path]:
+        """
+        Waits for events for at most timeout seconds and returns the audio
+        files that were written or moved in. All files are returned and
+        events_lost is set until the next wait if events were lost.
+        """
+        self.events_lost = False
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        paths: list[Path] = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            end = offset + length
+            name = os.fsdecode(data[offset:end].rstrip(b"\0"))
+            offset = end
+            if mask & _IN_Q_OVERFLOW:
+                self.events_lost = True
+                return list(walk_files(self.directory))
+            if mask & _IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, name)
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    try:
+                        paths.extend(self._add_tree(path))
+                    except OSError:
+                        # The directory is gone again
+                        continue
+            elif mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO) and _is_audio(name):
+                paths.append(Path(path))
+        return paths
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        self._watches = {}
+
+
+def open_watcher(
+    directory: Path, poll: bool = False, interval: float = POLL_INTERVAL
+) -> InotifyWatcher | PollingWatcher:
+    """
+    Returns an inotify watcher for directory and falls back to polling every
+    interval seconds if inotify is not available or poll is set. Raises
+    NoSuchDirectoryError if directory does not exist.
+    """
+    if not directory.is_dir():
+        raise NoSuchDirectoryError(f"Directory '{directory}' does not exist.")
+    if not poll:
+        try:
+            return InotifyWatcher(directory)
+        except OSError:
+            pass
+    return PollingWatcher(directory, interval)
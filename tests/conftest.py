@@ -3,9 +3,15 @@ from enum import Enum
 from pathlib import Path
 import shutil
 import sys
+from typing import TYPE_CHECKING
 import pytest
+from audiotag import cache, config
 from audiotag.track import Track
 
+if TYPE_CHECKING:
+    from typing import Iterator
+    from audiotag.cache import TagCache
+
 
 class Files(Enum):
     value: str
@@ -73,3 +79,38 @@ def fixture_audio_file(tmp_path: Path) -> Track:
     track.disctotal = FakeTag.DISCTOTAL.value
     track.save()
     return track
+
+
+@pytest.fixture(scope="function", name="copies")
+def fixture_copies(audio_file: Track) -> list[Path]:
+    """Three copies of the audio file next to it"""
+    audio_file.close()
+    copies = [audio_file.path.with_name(f"{i}.opus") for i in range(3)]
+    for copy in copies:
+        shutil.copyfile(audio_file.path, copy)
+    return copies
+
+
+@pytest.fixture(scope="function", name="tag_cache")
+def fixture_tag_cache(tmp_path: Path) -> Iterator[TagCache]:
+    cache.enable(tmp_path / "cache" / "tags.sqlite")
+    tag_cache = cache.current()
+    assert tag_cache
+    yield tag_cache
+    cache.disable()
+
+
+@pytest.fixture(scope="function", name="rename_journal", autouse=True)
+def fixture_rename_journal(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Keeps the journal of renames out of the cache directory of the user"""
+    journal = tmp_path / "journal" / "rename.journal"
+    monkeypatch.setattr(config, "rename_journal", journal)
+    return journal
+
+
+@pytest.fixture(scope="function", name="state_dir", autouse=True)
+def fixture_state_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Keeps the state of incremental runs out of the cache directory of the user"""
+    state_dir = tmp_path / "state"
+    monkeypatch.setattr(config, "state_dir", state_dir)
+    return state_dir
@@ -0,0 +1,151 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from pathlib import Path
+import asyncio
+import threading
+import pytest
+from audiotag import aio
+from audiotag.track import Tag, TagPlan, Track
+from conftest import FakeTag
+
+if TYPE_CHECKING:
+    from typing import Iterator
+
+
+@pytest.fixture(scope="function", name="runner")
+def fixture_runner() -> Iterator[aio.Runner]:
+    runner = aio.Runner(limit=2)
+    yield runner
+    runner.close()
+
+
+def test_read(copies: list[Path], runner: aio.Runner) -> None:
+    async def _read() -> tuple[dict[str, list[str]], list[object]]:
+        return (
+            await aio.read_tags(copies[0], runner),
+            await aio.read_all(map(str, copies), runner),
+        )
+
+    tags, results = asyncio.run(_read())
+    assert tags[Tag.TITLE.value] == [FakeTag.TITLE.value]
+    assert results == [tags] * 3
+
+
+@pytest.mark.usefixtures("tag_cache")
+def test_read_cached(copies: list[Path], runner: aio.Runner) -> None:
+    # Every worker thread uses its own connection to the tag cache
+    for _ in range(2):
+        results = asyncio.run(aio.read_all(copies * 2, runner))
+        titles = [tags[Tag.TITLE.value] for tags in results]  # type: ignore[index]
+        assert titles == [[FakeTag.TITLE.value]] * 6
+
+
+def test_opened(copies: list[Path], runner: aio.Runner) -> None:
+    async def _change() -> bool:
+        async with aio.opened(copies[0], runner) as track:
+            track.title = "new"
+            return await aio.save(track, runner)
+
+    assert asyncio.run(_change())
+    assert Track(copies[0]).title == "new"
+
+
+def test_apply_clean(copies: list[Path], runner: aio.Runner) -> None:
+    plan = TagPlan(set_tags={Tag.GENRE: "Jazz"})
+    assert asyncio.run(aio.apply_all(copies, plan, runner)) == [True] * 3
+    assert asyncio.run(aio.apply_all(copies, plan, runner)) == [False] * 3
+    assert Track(copies[1]).genre == ["Jazz"]
+    assert asyncio.run(aio.clean(copies[0], runner=runner))
+    assert Track(copies[0]).tags == {Tag.ENCODER.value: [FakeTag.ENCODER.value]}
+    assert asyncio.run(aio.clean_all(copies, {Tag.GENRE}, runner)) == [True] * 3
+    assert Track(copies[0]).tags == {}
+    assert Track(copies[2]).tags == {Tag.GENRE.value: ["Jazz"]}
+
+
+def test_errors(copies: list[Path], runner: aio.Runner) -> None:
+    paths = [copies[0], copies[0].with_name("missing.opus")]
+    results = asyncio.run(aio.read_all(paths, runner, return_exceptions=True))
+    assert isinstance(results[0], dict)
+    assert isinstance(results[1], OSError)
+    with pytest.raises(OSError):
+        asyncio.run(aio.read_all(paths, runner))
+
+
+def test_limit(runner: aio.Runner) -> None:
+    lock = threading.Lock()
+    running = [0]
+    most = [0]
+
+    def _job() -> None:
+        with lock:
+            running[0] += 1
+            most[0] = max(most[0], running[0])
+        threading.Event().wait(0.02)
+        with lock:
+            running[0] -= 1
+
+    async def _run_all() -> None:
+        await asyncio.gather(*(runner.run(_job) for _ in range(6)))
+
+    asyncio.run(_run_all())
+    assert most[0] == 2
+
+
+def test_cancel(runner: aio.Runner) -> None:
+    started = threading.Event()
+    release = threading.Event()
+    cleaned: list[str] = []
+    calls: list[str] = []
+
+    def _blocking(name: str) -> str:
+        calls.append(name)
+        started.set()
+        release.wait(5)
+        return name
+
+    async def _cancel() -> None:
+        # The running job finishes and its result is cleaned up
+        running = asyncio.ensure_future(
+            runner.run(_blocking, "running", cleanup=cleaned.append)
+        )
+        other = asyncio.ensure_future(runner.run(_blocking, "other"))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        # The limit is reached, so this job is cancelled before it starts
+        queued = asyncio.ensure_future(runner.run(_blocking, "queued"))
+        await asyncio.sleep(0.01)
+        running.cancel()
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await running
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        release.set()
+        assert await other == "other"
+        while not cleaned:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(_cancel())
+    assert cleaned == ["running"]
+    assert "queued" not in calls
+
+
+def test_open_track_cancelled(copies: list[Path], runner: aio.Runner) -> None:
+    async def _cancel() -> None:
+        task = asyncio.ensure_future(aio.open_track(copies[0], runner))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(_cancel())
+    runner.close()
+    # The job either never ran or its track was closed again
+    assert asyncio.run(aio.apply(copies[0], TagPlan(set_tags={Tag.GENRE: "A"}), runner))
+
+
+def test_default_runner() -> None:
+    runner = aio.configure(limit=3)
+    assert aio.default_runner() is runner
+    with pytest.raises(ValueError):
+        aio.Runner(limit=0)
+    assert aio.configure() is not runner
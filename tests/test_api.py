@@ -0,0 +1,74 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from pathlib import Path
+import pytest
+from audiotag import api
+from audiotag.track import Tag, TagPlan, Track
+from conftest import FakeTag
+
+if TYPE_CHECKING:
+    from typing import Iterator
+
+
+def _change_and_fail(track: Track) -> None:
+    track.title = "partial"
+    raise ValueError("Invalid change")
+
+
+@pytest.fixture(scope="function", name="pool")
+def fixture_pool() -> Iterator[api.HandlePool]:
+    with api.HandlePool(size=2) as pool:
+        yield pool
+
+
+def test_track_context(audio_file: Track) -> None:
+    audio_file.close()
+    with Track(audio_file.path) as track:
+        track.title = "new"
+        track.save()
+    assert Track(audio_file.path).title == "new"
+
+
+def test_read_tags(copies: list[Path], pool: api.HandlePool) -> None:
+    results = list(api.read_tags(map(str, copies), pool=pool))
+    assert [path for path, _ in results] == copies
+    assert all(tags[Tag.TITLE.value] == [FakeTag.TITLE.value] for _, tags in results)
+    # Only the most recently used files stay open
+    assert len(pool) == 2
+    first = pool.get(copies[2])
+    assert pool.get(copies[2]) is first
+
+
+def test_apply(copies: list[Path], pool: api.HandlePool) -> None:
+    list(api.read_tags(copies, pool=pool))
+    plan = TagPlan(set_tags={Tag.GENRE: "Jazz"})
+    assert api.apply(copies, plan, pool=pool) == [True] * 3
+    assert api.apply(copies, plan, pool=pool) == [False] * 3
+    results = api.read_tags(copies, pool=pool)
+    assert all(tags[Tag.GENRE.value] == ["Jazz"] for _, tags in results)
+
+    # A failed change does not stay in the pool
+    with pytest.raises(ValueError):
+        pool.change(copies[0], _change_and_fail)
+    assert pool.get(copies[0]).title == FakeTag.TITLE.value
+
+
+def test_clean(copies: list[Path], pool: api.HandlePool) -> None:
+    assert api.clean(copies[:1], keep={Tag.TITLE}, pool=pool) == [True]
+    _, tags = next(api.read_tags(copies[:1], pool=pool))
+    assert tags == {Tag.TITLE.value: [FakeTag.TITLE.value]}
+
+
+def test_changed_on_disk(copies: list[Path], pool: api.HandlePool) -> None:
+    first = pool.get(copies[0])
+    with Track(copies[0]) as track:
+        track.title = "changed"
+        track.save()
+    second = pool.get(copies[0])
+    assert second is not first
+    assert second.title == "changed"
+
+
+def test_missing_file(tmp_path: Path, pool: api.HandlePool) -> None:
+    with pytest.raises(OSError):
+        list(api.read_tags([tmp_path / "missing.opus"], pool=pool))
@@ -0,0 +1,137 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from pathlib import Path
+import subprocess
+import sys
+import pytest
+from audiotag.audiotag import main
+
+if TYPE_CHECKING:
+    from audiotag.track import Track
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["print"],
+        ["print", "-0", "a.opus"],
+        ["print", "--files-from", "does-not-exist"],
+        ["interactive", "--files-from", "-"],
+        ["rename", "--files-from", "-"],
+        ["rename", "--resume", "a.opus"],
+        ["--error-report", "report.jsonl", "print", "a.opus"],
+        ["clean", "--resume", "a.opus"],
+        ["--shard", "3/2", "print", "a.opus"],
+        ["--shard-root", ".", "print", "a.opus"],
+        ["--client=server.sock", "print", "a.opus"],
+        ["watch", "drop"],
+        ["find", "GENRE"],
+        ["watch", "drop", "--rules", "rules.ini", "--settle", "0"],
+    ],
+)
+def test_invalid_files(argv: list[str]) -> None:
+    with pytest.raises(SystemExit) as e:
+        main(["--no-cache", *argv])
+    assert e.value.code == 2
+
+
+def test_files_from(audio_file: Track, tmp_path: Path, capfd) -> None:
+    audio_file.close()
+    file_list = tmp_path / "files"
+    file_list.write_text(f"{audio_file.path}\n")
+    error_code = main(
+        ["--no-cache", "print", "--format", "csv", "--fields", "path,title"]
+        + ["--files-from", str(file_list), str(audio_file.path)]
+    )
+    stdout, _ = capfd.readouterr()
+    assert not error_code
+    assert stdout.splitlines()[1:] == [f"{audio_file.path},title"] * 2
+
+
+def test_files_from_stdin(audio_file: Track) -> None:
+    audio_file.close()
+    result = subprocess.run(
+        [sys.executable, "-m", "audiotag.audiotag", "--no-cache", "print"]
+        + ["--format", "jsonl", "--fields", "path", "--files-from", "-", "-0"],
+        input=f"{audio_file.path}\0{audio_file.path}\0".encode(),
+        capture_output=True,
+        check=True,
+    )
+    assert (
+        result.stdout.decode().splitlines() == [f'{{"path": "{audio_file.path}"}}'] * 2
+    )
+
+
+def test_keep_going(audio_file: Track, tmp_path: Path, capfd) -> None:
+    audio_file.close()
+    missing = tmp_path / "missing.opus"
+    report = tmp_path / "report.jsonl"
+    error_code = main(
+        ["--no-cache", "--keep-going", "--error-report", str(report)]
+        + ["set", "--title", "new", str(missing), str(audio_file.path)]
+    )
+    stdout, _ = capfd.readouterr()
+    assert error_code == 3
+    assert stdout.endswith(f"1 file failed, see '{report}'\n")
+    assert report.read_text().startswith(f'{{"path": "{missing}", "stage": "open"')
+
+    # The report is read as a list of files to retry the failed ones
+    error_code = main(
+        ["--no-cache", "--keep-going", "--error-report", str(report)]
+        + ["print", "--files-from", str(report), str(audio_file.path)]
+    )
+    assert error_code == 3
+    assert len(report.read_text().splitlines()) == 1
+
+    error_code = main(
+        ["--no-cache", "--keep-going", "--error-report", str(report)]
+        + ["print", str(audio_file.path)]
+    )
+    assert not error_code
+    assert report.read_text() == ""
+
+
+def test_keep_going_all_failed(tmp_path: Path, capfd) -> None:
+    missing = tmp_path / "missing.opus"
+    report = tmp_path / "report.jsonl"
+    error_code = main(
+        ["--no-cache", "--keep-going", "--error-report", str(report)]
+        + ["set", "--title", "new", str(missing)]
+    )
+    stdout, _ = capfd.readouterr()
+    assert error_code == 3
+    assert stdout.endswith(f"1 file failed, see '{report}'\n")
+
+    # Retrying a report of files that all still fail reports them again
+    error_code = main(
+        ["--no-cache", "--keep-going", "--error-report", str(report)]
+        + ["print", "--files-from", str(report)]
+    )
+    assert error_code == 3
+    assert report.read_text().startswith(f'{{"path": "{missing}", "stage": "open"')
+
+
+def test_shards(audio_file: Track, tmp_path: Path, capfd) -> None:
+    audio_file.close()
+    for i in range(9):
+        (tmp_path / f"{i}.opus").write_bytes(audio_file.path.read_bytes())
+    report = tmp_path / "report.jsonl"
+    printed: list[str] = []
+    for index in (1, 2, 3):
+        main(
+            ["--no-cache", "--keep-going", "--error-report", str(report)]
+            + ["--shard", f"{index}/3", "--shard-root", str(tmp_path)]
+            + ["print", "--format", "jsonl", "--fields", "path", "-r", str(tmp_path)]
+            + [str(tmp_path / "missing.opus")]
+        )
+        stdout, _ = capfd.readouterr()
+        printed.extend(line for line in stdout.splitlines() if line.startswith("{"))
+    assert len(printed) == len(set(printed)) == 10
+
+    # Only the shard that contains the missing file reports it
+    reports = sorted(tmp_path.glob("report.shard-*-of-3.jsonl"))
+    assert len(reports) == 3
+    assert sum(len(r.read_text().splitlines()) for r in reports) == 1
+    assert not main(["merge", *map(str, reports)])
+    stdout, _ = capfd.readouterr()
+    assert stdout.startswith(f'{{"path": "{tmp_path / "missing.opus"}"')
@@ -0,0 +1,86 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from pathlib import Path
+import itertools
+import shutil
+import pytest
+from audiotag.batch import Batch
+from audiotag.util import NoAudioFilesFoundError
+
+if TYPE_CHECKING:
+    from audiotag.track import Track
+
+
+def _title(track: Track) -> str:
+    return track.title
+
+
+def _invalid(track: Track) -> str:
+    raise ValueError(f"Invalid '{track.path.name}'")
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_map_order(jobs: int) -> None:
+    items = list(range(-50, 50))
+    assert list(Batch(jobs=jobs).map(abs, items)) == [abs(i) for i in items]
+
+
+def test_invalid_jobs() -> None:
+    with pytest.raises(ValueError):
+        Batch(jobs=0)
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+@pytest.mark.usefixtures("audio_file")
+def test_map_tracks(audio_file: Track, jobs: int) -> None:
+    audio_file.close()
+    copies = [audio_file.path.with_name(f"{i}.opus") for i in range(20)]
+    for copy in copies:
+        shutil.copyfile(audio_file.path, copy)
+    titles = Batch(jobs=jobs).map_tracks(_title, [audio_file.path, *copies])
+    assert list(titles) == [audio_file.title] * (len(copies) + 1)
+
+
+@pytest.mark.usefixtures("mixed_dir")
+def test_map_tracks_mixed(mixed_dir: Path, capfd) -> None:
+    paths = sorted(mixed_dir.iterdir())
+    assert len(list(Batch().map_tracks(_title, paths))) == 1
+    stdout, _ = capfd.readouterr()
+    assert stdout == f"Unable to open file '{str(mixed_dir / 'black.jpg')}'\n"
+
+
+@pytest.mark.usefixtures("image_dir")
+def test_map_tracks_invalid(image_dir: Path) -> None:
+    with pytest.raises(NoAudioFilesFoundError):
+        list(Batch().map_tracks(_title, image_dir.iterdir()))
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+@pytest.mark.usefixtures("mixed_dir")
+def test_map_tracks_keep_going(mixed_dir: Path, jobs: int, capfd) -> None:
+    paths = sorted(mixed_dir.iterdir())
+    batch = Batch(jobs=jobs, keep_going=True)
+    assert list(batch.map_tracks(_invalid, paths)) == []
+    stdout, _ = capfd.readouterr()
+    assert "Unable to process file" in stdout
+    assert [(f.path.name, f.stage) for f in batch.failures] == [
+        ("black.jpg", "open"),
+        ("noise.opus", "validate"),
+    ]
+    assert batch.failures[1].record() == {
+        "path": str(mixed_dir / "noise.opus"),
+        "stage": "validate",
+        "error": "Invalid 'noise.opus'",
+    }
+
+
+@pytest.mark.usefixtures("mixed_dir")
+def test_map_tracks_stop(mixed_dir: Path) -> None:
+    with pytest.raises(ValueError):
+        list(Batch().map_tracks(_invalid, sorted(mixed_dir.iterdir())))
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_map_lazy(jobs: int) -> None:
+    results = Batch(jobs=jobs).map(abs, itertools.count(-5))
+    assert list(itertools.islice(results, 10)) == [5, 4, 3, 2, 1, 0, 1, 2, 3, 4]
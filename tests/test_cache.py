@@ -0,0 +1,91 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import os
+import pytest
+from audiotag.modes import print_mode
+from audiotag.track import Track, Tag
+from conftest import FakeTag
+
+from audiotag.cache import MemoryCache
+
+if TYPE_CHECKING:
+    from pathlib import Path
+    from audiotag.cache import TagCache
+
+
+@pytest.mark.usefixtures("audio_file", "tag_cache")
+def test_get_put(audio_file: Track, tag_cache: TagCache) -> None:
+    audio_file.close()
+    tag_cache.remove(audio_file.path)
+    stat = os.stat(audio_file.path)
+    assert tag_cache.get(audio_file.path, stat) is None
+    tag_cache.put(audio_file.path, stat, {"TITLE": ["cached"]})
+    assert tag_cache.get(audio_file.path, stat) == {"TITLE": ["cached"]}
+    os.utime(audio_file.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert tag_cache.get(audio_file.path, os.stat(audio_file.path)) is None
+    tag_cache.remove(audio_file.path)
+    assert tag_cache.get(audio_file.path, stat) is None
+
+
+@pytest.mark.usefixtures("audio_file", "tag_cache")
+def test_track_from_cache(audio_file: Track, tag_cache: TagCache) -> None:
+    audio_file.close()
+    tag_cache.remove(audio_file.path)
+    first = Track(audio_file.path)
+    assert first._handle is not None
+    first.close()
+    tag_cache.put(
+        audio_file.path, os.stat(audio_file.path), {Tag.TITLE.value: ["cached"]}
+    )
+    second = Track(audio_file.path)
+    assert second._handle is None
+    assert second.title == "cached"
+    second.close()
+
+
+@pytest.mark.usefixtures("audio_file", "tag_cache")
+def test_save_updates_cache(audio_file: Track, tag_cache: TagCache) -> None:
+    audio_file.close()
+    track = Track(audio_file.path)
+    track.title = "new title"
+    track.save()
+    track.close()
+    cached = tag_cache.get(audio_file.path, os.stat(audio_file.path))
+    assert cached and cached[Tag.TITLE.value] == ["new title"]
+    assert cached[Tag.ALBUM.value] == [FakeTag.ALBUM.value]
+
+
+@pytest.mark.usefixtures("audio_file", "tag_cache")
+def test_print_mode_cached(audio_file: Track, capfd) -> None:
+    audio_file.close()
+    assert not print_mode([str(audio_file.path)])
+    uncached, _ = capfd.readouterr()
+    assert not print_mode([str(audio_file.path)])
+    cached, _ = capfd.readouterr()
+    assert uncached == cached
+
+
+@pytest.mark.usefixtures("audio_file", "tag_cache")
+def test_memory_cache(audio_file: Track, tag_cache: TagCache, tmp_path: Path) -> None:
+    audio_file.close()
+    stat = os.stat(audio_file.path)
+    tag_cache.put(audio_file.path, stat, {"TITLE": ["stored"]})
+    memory = MemoryCache(2, backing=tag_cache)
+    tags = memory.get(audio_file.path, stat)
+    assert tags == {"TITLE": ["stored"]}
+    assert len(memory) == 1
+
+    # Entries are copies and are used without the backing cache
+    assert tags is not None
+    tags["TITLE"].append("changed")
+    memory.backing = None
+    assert memory.get(audio_file.path, stat) == {"TITLE": ["stored"]}
+
+    # The least recently used entry is dropped
+    memory.put(tmp_path / "a.opus", stat, {})
+    memory.get(audio_file.path, stat)
+    memory.put(tmp_path / "b.opus", stat, {})
+    assert memory.get(tmp_path / "a.opus", stat) is None
+    assert memory.get(audio_file.path, stat) is not None
+    os.utime(audio_file.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert memory.get(audio_file.path, os.stat(audio_file.path)) is None
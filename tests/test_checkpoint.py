@@ -0,0 +1,49 @@
+from __future__ import annotations
+from pathlib import Path
+import os
+import pytest
+from audiotag import checkpoint
+from audiotag.checkpoint import Checkpoint
+
+
+def test_resume(tmp_path: Path) -> None:
+    log = tmp_path / "log" / "checkpoint"
+    paths = [tmp_path / f"{i}.opus" for i in range(3)]
+    first = Checkpoint(log)
+    first.add(paths[0])
+    first.add(paths[1])
+    first.close()
+    with pytest.raises(FileExistsError):
+        Checkpoint(log)
+
+    second = Checkpoint(log, resume=True)
+    assert list(second.pending(paths)) == [paths[2]]
+    assert second.skipped == 2
+    second.add(paths[2])
+    second.close(finished=True)
+    assert not log.exists()
+
+
+def test_torn_entry(tmp_path: Path) -> None:
+    log = tmp_path / "checkpoint"
+    done = os.fsencode(tmp_path / "done.opus")
+    log.write_bytes(done + b"\0" + os.fsencode(tmp_path / "to"))
+    resumed = Checkpoint(log, resume=True)
+    assert resumed.done == {str(tmp_path / "done.opus")}
+    resumed.add(tmp_path / "torn.opus")
+    resumed.close()
+    assert Checkpoint(log, resume=True).done == {
+        str(tmp_path / "done.opus"),
+        str(tmp_path / "torn.opus"),
+    }
+
+
+def test_sync_interval(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    synced: list[int] = []
+    monkeypatch.setattr(checkpoint.os, "fsync", synced.append)
+    log = Checkpoint(tmp_path / "checkpoint")
+    for i in range(checkpoint.SYNC_INTERVAL + 1):
+        log.add(tmp_path / f"{i}.opus")
+    assert len(synced) == 1
+    log.close()
+    assert len(synced) == 2
@@ -0,0 +1,55 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import subprocess
+import sys
+import pytest
+
+if TYPE_CHECKING:
+    from audiotag.track import Track
+
+# Modules that are slow to import and only needed by some commands
+SLOW_MODULES = ["prompt_toolkit", "importlib.metadata", "sqlite3", "socket", "select"]
+
+
+def _imported_modules(code: str) -> set[str]:
+    """Runs code in a new interpreter and returns the names of all imported modules"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return {
+        line.rsplit("|", 1)[1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and "|" in line
+    }
+
+
+def _assert_not_imported(modules: set[str], names: list[str]) -> None:
+    for name in names:
+        assert not [m for m in modules if m == name or m.startswith(f"{name}.")]
+
+
+def test_import_cli() -> None:
+    modules = _imported_modules("import audiotag.audiotag")
+    assert "audiotag.audiotag" in modules
+    _assert_not_imported(modules, SLOW_MODULES)
+
+
+def test_print_skips_prompt_toolkit(audio_file: Track) -> None:
+    # stdout is not a tty here, so the tags are printed as plain text
+    modules = _imported_modules(
+        "from audiotag.audiotag import main; "
+        + f"main(['--jobs', '1', '--no-cache', 'print', {str(audio_file.path)!r}])"
+    )
+    assert "audiotag.modes" in modules
+    _assert_not_imported(modules, SLOW_MODULES)
+
+
+def test_version() -> None:
+    from audiotag.audiotag import main
+
+    with pytest.raises(SystemExit) as e:
+        main(["--version"])
+    assert e.value.code == 0
@@ -1,15 +1,25 @@
 from __future__ import annotations
+import json
 import os
 from pathlib import Path
 import shutil
 import pytest
+from audiotag.batch import Batch
+from audiotag.renamer import JournalLock
 from audiotag.track import Track, Tag, VALUE_SEP
+from audiotag.watch import Rules
 from audiotag.modes import (
+    _watch_round,
     clean_mode,
     copy_mode,
+    find_mode,
+    import_mode,
+    merge_mode,
     print_mode,
     rename_mode,
+    rename_journal_mode,
     set_mode,
+    watch_mode,
 )
 from conftest import FakeTag
 
@@ -64,6 +74,45 @@ def test_clean_mode(audio_file: Track):
     cleaned_file.close()
 
 
+@pytest.mark.usefixtures("audio_file")
+def test_clean_mode_incremental(audio_file: Track, capfd):
+    audio_file.close()
+    files = [str(audio_file.path)]
+    assert not clean_mode(files=files, keep=None, incremental=True)
+    assert not clean_mode(files=files, keep=None, incremental=True)
+    stdout, _ = capfd.readouterr()
+    assert stdout.splitlines() == [
+        "1 file written, 0 files skipped",
+        "0 files written, 0 files skipped",
+        "1 unchanged file left out",
+    ]
+
+    # Modified files and other parameters open the file again
+    set_mode(files=files, remove_tags=set(), set_tags={Tag.TITLE: "new"})
+    assert not clean_mode(files=files, keep=None, incremental=True)
+    assert not clean_mode(files=files, keep={Tag.TITLE}, incremental=True)
+    stdout, _ = capfd.readouterr()
+    assert stdout.splitlines()[1:] == ["1 file written, 0 files skipped"] * 2
+
+
+def test_merge_mode(tmp_path: Path, capfd):
+    first = tmp_path / "first.jsonl"
+    first.write_text('{"path": "b", "stage": "open"}\n{"path": "c", "TITLE": "x"}\n')
+    second = tmp_path / "second.csv"
+    second.write_text("path,stage\na,save\n")
+    merged = tmp_path / "merged.tsv"
+    assert not merge_mode([str(first), str(second)], output=str(merged))
+    stdout, _ = capfd.readouterr()
+    assert stdout == f"3 records merged into '{merged}'\n"
+    assert merged.read_text().splitlines() == [
+        "path\tstage\tTITLE",
+        "a\tsave\t",
+        "b\topen\t",
+        "c\t\tx",
+    ]
+    assert merge_mode([str(tmp_path / "missing.jsonl")]) == 1
+
+
 def test_copy_mode_dir_not_exist():
     error_code = copy_mode(src="DoesNotExist", dst="DoesNotExistEither")
     assert error_code == 1
@@ -183,6 +232,47 @@ def test_rename_mode_existing(audio_file: Track):
     copytrack_after.close()
 
 
+@pytest.mark.usefixtures("mixed_dir")
+def test_set_mode_checkpoint(mixed_dir: Path, capfd):
+    audio_path = mixed_dir / "noise.opus"
+    second_path = mixed_dir / "second.opus"
+    shutil.copyfile(audio_path, second_path)
+    title = Track(audio_path).title
+    checkpoint = mixed_dir / "checkpoint"
+    checkpoint.write_bytes(os.fsencode(audio_path.absolute()) + b"\0")
+    files = [str(audio_path), str(second_path)]
+    set_tags: dict[Tag, str | int] = {Tag.TITLE: "new"}
+    assert set_mode(files, set(), set_tags, checkpoint=checkpoint) == 1
+    error_code = set_mode(
+        files, set(), set_tags, batch=Batch(jobs=2), checkpoint=checkpoint, resume=True
+    )
+    stdout, _ = capfd.readouterr()
+    assert not error_code
+    assert stdout.splitlines()[1:] == [
+        "1 file written, 0 files skipped",
+        "1 file done before the checkpoint left out",
+    ]
+    assert Track(audio_path).title == title != "new"
+    assert Track(second_path).title == "new"
+    assert not checkpoint.exists()
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_rename_mode_incremental(audio_file: Track, capfd):
+    audio_file.close()
+    directory = str(audio_file.path.parent)
+    for _ in range(2):
+        assert not rename_mode(
+            files=[directory], pattern="{T}", recursive=True, incremental=True
+        )
+    stdout, _ = capfd.readouterr()
+    assert stdout.splitlines() == [
+        "1 file renamed, 0 files skipped",
+        "0 files renamed, 0 files skipped",
+        "1 unchanged file left out",
+    ]
+
+
 @pytest.mark.usefixtures("audio_file")
 def test_set_mode(audio_file: Track):
     audio_file.close()
@@ -213,3 +303,415 @@ def test_set_mode(audio_file: Track):
     assert audio_file.genre == newgenre
     assert audio_file.tracknumber == newtracknum
     audio_file.close()
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_set_mode_parallel(audio_file: Track):
+    audio_file.close()
+    copies = [audio_file.path.with_name(f"{i}.opus") for i in range(20)]
+    for copy in copies:
+        shutil.copyfile(audio_file.path, copy)
+    error_code = set_mode(
+        files=[str(copy) for copy in copies],
+        remove_tags={Tag.GENRE},
+        set_tags={Tag.TITLE: "parallel"},
+        batch=Batch(jobs=4),
+    )
+    assert not error_code
+    for copy in copies:
+        track = Track(copy)
+        assert track.title == "parallel"
+        assert not track.has_tag(Tag.GENRE)
+        track.close()
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_clean_mode_unchanged(audio_file: Track, capfd):
+    audio_file.close()
+    assert not clean_mode(files=[str(audio_file.path)], keep=None)
+    stdout, _ = capfd.readouterr()
+    assert stdout == "1 file written, 0 files skipped\n"
+    mtime = audio_file.path.stat().st_mtime_ns
+    assert not clean_mode(files=[str(audio_file.path)], keep=None)
+    stdout, _ = capfd.readouterr()
+    assert stdout == "0 files written, 1 file skipped\n"
+    assert audio_file.path.stat().st_mtime_ns == mtime
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_set_mode_invalid(audio_file: Track):
+    audio_file.close()
+    mtime = audio_file.path.stat().st_mtime_ns
+    error_code = set_mode(
+        files=[str(audio_file.path)],
+        remove_tags=set(),
+        set_tags={Tag.TITLE: "valid", Tag.GENRE: "invalid////list"},
+    )
+    assert error_code == 1
+    assert audio_file.path.stat().st_mtime_ns == mtime
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_rename_mode_invalid_pattern(audio_file: Track):
+    audio_file.close()
+    error_code = rename_mode(files=[str(audio_file.path)], pattern="{T|nope}")
+    assert error_code == 1
+    assert audio_file.path.is_file()
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_print_mode_jsonl(audio_file: Track, capfd):
+    audio_file.close()
+    error_code = print_mode(
+        [str(audio_file.path), str(audio_file.path.with_suffix(".jpg"))],
+        output_format="jsonl",
+        fields="path,title,artist",
+    )
+    stdout, stderr = capfd.readouterr()
+    assert not error_code
+    assert "Unable to open file" in stderr
+    assert json.loads(stdout) == {
+        "path": str(audio_file.path),
+        "TITLE": [FakeTag.TITLE.value],
+        "ARTIST": FakeTag.ARTIST.value,
+    }
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_print_mode_csv(audio_file: Track, capfd):
+    audio_file.close()
+    error_code = print_mode([str(audio_file.path)], output_format="csv")
+    stdout, _ = capfd.readouterr()
+    assert not error_code
+    header, row = stdout.splitlines()
+    assert header.startswith("path,ALBUM,")
+    assert row.startswith(f"{str(audio_file.path)},{FakeTag.ALBUM.value},")
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_print_mode_fields_without_format(audio_file: Track, capfd):
+    error_code = print_mode([str(audio_file.path)], fields="title")
+    stdout, _ = capfd.readouterr()
+    assert error_code == 1
+    assert stdout == "A list of fields can only be given with a format\n"
+
+
+@pytest.mark.usefixtures("mixed_dir")
+def test_import_mode(mixed_dir: Path, capfd):
+    audio_path = mixed_dir / "noise.opus"
+    second_path = mixed_dir / "second.opus"
+    shutil.copyfile(audio_path, second_path)
+    manifest = mixed_dir / "manifest.jsonl"
+    manifest.write_text(
+        json.dumps({"path": str(audio_path), "TITLE": "one", "GENRE": None})
+        + "\n"
+        + json.dumps({"path": str(second_path), "ARTIST": ["a", "b"]})
+        + "\n"
+        + json.dumps({"path": str(mixed_dir / "missing.opus"), "TITLE": "x"})
+        + "\n"
+    )
+    error_code = import_mode(str(manifest), batch=Batch(jobs=2))
+    stdout, _ = capfd.readouterr()
+    assert not error_code
+    assert "Unable to open file" in stdout
+    assert stdout.endswith("2 files written, 0 files skipped\n")
+    track = Track(audio_path)
+    assert track.title == "one"
+    assert not track.has_tag(Tag.GENRE)
+    assert Track(second_path).artist == ["a", "b"]
+
+
+def test_import_mode_save_failure(
+    audio_file: Track, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capfd
+) -> None:
+    audio_file.close()
+    second_path = tmp_path / "second.opus"
+    shutil.copyfile(audio_file.path, second_path)
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text(
+        json.dumps({"path": str(audio_file.path), "TITLE": "one"})
+        + "\n"
+        + json.dumps({"path": str(second_path), "TITLE": "two"})
+        + "\n"
+    )
+    save = Track.save
+
+    def _fail(track: Track) -> bool:
+        if track.path == audio_file.path:
+            raise OSError("Disk full")
+        return save(track)
+
+    monkeypatch.setattr(Track, "save", _fail)
+    with pytest.raises(OSError):
+        import_mode(str(manifest))
+    batch = Batch(keep_going=True)
+    assert import_mode(str(manifest), batch=batch) == 0
+    assert "Unable to process file" in capfd.readouterr().out
+    assert [(f.path, f.stage) for f in batch.failures] == [(audio_file.path, "save")]
+    assert Track(second_path).title == "two"
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_import_mode_csv(audio_file: Track, tmp_path: Path, capfd):
+    audio_file.close()
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text(f"path,title,album\n{audio_file.path},new title,\n")
+    error_code = import_mode(str(manifest))
+    stdout, _ = capfd.readouterr()
+    assert not error_code
+    assert stdout == "1 file written, 0 files skipped\n"
+    track = Track(audio_file.path)
+    assert track.title == "new title"
+    assert track.album == FakeTag.ALBUM.value
+
+
+@pytest.mark.parametrize(
+    "lines",
+    [
+        ['{"path": "a.opus", "TITLE": "t"}', '{"path": "a.opus", "TITLE": "u"}'],
+        ['{"path": "a.opus", "TITLE": "t"}', '{"path": "b.opus", "COMMENT": "c"}'],
+        [],
+    ],
+)
+@pytest.mark.usefixtures("audio_file")
+def test_import_mode_invalid(audio_file: Track, tmp_path: Path, lines: list[str]):
+    audio_file.close()
+    manifest = tmp_path / "manifest.jsonl"
+    # The valid first record must not be applied either
+    manifest.write_text(
+        "\n".join(line.replace("a.opus", str(audio_file.path)) for line in lines)
+    )
+    assert import_mode(str(manifest)) == 1
+    assert Track(audio_file.path).title == FakeTag.TITLE.value
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_copy_mode_recursive(audio_file: Track, tmp_path: Path, capfd):
+    audio_file.close()
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    for relative in ["a.opus", "disc1/b.opus", "disc1/only_src.opus"]:
+        (src / relative).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(audio_file.path, src / relative)
+    cleaned = Track(audio_file.path)
+    cleaned.clear_tags(keep=set())
+    cleaned.save()
+    cleaned.close()
+    for relative in ["a.opus", "disc1/b.opus", "disc2/only_dst.opus"]:
+        (dst / relative).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(audio_file.path, dst / relative)
+
+    error_code = copy_mode(
+        src=str(src), dst=str(dst), batch=Batch(jobs=2), recursive=True
+    )
+    stdout, _ = capfd.readouterr()
+    assert not error_code
+    assert stdout.splitlines() == [
+        f"No file matches '{src / 'disc1' / 'only_src.opus'}' in '{dst}'",
+        f"No file matches '{dst / 'disc2' / 'only_dst.opus'}' in '{src}'",
+        "2 files written, 0 files skipped",
+    ]
+    for relative in ["a.opus", "disc1/b.opus"]:
+        assert Track(dst / relative).title == FakeTag.TITLE.value
+    assert not Track(dst / "disc2" / "only_dst.opus").has_tag(Tag.TITLE)
+
+
+def test_copy_mode_recursive_failure(
+    audio_file: Track, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capfd
+) -> None:
+    audio_file.close()
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    for relative in ["a.opus", "b.opus"]:
+        (src / relative).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(audio_file.path, src / relative)
+        (dst / relative).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(audio_file.path, dst / relative)
+    save = Track.save
+
+    def _fail(track: Track) -> bool:
+        if track.path == dst / "a.opus":
+            raise OSError("Disk full")
+        return save(track)
+
+    monkeypatch.setattr(Track, "save", _fail)
+    with pytest.raises(OSError):
+        copy_mode(src=str(src), dst=str(dst), recursive=True)
+    batch = Batch(keep_going=True)
+    assert copy_mode(src=str(src), dst=str(dst), batch=batch, recursive=True) == 0
+    assert [(f.path, f.stage) for f in batch.failures] == [(dst / "a.opus", "save")]
+    # Failures are neither written nor skipped
+    assert capfd.readouterr().out.endswith("0 files written, 1 file skipped\n")
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_copy_mode_recursive_ambiguous(audio_file: Track, tmp_path: Path, capfd):
+    audio_file.close()
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    src.mkdir()
+    dst.mkdir()
+    shutil.copyfile(audio_file.path, src / "a.opus")
+    shutil.copyfile(audio_file.path, dst / "a.opus")
+    shutil.copyfile(audio_file.path, dst / "a.ogg")
+    error_code = copy_mode(src=str(src), dst=str(dst), recursive=True)
+    stdout, _ = capfd.readouterr()
+    assert not error_code
+    assert stdout.splitlines() == [
+        f"Several files match '{src / 'a.opus'}' in '{dst}'",
+        "0 files written, 0 files skipped",
+    ]
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_rename_mode_swap(audio_file: Track, capfd):
+    audio_file.close()
+    first = audio_file.path.parent / "01.opus"
+    second = audio_file.path.parent / "02.opus"
+    shutil.move(audio_file.path, first)
+    shutil.copyfile(first, second)
+    for path, tracknumber in [(first, 2), (second, 1)]:
+        track = Track(path)
+        track.title = str(tracknumber)
+        track.tracktotal = 2
+        track.tracknumber = tracknumber
+        track.save()
+        track.close()
+    error_code = rename_mode(files=[str(first), str(second)], pattern="{N:02}")
+    stdout, _ = capfd.readouterr()
+    assert not error_code
+    assert stdout == "2 files renamed, 0 files skipped\n"
+    assert Track(first).title == "1"
+    assert Track(second).title == "2"
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_rename_mode_journal_exists(audio_file: Track, rename_journal: Path, capfd):
+    audio_file.close()
+    rename_journal.parent.mkdir()
+    rename_journal.write_text("")
+    error_code = rename_mode(files=[str(audio_file.path)], pattern="{T}")
+    stdout, _ = capfd.readouterr()
+    assert error_code == 1
+    assert "--resume" in stdout
+    assert audio_file.path.is_file()
+    assert not rename_journal_mode(rollback=True)
+    assert not rename_journal.exists()
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_rename_mode_locked(audio_file: Track, rename_journal: Path, capfd):
+    audio_file.close()
+    with JournalLock(rename_journal):
+        assert rename_mode(files=[str(audio_file.path)], pattern="{T}") == 1
+        assert rename_journal_mode(rollback=True) == 1
+    stdout, _ = capfd.readouterr()
+    assert stdout.startswith("Another rename is running")
+    assert audio_file.path.is_file()
+
+
+def test_rename_journal_mode_missing(capfd):
+    assert rename_journal_mode(rollback=False) == 1
+    stdout, _ = capfd.readouterr()
+    assert stdout.startswith("There is no journal")
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_rename_mode_directories(audio_file: Track, tmp_path: Path, capfd):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    shutil.move(audio_file.path, inbox / audio_file.path.name)
+    error_code = rename_mode(
+        files=[str(inbox)], pattern="../{L}/{N:02} - {T}", recursive=True
+    )
+    stdout, _ = capfd.readouterr()
+    assert not error_code
+    assert stdout == "1 file renamed, 0 files skipped\n"
+    new_path = tmp_path / FakeTag.ALBUM.value / f"01 - {FakeTag.TITLE.value}.opus"
+    assert Track(new_path).title == FakeTag.TITLE.value
+    assert not inbox.exists()
+
+
+def test_watch_round(
+    audio_file: Track, tmp_path: Path, rename_journal: Path, capfd
+) -> None:
+    audio_file.close()
+    broken = tmp_path / "broken.opus"
+    broken.write_bytes(b"")
+    untitled = tmp_path / "untitled.opus"
+    shutil.copyfile(audio_file.path, untitled)
+    with Track(untitled) as track:
+        track.remove_tags({Tag.TITLE})
+        track.save()
+    rules_file = tmp_path / "rules.ini"
+    rules_file.write_text("[set]\nGENRE = Jazz\n[rename]\npattern = {G}/{T}\n")
+    status, final = _watch_round(
+        [audio_file.path, broken, untitled],
+        Rules(rules_file),
+        Batch(keep_going=True),
+        rename_journal,
+    )
+    renamed = tmp_path / "Jazz" / "title.opus"
+    assert status == 0
+    assert final == [renamed]
+    assert Track(renamed).genre == ["Jazz"]
+    # Files that fail are reported and left alone
+    assert Track(untitled).genre == FakeTag.GENRE.value
+    assert capfd.readouterr().out.splitlines()[-2:] == [
+        "1 file written, 0 files skipped",
+        "1 file renamed, 0 files skipped",
+    ]
+
+
+def test_watch_mode_invalid(tmp_path: Path, rename_journal: Path, capfd) -> None:
+    rules_file = tmp_path / "rules.ini"
+    rules_file.write_text("[clean]\n")
+    assert watch_mode(str(tmp_path / "missing"), str(rules_file)) == 1
+    assert "does not exist" in capfd.readouterr().out
+    assert watch_mode(str(tmp_path), str(tmp_path / "missing.ini")) == 1
+    rename_journal.parent.mkdir(exist_ok=True)
+    rename_journal.write_text("")
+    assert watch_mode(str(tmp_path), str(rules_file)) == 1
+    assert "interrupted rename" in capfd.readouterr().out
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_find_mode(audio_file: Track, tmp_path: Path, jobs: int, capfd) -> None:
+    audio_file.close()
+    other = tmp_path / "sub" / "other.opus"
+    other.parent.mkdir()
+    shutil.copyfile(audio_file.path, other)
+    with Track(other) as track:
+        track.genre = ["Jazz"]
+        track.save()
+    batch = Batch(jobs=jobs)
+    assert find_mode([str(tmp_path)], "GENRE ~ jazz", batch, recursive=True) == 0
+    assert capfd.readouterr().out == f"{str(other)}\n"
+    assert find_mode([str(tmp_path)], "GENRE", batch, recursive=True, print0=True) == 0
+    assert capfd.readouterr().out == f"{str(audio_file.path)}\0{str(other)}\0"
+
+
+def test_find_mode_invalid(audio_file: Track, tmp_path: Path, capfd) -> None:
+    assert find_mode([str(audio_file.path)], "GENRE <") == 1
+    assert "Expected a value" in capfd.readouterr().out
+    assert find_mode([str(tmp_path / "missing.opus")], "GENRE") == 1
+    captured = capfd.readouterr()
+    assert captured.out == ""
+    assert "Unable to open file" in captured.err
+
+
+@pytest.mark.usefixtures("tag_cache")
+def test_find_mode_index(
+    audio_file: Track, monkeypatch: pytest.MonkeyPatch, capfd
+) -> None:
+    audio_file.close()
+    assert find_mode([str(audio_file.path)], "TITLE = title") == 0
+    assert capfd.readouterr().out == f"{str(audio_file.path)}\n"
+
+    # Unchanged files are not opened again
+    def _fail(path: str) -> None:
+        raise OSError(f"Opened '{path}'")
+
+    monkeypatch.setattr("audiotag.track.taglib.File", _fail)
+    assert find_mode([str(audio_file.path)], "TITLE = title") == 0
+    assert capfd.readouterr().out == f"{str(audio_file.path)}\n"
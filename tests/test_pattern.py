@@ -0,0 +1,89 @@
+from __future__ import annotations
+import pytest
+from audiotag.pattern import FilenamePattern, InvalidPatternError, compile_pattern
+from audiotag.track import Tag, Track
+from conftest import FakeTag
+
+
+@pytest.mark.parametrize(
+    "pattern,tags",
+    [
+        ("{T}", {Tag.TITLE}),
+        ("{N} - {T}", {Tag.TRACKNUMBER, Tag.TRACKTOTAL, Tag.TITLE}),
+        ("{N:02} {A|lower}", {Tag.TRACKNUMBER, Tag.ARTIST}),
+        ("{DT}/{NO}", {Tag.DISCTOTAL, Tag.TRACKTOTAL}),
+    ],
+)
+def test_required_tags(pattern: str, tags: set[Tag]):
+    assert FilenamePattern(pattern).tags == tags
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    ["NotAValidPattern", "{X}", "{T|nope}", "{T!r}", "{N:xyz}", "{A:d}", "{T"],
+)
+def test_invalid_pattern(pattern: str):
+    with pytest.raises(InvalidPatternError):
+        FilenamePattern(pattern)
+
+
+def test_compile_pattern_cached():
+    assert compile_pattern("{T}") is compile_pattern("{T}")
+
+
+@pytest.mark.parametrize(
+    "pattern,expected",
+    [
+        ("{N:03} - {T|upper}", f"001 - {FakeTag.TITLE.value.upper()}"),
+        ("{A|title} - {L}", f"Ärtist/Name - {FakeTag.ALBUM.value}".replace("/", "-")),
+        ("{A|ascii|lower} ({Y})", f"artist-name ({FakeTag.DATE.value})"),
+        ("{N}of{NT} {D:>3}", "1of1   1"),
+    ],
+)
+@pytest.mark.usefixtures("audio_file")
+def test_format(audio_file: Track, pattern: str, expected: str):
+    audio_file.artist = ["ärtist/name"]
+    assert FilenamePattern(pattern).format(audio_file) == expected
+    audio_file.close()
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_format_missing_only_used_tags(audio_file: Track):
+    audio_file.remove_tags({Tag.ALBUM, Tag.TRACKTOTAL})
+    assert FilenamePattern("{N:02} {T}").format(audio_file) == "01 title"
+    with pytest.raises(ValueError):
+        FilenamePattern("{N} {T}").format(audio_file)
+    audio_file.close()
+
+
+@pytest.mark.parametrize(
+    "artist,expected",
+    [
+        ("a/b", f"a-b/{FakeTag.ALBUM.value}/01 - {FakeTag.TITLE.value}"),
+        ("..", f"__/{FakeTag.ALBUM.value}/01 - {FakeTag.TITLE.value}"),
+    ],
+)
+@pytest.mark.usefixtures("audio_file")
+def test_format_directories(audio_file: Track, artist: str, expected: str):
+    audio_file.artist = [artist]
+    assert FilenamePattern("{A}/{L}/{N:02} - {T}").format(audio_file) == expected
+    audio_file.close()
+
+
+@pytest.mark.parametrize("pattern", ["{A}/{T}", "/music/{A}/{T}", "{L}/{A}{T}"])
+@pytest.mark.usefixtures("audio_file")
+def test_format_empty_directory(audio_file: Track, pattern: str):
+    audio_file.artist = [""]
+    audio_file.title = ""
+    with pytest.raises(ValueError):
+        FilenamePattern(pattern).format(audio_file)
+    audio_file.close()
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_format_invalid_number(audio_file: Track):
+    # Numbers are read like the properties of the track
+    audio_file.set_values({Tag.TRACKNUMBER: ["x"]})
+    assert audio_file.tracknumber == 0
+    assert FilenamePattern("{N:02} {T}").format(audio_file) == "00 title"
+    audio_file.close()
@@ -0,0 +1,72 @@
+from __future__ import annotations
+import pickle
+import pytest
+from audiotag.query import InvalidQueryError, Query, compile_query
+
+TAGS = {
+    "ARTIST": ["Burial", "Four Tet"],
+    "DATE": ["1969-05-01"],
+    "GENRE": ["Jazz", "Free Jazz"],
+    "TITLE": ["Moth (Remix)"],
+    "TRACKNUMBER": ["03"],
+}
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        ("TITLE", True),
+        ("not TRACKTOTAL", True),
+        ("genre = Jazz", True),
+        ("GENRE = jazz", False),
+        ("GENRE != Rock", True),
+        ("TRACKTOTAL != 1", True),
+        ("TRACKNUMBER = 3", True),
+        ("DATE < 1970", True),
+        ("DATE >= 1970", False),
+        ("DATE <= 1969 and DATE > 1968", True),
+        ("ARTIST = 'Four Tet'", True),
+        ('TITLE ~ "(remix)"', True),
+        ("GENRE ~ rock", False),
+        ("ARTIST =~ '^F.*t$'", True),
+        ("ARTIST =~ ^f", False),
+        ("GENRE = Rock or TITLE and not ALBUM", True),
+        ("GENRE = Rock or (TITLE and ALBUM)", False),
+        ("not not TITLE AND GENRE ~ free", True),
+    ],
+)
+def test_matches(query: str, expected: bool) -> None:
+    assert Query(query).matches(TAGS) is expected
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "",
+        "NOTATAG",
+        "TITLE =",
+        "GENRE < 3",
+        "DATE < soon",
+        "DATE < ²",
+        "TITLE = a b",
+        "(TITLE",
+        "TITLE)",
+        "TITLE ! a",
+        "TITLE = 'a",
+        "and TITLE",
+        "not",
+        "TITLE =~ '('",
+    ],
+)
+def test_invalid_query(query: str) -> None:
+    with pytest.raises(InvalidQueryError):
+        Query(query)
+
+
+def test_compile_query() -> None:
+    query = compile_query("GENRE ~ jazz")
+    assert compile_query("GENRE ~ jazz") is query
+    # Queries are sent to worker processes
+    copy = pickle.loads(pickle.dumps(query))
+    assert copy == query
+    assert copy.matches(TAGS)
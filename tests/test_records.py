@@ -0,0 +1,180 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import io
+import json
+from pathlib import Path
+import pytest
+from audiotag.records import (
+    DEFAULT_FIELDS,
+    InvalidRecordError,
+    format_of,
+    make_record,
+    parse_fields,
+    plan_of,
+    read_plans,
+    read_records,
+    write_records,
+)
+from audiotag.track import Tag, Track
+
+if TYPE_CHECKING:
+    from audiotag.records import Record
+
+
+@pytest.mark.parametrize(
+    "text,fields",
+    [
+        ("path", ("path",)),
+        ("PATH,artist", ("path", "ARTIST")),
+        (" title , Genre", ("TITLE", "GENRE")),
+        ("COMMENT", ("COMMENT",)),
+    ],
+)
+def test_parse_fields(text: str, fields: tuple[str, ...]) -> None:
+    assert parse_fields(text) == fields
+
+
+@pytest.mark.parametrize("text", ["", "artist,", "artist,ARTIST"])
+def test_parse_fields_invalid(text: str) -> None:
+    with pytest.raises(ValueError):
+        parse_fields(text)
+
+
+def test_make_record(audio_file: Track) -> None:
+    record = make_record(audio_file, fields=None)
+    assert record["path"] == str(audio_file.path)
+    assert record["ARTIST"] == audio_file.artist
+    assert list(record)[1:] == sorted(audio_file.tags)
+
+
+def test_make_record_fields(audio_file: Track) -> None:
+    record = make_record(audio_file, fields=("TITLE", "COMMENT"))
+    assert record == {
+        "path": str(audio_file.path),
+        "TITLE": [audio_file.title],
+        "COMMENT": None,
+    }
+
+
+RECORDS: list[Record] = [
+    {"path": "a.opus", "ARTIST": ["x", "y//z"], "TITLE": ['t, "quoted"']},
+    {"path": "b.opus", "TITLE": None},
+]
+
+
+def test_write_jsonl() -> None:
+    stream = io.StringIO()
+    assert write_records(RECORDS, "jsonl", stream) == 2
+    assert [json.loads(line) for line in stream.getvalue().splitlines()] == RECORDS
+
+
+@pytest.mark.parametrize("output_format,delimiter", [("csv", ","), ("tsv", "\t")])
+def test_write_csv(output_format: str, delimiter: str) -> None:
+    stream = io.StringIO()
+    fields = ("path", "ARTIST", "TITLE")
+    assert write_records(RECORDS, output_format, stream, fields=fields) == 2
+    lines = stream.getvalue().splitlines()
+    assert lines[0] == delimiter.join(fields)
+    assert Track.split_tag(lines[1].split(delimiter)[1]) == ["x", "y//z"]
+    assert lines[2] == delimiter.join(["b.opus", "", ""])
+
+
+def test_write_csv_default_fields() -> None:
+    stream = io.StringIO()
+    write_records([], "csv", stream)
+    assert stream.getvalue() == ",".join(DEFAULT_FIELDS) + "\n"
+
+
+def test_write_unknown_format() -> None:
+    with pytest.raises(ValueError):
+        write_records(RECORDS, "xml", io.StringIO())
+
+
+@pytest.mark.parametrize(
+    "name,output_format",
+    [("a.jsonl", "jsonl"), ("a.JSON", "jsonl"), ("a.csv", "csv"), ("a.tsv", "tsv")],
+)
+def test_format_of(name: str, output_format: str) -> None:
+    assert format_of(Path(name)) == output_format
+
+
+def test_format_of_unknown() -> None:
+    with pytest.raises(ValueError):
+        format_of(Path("a.txt"))
+
+
+def test_read_records_jsonl() -> None:
+    stream = io.StringIO('{"path": "a"}\n\n{"path": "b", "TITLE": null}\n')
+    assert list(read_records(stream, "jsonl")) == [
+        (1, {"path": "a"}),
+        (3, {"path": "b", "TITLE": None}),
+    ]
+
+
+@pytest.mark.parametrize("text", ["{", "[1, 2]"])
+def test_read_records_jsonl_invalid(text: str) -> None:
+    with pytest.raises(InvalidRecordError, match="Line 1"):
+        list(read_records(io.StringIO(text), "jsonl"))
+
+
+def test_read_records_csv() -> None:
+    stream = io.StringIO('path,TITLE\na,"t, t"\nb\n')
+    assert list(read_records(stream, "csv")) == [
+        (2, {"path": "a", "TITLE": "t, t"}),
+        (3, {"path": "b", "TITLE": ""}),
+    ]
+
+
+def test_read_records_csv_invalid() -> None:
+    with pytest.raises(InvalidRecordError, match="Line 2"):
+        list(read_records(io.StringIO("path\na,b\n"), "csv"))
+
+
+def test_plan_of() -> None:
+    path, plan = plan_of(
+        {
+            "path": "a.opus",
+            "artist": "x//y",
+            "GENRE": ["a//b", "c"],
+            "TITLE": ["t"],
+            "TRACKNUMBER": "3",
+            "DATE": 2000,
+            "ALBUM": "",
+            "DISCNUMBER": None,
+        }
+    )
+    assert path == Path("a.opus")
+    assert plan.set_values == {
+        Tag.ARTIST: ["x", "y"],
+        Tag.GENRE: ["a//b", "c"],
+        Tag.TITLE: ["t"],
+        Tag.TRACKNUMBER: ["3"],
+        Tag.DATE: ["2000"],
+    }
+    assert plan.remove == {Tag.DISCNUMBER}
+
+
+@pytest.mark.parametrize(
+    "record",
+    [
+        {"TITLE": "t"},
+        {"path": "a", "COMMENT": "c"},
+        {"path": "a", "title": "t", "TITLE": "t"},
+        {"path": "a", "TITLE": ["a", "b"]},
+        {"path": "a", "TITLE": []},
+        {"path": "a", "TITLE": 1},
+        {"path": "a", "ARTIST": ["a", ""]},
+        {"path": "a", "TRACKNUMBER": "one"},
+        {"path": "a", "TRACKNUMBER": 0},
+        {"path": "a", "TRACKNUMBER": True},
+    ],
+)
+def test_plan_of_invalid(record: Record) -> None:
+    with pytest.raises(ValueError):
+        plan_of(record)
+
+
+def test_read_plans_invalid_list() -> None:
+    stream = io.StringIO('{"path": "a"}\n{"path": "b", "ARTIST": "a////b"}\n')
+    with pytest.raises(InvalidRecordError, match="Line 2"):
+        list(read_plans(stream, "jsonl"))
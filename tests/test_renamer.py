@@ -0,0 +1,288 @@
+from __future__ import annotations
+import errno
+import os
+from pathlib import Path
+import pytest
+from audiotag.renamer import (
+    Journal,
+    JournalLock,
+    RenameInterruptedError,
+    RenameLockedError,
+    RenamePlan,
+    move,
+)
+
+
+def _files(directory: Path, names: list[str]) -> dict[str, str]:
+    """Creates files whose content is their name and returns them"""
+    for name in names:
+        (directory / name).write_text(name)
+    return _contents(directory)
+
+
+def _contents(directory: Path) -> dict[str, str]:
+    return {path.name: path.read_text() for path in directory.iterdir()}
+
+
+def _never(path: Path) -> bool:
+    raise AssertionError(f"Asked to overwrite '{path}'")
+
+
+def test_plan_chain(tmp_path: Path) -> None:
+    _files(tmp_path, ["1", "2", "3"])
+    renames = [(tmp_path / "1", tmp_path / "2"), (tmp_path / "2", tmp_path / "3")]
+    plan = RenamePlan(renames, overwrite=lambda path: True)
+    # 3 is not part of the plan, so it is moved aside and deleted at the end
+    assert len(plan.displaced) == 1
+    plan.execute(tmp_path / "journal")
+    assert _contents(tmp_path) == {"2": "1", "3": "2"}
+    assert (plan.renamed, plan.skipped) == (2, 0)
+
+
+@pytest.mark.parametrize("size", [2, 3, 10])
+def test_plan_cycle(tmp_path: Path, size: int) -> None:
+    names = [f"{i:02}" for i in range(size)]
+    _files(tmp_path, names)
+    renames = [
+        (tmp_path / name, tmp_path / names[(i + 1) % size])
+        for i, name in enumerate(names)
+    ]
+    plan = RenamePlan(renames, overwrite=_never)
+    assert not plan.displaced
+    assert len(plan.steps) == size + 1
+    plan.execute(tmp_path / "journal")
+    assert _contents(tmp_path) == {
+        names[(i + 1) % size]: name for i, name in enumerate(names)
+    }
+    assert plan.renamed == size
+
+
+def test_plan_collision(tmp_path: Path, capsys) -> None:
+    _files(tmp_path, ["a", "b", "c"])
+    renames = [
+        (tmp_path / "a", tmp_path / "x"),
+        (tmp_path / "b", tmp_path / "x"),
+        # c can not be renamed to a as a stays in place
+        (tmp_path / "c", tmp_path / "a"),
+    ]
+    plan = RenamePlan(renames, overwrite=_never)
+    assert not plan.steps
+    assert (plan.renamed, plan.skipped) == (0, 3)
+    stdout = capsys.readouterr().out
+    assert "would all be renamed to" in stdout
+    assert "because that file is not renamed" in stdout
+
+
+def test_plan_declined_overwrite(tmp_path: Path) -> None:
+    _files(tmp_path, ["a", "b", "c"])
+    renames = [(tmp_path / "a", tmp_path / "b"), (tmp_path / "b", tmp_path / "c")]
+    asked: list[Path] = []
+
+    def _decline(path: Path) -> bool:
+        asked.append(path)
+        return False
+
+    plan = RenamePlan(renames, overwrite=_decline)
+    plan.execute(tmp_path / "journal")
+    assert asked == [tmp_path / "c"]
+    assert _contents(tmp_path) == {"a": "a", "b": "b", "c": "c"}
+    assert (plan.renamed, plan.skipped) == (0, 2)
+
+
+def test_plan_unchanged(tmp_path: Path) -> None:
+    _files(tmp_path, ["a"])
+    plan = RenamePlan([(tmp_path / "a", tmp_path / "a")], overwrite=_never)
+    plan.execute(tmp_path / "journal")
+    assert not plan.steps
+    assert not (tmp_path / "journal").exists()
+
+
+def _interrupted(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Starts swapping a and b and fails on the last step"""
+    directory = tmp_path / "files"
+    directory.mkdir()
+    _files(directory, ["a", "b"])
+    plan = RenamePlan(
+        [(directory / "a", directory / "b"), (directory / "b", directory / "a")],
+        overwrite=_never,
+    )
+    journal = tmp_path / "journal"
+    real_rename = os.rename
+    calls: list[int] = []
+
+    def _rename(src, dst):
+        calls.append(1)
+        if len(calls) == 3:
+            raise PermissionError("nope")
+        real_rename(src, dst)
+
+    monkeypatch.setattr("audiotag.renamer.os.rename", _rename)
+    with pytest.raises(RenameInterruptedError):
+        plan.execute(journal)
+    monkeypatch.undo()
+    assert journal.exists()
+    return directory
+
+
+def test_journal_resume(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    directory = _interrupted(tmp_path, monkeypatch)
+    journal = Journal.load(tmp_path / "journal")
+    assert journal.done == {0, 1}
+    journal.resume()
+    assert _contents(directory) == {"a": "b", "b": "a"}
+    assert not (tmp_path / "journal").exists()
+
+
+def test_journal_rollback(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    directory = _interrupted(tmp_path, monkeypatch)
+    Journal.load(tmp_path / "journal").rollback()
+    assert _contents(directory) == {"a": "a", "b": "b"}
+    assert not (tmp_path / "journal").exists()
+
+
+def test_journal_unlogged_step(tmp_path: Path) -> None:
+    _files(tmp_path, ["a"])
+    journal = Journal(tmp_path / "journal", [(tmp_path / "a", tmp_path / "b")], [])
+    journal.begin()
+    # The file was renamed, but the run was interrupted before it was logged
+    (tmp_path / "a").rename(tmp_path / "b")
+    Journal.load(tmp_path / "journal").resume()
+    assert _contents(tmp_path) == {"b": "a"}
+
+
+def test_journal_synced(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    _files(tmp_path, ["a", "b"])
+    plan = RenamePlan([(tmp_path / "a", tmp_path / "b")], overwrite=lambda path: True)
+    events: list[str] = []
+    real_fsync = os.fsync
+    real_rename = os.rename
+
+    def _fsync(fd: int) -> None:
+        events.append("fsync")
+        real_fsync(fd)
+
+    def _rename(src: Path, dst: Path) -> None:
+        events.append("rename")
+        real_rename(src, dst)
+
+    monkeypatch.setattr("audiotag.renamer.os.fsync", _fsync)
+    monkeypatch.setattr("audiotag.renamer.os.rename", _rename)
+    plan.execute(tmp_path / "journal")
+    # Every wave of renames is only started once the journal is on disk
+    assert events[0] == "fsync"
+    for index, event in enumerate(events):
+        if event == "rename":
+            assert events[index - 1] == "fsync"
+
+
+def test_journal_lock(tmp_path: Path) -> None:
+    journal = tmp_path / "journal"
+    with JournalLock(journal):
+        with pytest.raises(RenameLockedError):
+            JournalLock(journal).acquire()
+    with JournalLock(journal):
+        pass
+
+
+def test_journal_incomplete_plan(tmp_path: Path) -> None:
+    path = tmp_path / "journal"
+    path.write_text('{"move": ["a", "b"]}\n{"move": ["c"')
+    journal = Journal.load(path)
+    assert not journal.steps
+    journal.rollback()
+    assert not path.exists()
+
+
+def test_plan_directories(tmp_path: Path) -> None:
+    music = tmp_path / "music"
+    for artist, name in [("Old", "1"), ("Older", "2")]:
+        (music / artist / "Album").mkdir(parents=True)
+        _files(music / artist / "Album", [name])
+    (music / "Other").mkdir()
+    renames = [
+        (music / "Old" / "Album" / "1", music / "A" / "L" / "1"),
+        (music / "Older" / "Album" / "2", music / "A" / "M" / "2"),
+    ]
+    plan = RenamePlan(renames, overwrite=_never)
+    assert plan.directories == [
+        music / "A",
+        music / "A" / "L",
+        music / "A" / "M",
+    ]
+    plan.execute(tmp_path / "journal", jobs=2)
+    assert (music / "A" / "L" / "1").read_text() == "1"
+    assert (music / "A" / "M" / "2").read_text() == "2"
+    # The emptied directories are removed up to the directory that contains
+    # all of them
+    assert sorted(path.name for path in music.iterdir()) == ["A", "Other"]
+
+
+def test_plan_directories_outside(tmp_path: Path) -> None:
+    music = tmp_path / "music"
+    for artist in ["Old", "Older"]:
+        (music / artist / "Album").mkdir(parents=True)
+        _files(music / artist / "Album", [artist])
+    renames = [
+        (music / "Old" / "Album" / "Old", tmp_path / "out" / "Old"),
+        (music / "Older" / "Album" / "Older", tmp_path / "out" / "Older"),
+    ]
+    RenamePlan(renames, overwrite=_never).execute(tmp_path / "journal")
+    # New names outside of the directory with the files do not allow removing
+    # it, even though it is empty now
+    assert music.is_dir()
+    assert list(music.iterdir()) == []
+
+
+def test_rollback_directories(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    _files(tmp_path, ["1", "2"])
+    renames = [
+        (tmp_path / "1", tmp_path / "A" / "1"),
+        (tmp_path / "2", tmp_path / "A" / "2"),
+    ]
+    plan = RenamePlan(renames, overwrite=_never)
+    real_rename = os.rename
+
+    def _rename(src, dst):
+        if Path(src).name == "2":
+            raise PermissionError("nope")
+        real_rename(src, dst)
+
+    monkeypatch.setattr("audiotag.renamer.os.rename", _rename)
+    with pytest.raises(RenameInterruptedError):
+        plan.execute(tmp_path / "journal")
+    monkeypatch.undo()
+    assert (tmp_path / "A" / "1").is_file()
+    Journal.load(tmp_path / "journal").rollback()
+    assert _contents(tmp_path) == {"1": "1", "2": "2"}
+
+
+def test_move_across_filesystems(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    _files(tmp_path, ["1"])
+    os.utime(tmp_path / "1", (0, 1000))
+
+    def _rename(src, dst):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr("audiotag.renamer.os.rename", _rename)
+    move(tmp_path / "1", tmp_path / "2")
+    assert _contents(tmp_path) == {"2": "1"}
+    assert os.stat(tmp_path / "2").st_mtime == 1000
+
+
+def test_move_across_filesystems_failed(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    _files(tmp_path, ["1"])
+
+    def _rename(src, dst):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    def _copystat(src, dst):
+        raise PermissionError("nope")
+
+    monkeypatch.setattr("audiotag.renamer.os.rename", _rename)
+    monkeypatch.setattr("audiotag.renamer.shutil.copystat", _copystat)
+    with pytest.raises(PermissionError):
+        move(tmp_path / "1", tmp_path / "2")
+    # Neither the original nor a partial copy is left behind
+    assert _contents(tmp_path) == {"1": "1"}
@@ -0,0 +1,78 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from pathlib import Path
+import socket
+import threading
+import pytest
+from audiotag import cache
+from audiotag.audiotag import main
+from audiotag.server import Server, request
+
+if TYPE_CHECKING:
+    from typing import Iterator
+    from audiotag.track import Track
+
+
+@pytest.fixture(scope="function", name="server")
+def fixture_server(tmp_path: Path) -> Iterator[Server]:
+    server = Server(tmp_path / "server.sock", cache_size=16)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.close()
+    thread.join(timeout=10)
+    cache.enable_memory(None)
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_request(audio_file: Track, server: Server, capfd) -> None:
+    audio_file.close()
+    argv = ["--no-cache", "print", "--format", "jsonl", "--fields", "path,title"]
+    assert request(server.path, [*argv, str(audio_file.path)]) == 0
+    stdout, _ = capfd.readouterr()
+    assert stdout == f'{{"path": "{audio_file.path}", "TITLE": ["title"]}}\n'
+
+    # Relative paths are relative to the working directory of the client
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(audio_file.path.parent)
+        assert request(server.path, [*argv, audio_file.path.name]) == 0
+    stdout, _ = capfd.readouterr()
+    assert stdout.startswith(f'{{"path": "{audio_file.path.name}"')
+
+    assert request(server.path, ["interactive", str(audio_file.path)]) == 2
+    assert request(server.path, ["print"]) == 2
+    _, stderr = capfd.readouterr()
+    assert "interactive can not be run with --client" in stderr
+
+
+def test_no_server(tmp_path: Path) -> None:
+    assert request(tmp_path / "missing.sock", ["print", "a.opus"]) is None
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_client_fallback(audio_file: Track, tmp_path: Path, capfd) -> None:
+    audio_file.close()
+    error_code = main(
+        [f"--client={tmp_path / 'missing.sock'}", "--no-cache", "print"]
+        + ["--format", "jsonl", "--fields", "title", str(audio_file.path)]
+    )
+    stdout, _ = capfd.readouterr()
+    assert not error_code
+    assert stdout == f'{{"path": "{audio_file.path}", "TITLE": ["title"]}}\n'
+
+
+def test_server_running(server: Server) -> None:
+    with pytest.raises(FileExistsError):
+        Server(server.path, cache_size=16)
+
+
+def test_stale_socket(tmp_path: Path) -> None:
+    path = tmp_path / "stale.sock"
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(path))
+    stale.close()
+    server = Server(path, cache_size=None)
+    server.close()
+    server.serve_forever()
+    assert not path.exists()
+    cache.enable_memory(None)
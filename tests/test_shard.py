@@ -0,0 +1,42 @@
+from __future__ import annotations
+from pathlib import Path
+import pytest
+from audiotag.shard import Shard
+
+
+@pytest.mark.parametrize("text", ["0/4", "5/4", "1/0", "1", "a/b", "1/4/2"])
+def test_parse_invalid(text: str) -> None:
+    with pytest.raises(ValueError):
+        Shard.parse(text)
+
+
+def test_parse() -> None:
+    assert Shard.parse("2/4") == (2, 4)
+
+
+def test_partition(tmp_path: Path) -> None:
+    paths = [tmp_path / f"dir{i % 3}" / f"{i}.opus" for i in range(200)]
+    shards = [Shard(index, 4, root=tmp_path) for index in range(1, 5)]
+    selected = [list(shard.select(paths)) for shard in shards]
+    assert sorted(p for s in selected for p in s) == sorted(paths)
+    assert all(selected)
+
+    # Only the path relative to the root counts
+    other_root = tmp_path / "elsewhere"
+    moved = [other_root / path.relative_to(tmp_path) for path in paths]
+    assert list(Shard(1, 4, root=other_root).select(moved)) == [
+        other_root / path.relative_to(tmp_path) for path in selected[0]
+    ]
+
+
+def test_select_key(tmp_path: Path) -> None:
+    shard = Shard(1, 2, root=tmp_path)
+    pairs = [(tmp_path / "a", tmp_path / f"{i}") for i in range(20)]
+    selected = list(shard.select(pairs, key=lambda pair: pair[1]))
+    assert selected == [pair for pair in pairs if shard.contains(pair[1])]
+
+
+def test_report_path() -> None:
+    assert Shard(2, 3).report_path(Path("out/failed.jsonl")) == Path(
+        "out/failed.shard-2-of-3.jsonl"
+    )
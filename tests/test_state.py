@@ -0,0 +1,42 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from pathlib import Path
+import os
+import pytest
+from audiotag.state import StateFile
+
+if TYPE_CHECKING:
+    from audiotag.track import Track
+
+
+def test_operation_of() -> None:
+    assert StateFile.operation_of({"keep": {"B", "A"}}) == StateFile.operation_of(
+        {"keep": ["A", "B"]}
+    )
+    assert StateFile.operation_of({"keep": None}) != StateFile.operation_of(
+        {"keep": []}
+    )
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_changed(audio_file: Track, state_dir: Path) -> None:
+    audio_file.close()
+    path = audio_file.path
+    missing = path.with_name("missing.opus")
+    state = StateFile(state_dir / "test.sqlite", {"keep": None})
+    assert list(state.changed([path, missing])) == [path, missing]
+    state.put(path, os.stat(path))
+    assert list(state.changed([path, missing])) == [missing]
+    assert (state.changed_files, state.unchanged) == (3, 1)
+    state.close()
+
+    # Other parameters and modified files are not unchanged
+    other = StateFile(state_dir / "test.sqlite", {"keep": ["ENCODER"]})
+    assert list(other.changed([path])) == [path]
+    other.close()
+    state = StateFile(state_dir / "test.sqlite", {"keep": None})
+    assert list(state.changed([path])) == []
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert list(state.changed([path])) == [path]
+    state.close()
@@ -4,7 +4,7 @@ import shutil
 import pytest
 from audiotag import config
 from conftest import FakeTag
-from audiotag.track import TagListInvalidException, Track, Tag
+from audiotag.track import TagListInvalidException, TagPlan, TagView, Track, Tag
 
 
 @pytest.mark.usefixtures("audio_file")
@@ -271,3 +271,98 @@ def test_format_filename(
     audio_file.tracktotal = tracktotal
     assert audio_file.format_filename(pattern) == expected
     audio_file.close()
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_save_unmodified(audio_file: Track):
+    audio_file.close()
+    track = Track(audio_file.path)
+    mtime = audio_file.path.stat().st_mtime_ns
+    assert not track.is_modified()
+    assert not track.set_tags({Tag.TITLE: FakeTag.TITLE.value})
+    track.clear_tags(keep={tag for tag in Tag})
+    assert not track.save()
+    track.title = "other"
+    assert track.is_modified()
+    track.title = FakeTag.TITLE.value
+    assert not track.save()
+    track.close()
+    assert audio_file.path.stat().st_mtime_ns == mtime
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_save_modified(audio_file: Track):
+    assert audio_file.remove_tags({Tag.TITLE})
+    assert not audio_file.remove_tags({Tag.TITLE})
+    assert audio_file.is_modified()
+    assert audio_file.save()
+    assert not audio_file.is_modified()
+    assert not audio_file.save()
+    audio_file.close()
+
+
+def test_close(audio_file: Track):
+    audio_file.title = "other"
+    assert audio_file.save()
+    audio_file.close()
+    # Tags can still be read after the file is closed and closing it again
+    # does nothing
+    assert audio_file.title == "other"
+    audio_file.close()
+    audio_file.title = "again"
+    assert audio_file.save()
+    audio_file.close()
+    assert Track(audio_file.path).title == "again"
+
+
+def test_tag_plan():
+    plan = TagPlan(
+        set_tags={Tag.ARTIST: "a//b", Tag.TITLE: "a//b", Tag.DATE: 2000},
+        remove_tags={Tag.GENRE},
+    )
+    assert plan.set_values == {
+        Tag.ARTIST: ["a", "b"],
+        Tag.TITLE: ["a//b"],
+        Tag.DATE: ["2000"],
+    }
+    assert plan.remove == {Tag.GENRE}
+
+
+@pytest.mark.parametrize(
+    "set_tags,remove_tags,exception",
+    [
+        ({Tag.GENRE: "a////b"}, set(), TagListInvalidException),
+        ({Tag.TITLE: "a"}, {Tag.TITLE}, ValueError),
+    ],
+)
+def test_tag_plan_invalid(
+    set_tags: dict[Tag, str | int], remove_tags: set[Tag], exception: type
+):
+    with pytest.raises(exception):
+        TagPlan(set_tags=set_tags, remove_tags=remove_tags)
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_tag_plan_apply(audio_file: Track):
+    plan = TagPlan(set_tags={Tag.GENRE: "a//b"}, remove_tags={Tag.TITLE})
+    assert plan.apply(audio_file)
+    assert audio_file.genre == ["a", "b"]
+    assert not audio_file.has_tag(Tag.TITLE)
+    assert not plan.apply(audio_file)
+    audio_file.close()
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_tag_view(audio_file: Track):
+    view = audio_file.tag_view
+    assert isinstance(view, TagView)
+    assert audio_file.tag_view is view
+    assert not hasattr(view, "__dict__")
+    assert view.title == FakeTag.TITLE.value
+    assert view.tracknumber == FakeTag.TRACKNUMBER.value
+    audio_file.title = "changed"
+    assert audio_file.tag_view is not view
+    assert audio_file.title == "changed"
+    audio_file.set_tags({Tag.DISCTOTAL: "many"})
+    assert audio_file.disctotal == 0
+    audio_file.close()
@@ -1,6 +1,8 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
 from pathlib import Path
+import os
+import shutil
 import pytest
 from audiotag import util
 
@@ -36,3 +38,63 @@ def test_strings_to_paths() -> None:
     strings = ["test1", "test2", "test3"]
     paths = util.strings_to_paths(strings)
     assert strings == [path.name for path in paths]
+
+
+@pytest.mark.usefixtures("audio_file")
+def test_walk_files(audio_file: Track) -> None:
+    audio_file.close()
+    root = audio_file.path.parent
+    (root / "b" / "c").mkdir(parents=True)
+    (root / "a").mkdir()
+    shutil.copyfile(audio_file.path, root / "b" / "c" / "3.opus")
+    shutil.copyfile(audio_file.path, root / "b" / "2.OPUS")
+    shutil.copyfile(audio_file.path, root / "a" / "1.opus")
+    (root / "a" / "cover.jpg").touch()
+    os.link(root / "a" / "1.opus", root / "b" / "hardlink.opus")
+    files = util.walk_files(root)
+    assert not isinstance(files, list)
+    assert list(files) == [
+        audio_file.path,
+        root / "a" / "1.opus",
+        root / "b" / "2.OPUS",
+        root / "b" / "c" / "3.opus",
+    ]
+    assert list(util.walk_files(root, extensions={".jpg"})) == [
+        root / "a" / "cover.jpg"
+    ]
+
+
+def test_walk_files_error() -> None:
+    with pytest.raises(util.NoSuchDirectoryError):
+        list(util.walk_files(Path("DOES_DEFINITELY_NOT_EXIST")))
+
+
+@pytest.mark.usefixtures("mixed_dir")
+def test_collect_paths(mixed_dir: Path) -> None:
+    assert list(util.collect_paths([str(mixed_dir)])) == [mixed_dir]
+    assert list(util.collect_paths([str(mixed_dir)], recursive=True)) == [
+        mixed_dir / "noise.opus"
+    ]
+
+
+@pytest.mark.parametrize(
+    "content,null,expected",
+    [
+        (b"a.opus\nb c.opus\n", False, ["a.opus", "b c.opus"]),
+        (b"a.opus\n\nb.opus", False, ["a.opus", "b.opus"]),
+        (b"a\nb.opus\0c.opus\0", True, ["a\nb.opus", "c.opus"]),
+        (b"\xff.opus\0", True, [os.fsdecode(b"\xff.opus")]),
+    ],
+)
+def test_read_file_list(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    content: bytes,
+    null: bool,
+    expected: list[str],
+):
+    # Names span several blocks
+    monkeypatch.setattr("audiotag.util.READ_SIZE", 3)
+    file_list = tmp_path / "files"
+    file_list.write_bytes(content)
+    assert list(util.read_file_list(str(file_list), null=null)) == expected
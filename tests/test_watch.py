@@ -0,0 +1,193 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import os
+from pathlib import Path
+import shutil
+import sys
+import pytest
+from audiotag.track import Tag, Track
+from audiotag.util import NoSuchDirectoryError
+from audiotag.watch import (
+    Debouncer,
+    InotifyWatcher,
+    PollingWatcher,
+    Rules,
+    open_watcher,
+    _EVENT,
+    _IN_Q_OVERFLOW,
+)
+from conftest import FakeTag
+
+if TYPE_CHECKING:
+    from typing import Iterator
+
+
+@pytest.fixture(scope="function", name="rules_file")
+def fixture_rules_file(tmp_path: Path) -> Path:
+    rules_file = tmp_path / "rules.ini"
+    rules_file.write_text(
+        "[clean]\nkeep = TITLE, TRACKNUMBER, TRACKTOTAL\n"
+        + "[set]\ngenre = Jazz\nDATE = 1970\n"
+        + "[rename]\npattern = {G}/{N} - {T}\n"
+    )
+    return rules_file
+
+
+@pytest.fixture(scope="function", name="drop_dir")
+def fixture_drop_dir(tmp_path: Path) -> Path:
+    drop_dir = tmp_path / "drop"
+    drop_dir.mkdir()
+    return drop_dir
+
+
+@pytest.fixture(scope="function", name="inotify")
+def fixture_inotify(drop_dir: Path) -> Iterator[InotifyWatcher]:
+    if not sys.platform.startswith("linux"):
+        pytest.skip("inotify is only available on Linux")
+    watcher = InotifyWatcher(drop_dir)
+    yield watcher
+    watcher.close()
+
+
+def test_rules(audio_file: Track, rules_file: Path) -> None:
+    rules = Rules(rules_file)
+    assert rules.keep == {Tag.TITLE, Tag.TRACKNUMBER, Tag.TRACKTOTAL}
+    assert not rules.overwrite
+    assert rules.apply(audio_file) == (
+        True,
+        audio_file.path.parent / "Jazz" / f"{FakeTag.TRACKNUMBER.value} - title.opus",
+    )
+    audio_file.close()
+    assert Track(audio_file.path).tags == {
+        Tag.DATE.value: ["1970"],
+        Tag.GENRE.value: ["Jazz"],
+        Tag.TITLE.value: [FakeTag.TITLE.value],
+        Tag.TRACKNUMBER.value: [str(FakeTag.TRACKNUMBER.value)],
+        Tag.TRACKTOTAL.value: [str(FakeTag.TRACKTOTAL.value)],
+    }
+
+
+def test_rules_remove(audio_file: Track, tmp_path: Path) -> None:
+    rules_file = tmp_path / "rules.ini"
+    rules_file.write_text("[set]\nGENRE\n")
+    assert Rules(rules_file).apply(audio_file) == (True, None)
+    assert not audio_file.has_tag(Tag.GENRE)
+    assert audio_file.title == FakeTag.TITLE.value
+
+
+def test_rules_rename_fails(audio_file: Track, rules_file: Path) -> None:
+    # The file is not written if the new name can not be formatted
+    audio_file.remove_tags({Tag.TRACKNUMBER})
+    audio_file.save()
+    audio_file.close()
+    with Track(audio_file.path) as track, pytest.raises(ValueError):
+        Rules(rules_file).apply(track)
+    assert Track(audio_file.path).genre == FakeTag.GENRE.value
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "[unknown]\n",
+        "[clean]\nkeep = NOTATAG\n",
+        "[clean]\nkept = TITLE\n",
+        "[set]\nDATE = never\n",
+        "[set]\nNOTATAG = 1\n",
+        "[rename]\npattern = {X}\n",
+        "[rename]\noverwrite = maybe\n",
+        "keep = TITLE\n",
+    ],
+)
+def test_rules_invalid(tmp_path: Path, text: str) -> None:
+    rules_file = tmp_path / "rules.ini"
+    rules_file.write_text(text)
+    with pytest.raises(ValueError):
+        Rules(rules_file)
+
+
+def test_debouncer(audio_file: Track) -> None:
+    audio_file.close()
+    path = audio_file.path
+    debouncer = Debouncer(settle=2)
+    assert debouncer.timeout(now=0) is None
+    debouncer.touch([path], now=10)
+    assert debouncer.timeout(now=11) == 1
+    assert debouncer.ready(now=11) == []
+    # The file is held back again if it changed without an event
+    with open(path, "ab") as stream:
+        stream.write(b"\0")
+    assert debouncer.ready(now=12) == []
+    assert len(debouncer) == 1
+    assert debouncer.ready(now=14) == [path]
+    assert len(debouncer) == 0
+    # Events caused by processing the file are left out
+    debouncer.done(path)
+    debouncer.touch([path, path.with_name("gone.opus")], now=20)
+    assert debouncer.ready(now=30) == []
+    os.utime(path, ns=(0, 0))
+    debouncer.touch([path], now=40)
+    assert debouncer.ready(now=50) == [path]
+
+
+def test_polling_watcher(audio_file: Track, drop_dir: Path) -> None:
+    audio_file.close()
+    existing = drop_dir / "existing.opus"
+    shutil.copyfile(audio_file.path, existing)
+    watcher = PollingWatcher(drop_dir, interval=0.01)
+    assert watcher.wait() == []
+    (drop_dir / "sub").mkdir()
+    shutil.copyfile(audio_file.path, drop_dir / "sub" / "new.opus")
+    (drop_dir / "cover.jpg").write_bytes(b"")
+    assert watcher.wait() == [drop_dir / "sub" / "new.opus"]
+    assert watcher.wait(timeout=0) == []
+    os.utime(existing, ns=(0, 0))
+    assert watcher.wait() == [existing]
+    watcher.close()
+
+
+def test_inotify_watcher(
+    audio_file: Track, tmp_path: Path, drop_dir: Path, inotify: InotifyWatcher
+) -> None:
+    audio_file.close()
+    assert inotify.wait(timeout=0) == []
+    written = drop_dir / "written.opus"
+    shutil.copyfile(audio_file.path, written)
+    (drop_dir / "cover.jpg").write_bytes(b"")
+    assert inotify.wait(timeout=1) == [written]
+    # Files in directories that are moved in are found and the directories
+    # are watched
+    album = tmp_path / "album"
+    album.mkdir()
+    shutil.copyfile(audio_file.path, album / "1.opus")
+    album.rename(drop_dir / "album")
+    assert inotify.wait(timeout=1) == [drop_dir / "album" / "1.opus"]
+    os.rename(written, drop_dir / "album" / "2.opus")
+    assert inotify.wait(timeout=1) == [drop_dir / "album" / "2.opus"]
+
+
+def test_inotify_watcher_overflow(
+    audio_file: Track,
+    drop_dir: Path,
+    inotify: InotifyWatcher,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    audio_file.close()
+    written = drop_dir / "written.opus"
+    shutil.copyfile(audio_file.path, written)
+    overflow = _EVENT.pack(-1, _IN_Q_OVERFLOW, 0, 0)
+    monkeypatch.setattr("audiotag.watch.os.read", lambda fd, size: overflow)
+    # All files are checked again if events were lost
+    assert inotify.wait(timeout=1) == [written]
+    assert inotify.events_lost
+    monkeypatch.undo()
+    assert inotify.wait(timeout=1) == [written]
+    assert not inotify.events_lost
+
+
+def test_open_watcher(drop_dir: Path) -> None:
+    watcher = open_watcher(drop_dir, poll=True, interval=5)
+    assert isinstance(watcher, PollingWatcher)
+    assert watcher.interval == 5
+    with pytest.raises(NoSuchDirectoryError):
+        open_watcher(drop_dir / "missing")